@@ -1,31 +1,62 @@
+import io
+import os
+import sys
+
 import streamlit as st
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 
-# Función para calcular proyección de ahorro
-def calcular_futuro(ahorro_mensual, años, rendimiento_anual, inflacion_anual):
-    meses = años * 12
-    rendimiento_mensual = (1 + rendimiento_anual/100) ** (1/12) - 1
-    inflacion_mensual = (1 + inflacion_anual/100) ** (1/12) - 1
-    total = 0
-    datos = []
-    
-    for mes in range(1, meses + 1):
-        total += ahorro_mensual
-        rendimiento = total * rendimiento_mensual
-        inflacion = total * inflacion_mensual
-        total += rendimiento - inflacion
-        if mes % 12 == 0:
-            datos.append({
-                "Año": mes // 12,
-                "Total": round(total, 2),
-                "Ahorro Acumulado": ahorro_mensual * mes,
-                "Rendimiento": round(rendimiento * 12, 2),
-                "Inflación": round(inflacion * 12, 2)
-            })
-    
-    return pd.DataFrame(datos)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "src"))
+
+from montecarlo import monthly_returns_from_prices, project_retirement  # noqa: E402
+from price_store import PriceStore  # noqa: E402
+
+BENCHMARK_TICKER = "MXWD INDEX"
+
+
+@st.cache_data(show_spinner=False)
+def historial_mensual(ticker):
+    """Retornos mensuales históricos de un ticker de precios.xlsx."""
+    prices = PriceStore(os.path.join(BASE_DIR, "src", "data", "precios.xlsx"))
+    return monthly_returns_from_prices(prices, ticker)
+
+
+# Función para calcular proyección de ahorro (Monte Carlo)
+@st.cache_data(show_spinner="Simulando escenarios...")
+def calcular_futuro(ahorro_mensual, años, rendimiento_anual, inflacion_anual, volatilidad_anual,
+                    meta, simulaciones, usar_historial, paralelo=False, semilla=42):
+    history = historial_mensual(BENCHMARK_TICKER) if usar_historial else None
+    resultado = project_retirement(
+        ahorro_mensual, años,
+        annual_return=rendimiento_anual,
+        annual_inflation=inflacion_anual,
+        annual_volatility=volatilidad_anual,
+        n_paths=simulaciones,
+        history=history,
+        goal=meta,
+        seed=semilla,
+        workers=os.cpu_count() if paralelo else None,
+    )
+    return resultado.bands(), resultado.goal_probability()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def grafico_patrimonio(df, meta):
+    """PNG del gráfico de percentiles: se dibuja una sola vez por proyección y meta."""
+    fig, ax = plt.subplots()
+    ax.fill_between(df["Año"], df["P5"], df["P95"], alpha=0.2, label="Rango 5%-95%")
+    ax.fill_between(df["Año"], df["P25"], df["P75"], alpha=0.4, label="Rango 25%-75%")
+    ax.plot(df["Año"], df["P50"], label="Mediana (ajustada por inflación)")
+    ax.plot(df["Año"], df["Ahorro Acumulado"], label="Ahorro acumulado", linestyle="--")
+    if meta:
+        ax.axhline(meta, color="gray", linestyle=":", label="Meta")
+    ax.set_xlabel("Años")
+    ax.set_ylabel("Monto ($)")
+    ax.legend()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=120, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
 
 # Configuración de la página
 st.set_page_config(page_title="Simulador de Retiro", layout="wide")
@@ -38,42 +69,48 @@ with st.sidebar:
     edad_retiro = st.number_input("Edad de retiro", min_value=edad_actual+1, max_value=100, value=65)
     ahorro_mensual = st.number_input("Ahorro mensual ($)", min_value=100, value=500)
     riesgo = st.selectbox("Tolerancia al riesgo", ["Conservador", "Moderado", "Agresivo"])
-    
+
     # Parámetros según riesgo
     if riesgo == "Conservador":
-        rendimiento, inflacion = 5.0, 3.0
+        rendimiento, inflacion, volatilidad = 5.0, 3.0, 6.0
     elif riesgo == "Moderado":
-        rendimiento, inflacion = 7.0, 3.5
+        rendimiento, inflacion, volatilidad = 7.0, 3.5, 10.0
     else:
-        rendimiento, inflacion = 9.0, 4.0
+        rendimiento, inflacion, volatilidad = 9.0, 4.0, 16.0
 
     st.markdown(f"**Rendimiento anual estimado:** {rendimiento}%")
+    st.markdown(f"**Volatilidad anual estimada:** {volatilidad}%")
     st.markdown(f"**Inflación anual estimada:** {inflacion}%")
 
+    st.header("Simulación")
+    meta = st.number_input("Meta de patrimonio ($)", min_value=0, value=300000, step=10000)
+    simulaciones = st.select_slider("Número de escenarios", options=[10_000, 25_000, 50_000, 100_000], value=25_000)
+    modelo = st.radio("Modelo de retornos", ["Lognormal", f"Histórico ({BENCHMARK_TICKER})"])
+    if modelo != "Lognormal":
+        st.caption(f"El modelo histórico remuestrea los retornos mensuales de {BENCHMARK_TICKER}: el rendimiento "
+                   f"y la volatilidad del perfil {riesgo.lower()} no se usan (la inflación sí).")
+    paralelo = st.checkbox("Simular en paralelo (varios procesos)", value=False)
+
 # Calcular proyección
 años = edad_retiro - edad_actual
-df = calcular_futuro(ahorro_mensual, años, rendimiento, inflacion)
+df, probabilidad_meta = calcular_futuro(ahorro_mensual, años, rendimiento, inflacion, volatilidad,
+                                        meta, simulaciones, modelo != "Lognormal", paralelo)
 
 # Mostrar resultados
 col1, col2 = st.columns(2)
 with col1:
-    st.subheader("Proyección de Retiro")
-    st.dataframe(df.style.highlight_max(axis=0, color="#90EE90"), height=300)
-    
+    st.subheader("Proyección de Retiro (percentiles)")
+    st.dataframe(df.round(2), height=300)
+
 with col2:
     st.subheader("Evolución del Patrimonio")
-    fig, ax = plt.subplots()
-    ax.plot(df["Año"], df["Total"], label="Total (ajustado por inflación)", marker="o")
-    ax.plot(df["Año"], df["Ahorro Acumulado"], label="Ahorro acumulado", linestyle="--")
-    ax.set_xlabel("Años")
-    ax.set_ylabel("Monto ($)")
-    ax.legend()
-    st.pyplot(fig)
+    st.image(grafico_patrimonio(df, meta), use_container_width=True)
 
 # Recomendación final
-total_final = df["Total"].iloc[-1] if not df.empty else 0
+total_final = df["P50"].iloc[-1] if not df.empty else 0
 st.success(f"""
 **Recomendación:**  
 Para un perfil **{riesgo}**, ahorrando **${ahorro_mensual}/mes** durante **{años} años**:  
-💰 **Patrimonio proyectado (ajustado por inflación):** ${total_final:,.2f}
-""")
\ No newline at end of file
+💰 **Patrimonio proyectado (mediana, ajustado por inflación):** ${total_final:,.2f}  
+🎯 **Probabilidad de alcanzar la meta de ${meta:,.0f}:** {probabilidad_meta:.1%}
+""")
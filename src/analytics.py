@@ -0,0 +1,162 @@
+# src/analytics.py
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from price_store import as_price_store
+
+
+def simple_returns(values):
+    """Retornos simples de una serie de valor (se descartan divisiones por cero)."""
+    values = pd.Series(values, dtype=float)
+    returns = values.pct_change(fill_method=None).iloc[1:]
+    return returns[np.isfinite(returns)]
+
+
+def _rolling_sum(x, window):
+    """Suma móvil en O(T) con sumas acumuladas (las primeras window-1 posiciones son NaN)."""
+    csum = np.concatenate([[0.0], np.cumsum(x)])
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = csum[window:] - csum[:-window]
+    return out
+
+
+def drawdown(values):
+    """
+    Serie de drawdown (caída desde el máximo previo) de una serie de valor.
+
+    Es NaN mientras el máximo previo no es positivo (por ejemplo, antes de la primera compra).
+    """
+    values = pd.Series(values, dtype=float)
+    peak = values.cummax()
+    return (values / peak - 1).where(peak > 0)
+
+
+def max_drawdown(values):
+    """
+    Máximo drawdown y su duración.
+
+    Retorna:
+    - dict con 'max_drawdown' (fracción negativa), 'peak', 'trough', 'recovery' (fecha o None)
+      y 'max_duration' (periodos de la racha más larga bajo el máximo previo).
+      Los valores faltantes y los valores no positivos iniciales se omiten; si la serie nunca
+      es positiva el drawdown no está definido y 'max_drawdown' es None.
+    """
+    values = pd.Series(values, dtype=float).dropna()
+    if values.empty:
+        return {"max_drawdown": 0.0, "peak": None, "trough": None, "recovery": None, "max_duration": 0}
+    positive = np.flatnonzero(values.to_numpy() > 0)
+    if not positive.size:
+        return {"max_drawdown": None, "peak": None, "trough": None, "recovery": None, "max_duration": 0}
+    values = values.iloc[positive[0]:]
+
+    dd = drawdown(values).to_numpy()
+    trough = int(np.argmin(dd))
+    peak = int(np.argmax(values.to_numpy()[:trough + 1]))
+    recovered = np.flatnonzero(dd[trough:] >= 0)
+    recovery = trough + int(recovered[0]) if recovered.size else None
+
+    # Duración: largo de cada racha consecutiva bajo el máximo, con una sola pasada
+    underwater = dd < 0
+    run_id = np.cumsum(~underwater)
+    lengths = np.bincount(run_id[underwater]) if underwater.any() else np.array([0])
+
+    index = values.index
+    return {
+        "max_drawdown": float(dd[trough]),
+        "peak": index[peak],
+        "trough": index[trough],
+        "recovery": None if recovery is None else index[recovery],
+        "max_duration": int(lengths.max()),
+    }
+
+
+def rolling_volatility(values, window=63, periods=252):
+    """Volatilidad anualizada móvil calculada con sumas acumuladas de r y r²."""
+    returns = simple_returns(values)
+    x = returns.to_numpy() - returns.mean()  # Centrar mejora la estabilidad numérica
+    s1, s2 = _rolling_sum(x, window), _rolling_sum(x * x, window)
+    variance = np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0)
+    return pd.Series(np.sqrt(variance * periods), index=returns.index, name="rolling_volatility")
+
+
+def rolling_sharpe(values, window=63, risk_free_rate=0.02, periods=252):
+    """Sharpe anualizado móvil (retorno medio en exceso sobre volatilidad) en O(T)."""
+    returns = simple_returns(values)
+    mean_return = _rolling_sum(returns.to_numpy(), window) / window * periods
+    volatility = rolling_volatility(values, window, periods).to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = (mean_return - risk_free_rate) / volatility
+    return pd.Series(sharpe, index=returns.index, name="rolling_sharpe")
+
+
+def var_historical(values, level=0.95):
+    """VaR histórico de un periodo (pérdida positiva) al nivel de confianza indicado."""
+    returns = simple_returns(values).to_numpy()
+    return float(-np.quantile(returns, 1 - level))
+
+
+def cvar_historical(values, level=0.95):
+    """CVaR histórico (pérdida media más allá del VaR)."""
+    returns = simple_returns(values).to_numpy()
+    tail = returns[returns <= np.quantile(returns, 1 - level)]
+    return float(-tail.mean())
+
+
+def var_parametric(values, level=0.95):
+    """VaR paramétrico normal de un periodo."""
+    returns = simple_returns(values)
+    return float(-(returns.mean() + norm.ppf(1 - level) * returns.std()))
+
+
+def cvar_parametric(values, level=0.95):
+    """CVaR paramétrico normal de un periodo."""
+    returns = simple_returns(values)
+    z = norm.ppf(1 - level)
+    return float(-(returns.mean() - returns.std() * norm.pdf(z) / (1 - level)))
+
+
+def beta(values, prices_df, benchmark="MXWD INDEX"):
+    """
+    Beta de la serie de valor contra una columna de referencia de los datos de precios.
+
+    Se usan las fechas comunes con precio de referencia válido. Retorna None si la referencia
+    no está en los datos de precios o no hay suficientes fechas comunes.
+    """
+    store = as_price_store(prices_df)
+    if benchmark not in store:
+        return None
+    values = pd.Series(values, dtype=float)
+    start, end = values.index[0], values.index[-1]
+    benchmark_prices = store.frame([benchmark], start, end)[benchmark].reindex(values.index)
+
+    frame = pd.DataFrame({"portfolio": values, "benchmark": benchmark_prices}).dropna()
+    returns = frame.pct_change(fill_method=None).iloc[1:]
+    returns = returns[np.isfinite(returns).all(axis=1)]
+    if len(returns) < 2:
+        return None
+    covariance = np.cov(returns["portfolio"], returns["benchmark"])
+    return float(covariance[0, 1] / covariance[1, 1])
+
+
+def summary(values, prices_df=None, benchmark="MXWD INDEX", risk_free_rate=0.02, level=0.95, periods=252):
+    """Resumen de métricas de riesgo de una serie de valor."""
+    returns = simple_returns(values)
+    drawdown_stats = max_drawdown(values)
+    volatility = float(returns.std() * np.sqrt(periods)) if len(returns) > 1 else None
+    annual_return = float(returns.mean() * periods) if len(returns) else None
+    metrics = {
+        "annual_return": annual_return,
+        "annual_volatility": volatility,
+        "sharpe": (annual_return - risk_free_rate) / volatility if volatility else None,
+        "max_drawdown": drawdown_stats["max_drawdown"],
+        "max_drawdown_duration": drawdown_stats["max_duration"],
+        "var_historical": var_historical(values, level) if len(returns) else None,
+        "cvar_historical": cvar_historical(values, level) if len(returns) else None,
+        "var_parametric": var_parametric(values, level) if len(returns) > 1 else None,
+        "cvar_parametric": cvar_parametric(values, level) if len(returns) > 1 else None,
+    }
+    if prices_df is not None and benchmark is not None and len(returns) > 1:
+        metrics["beta"] = beta(values, prices_df, benchmark)
+    return metrics
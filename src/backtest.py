@@ -0,0 +1,239 @@
+# src/backtest.py
+import logging
+
+import numpy as np
+import pandas as pd
+
+from optimization import PortfolioOptimization
+from price_store import as_price_store
+from stats_cache import ReturnMoments
+
+logger = logging.getLogger(__name__)
+
+# Frecuencia de rebalanceo (alias de fin de periodo de pandas) -> periodo usado para agrupar fechas
+REBALANCE_PERIODS = {
+    "W": "W",
+    "ME": "M", "BME": "M", "MS": "M",
+    "QE": "Q", "BQE": "Q", "QS": "Q",
+    "YE": "Y", "BYE": "Y", "YS": "Y",
+}
+
+
+class WalkForwardTarget:
+    """
+    Pesos objetivo re-estimados con PortfolioOptimization sobre una ventana móvil.
+
+    La media y la covarianza se mantienen con ReturnMoments: en cada rebalanceo solo se
+    agregan los retornos nuevos y se quitan los que salen de la ventana. Cada rebalanceo usa
+    solo los activos con historia completa en la ventana (ver _covered).
+    """
+
+    def __init__(self, objective="sharpe", window=252, risk_free_rate=0.02, constraint_set=(0, 1), periods=252,
+                 min_periods=None):
+        self.objective = objective
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self.risk_free_rate = risk_free_rate
+        self.constraint_set = constraint_set
+        self.periods = periods
+        self._moments = None
+        self._start = self._end = 0
+        self._last_weights = None
+
+    def _covered(self):
+        """
+        Activos con retorno en todas las fechas de la ventana con más observaciones, o None.
+
+        Así media y covarianza salen de la misma muestra común y la covarianza es semidefinida
+        positiva; los activos que empiezan dentro de la ventana entran cuando la cubren entera.
+        """
+        count = np.rint(self._moments.count)
+        n_obs = count.diagonal().max()
+        if n_obs < 2:
+            return None
+        # Activos que comparten todas sus fechas con el primero de historia completa
+        first = int(np.argmax(count.diagonal()))
+        return np.flatnonzero((count[first] == n_obs) & (count.diagonal() == n_obs))
+
+    def __call__(self, row, returns, tickers):
+        """Pesos objetivo en la fila `row` usando los retornos hasta la fila anterior."""
+        if self._moments is None:
+            self._moments = ReturnMoments(len(tickers))
+
+        new_start = max(0, row - self.window)
+        if new_start > self._start:
+            self._moments.remove(returns[self._start:min(new_start, self._end)])
+        self._moments.add(returns[max(self._end, new_start):row])
+        self._start, self._end = new_start, row
+        if row - new_start < self.min_periods:
+            # Sin historia suficiente el capital queda en caja (o en los pesos previos)
+            return self._last_weights
+
+        idx = self._covered()
+        if idx is None:
+            return self._last_weights
+
+        mean = self._moments.mean()[idx] * self.periods
+        cov = self._moments.cov(idx) * self.periods
+        optimizer = PortfolioOptimization.from_stats(
+            pd.Series(mean, index=[tickers[i] for i in idx]),
+            pd.DataFrame(cov),
+            objective=self.objective,
+            risk_free_rate=self.risk_free_rate,
+            constraint_set=self.constraint_set,
+        )
+        x0 = None
+        if self._last_weights is not None and self._last_weights[idx].sum() > 0:
+            x0 = self._last_weights[idx] / self._last_weights[idx].sum()
+        result = optimizer.solve(x0)
+        if not result.success:
+            logger.debug("Sin solución en la fila %d: %s; se mantienen los pesos previos", row, result.message)
+            return self._last_weights
+
+        weights = np.zeros(len(tickers))
+        weights[idx] = result.x
+        self._last_weights = weights
+        return weights
+
+
+class BacktestResult:
+    """Resultado de un backtest: valor diario, pesos en cada rebalanceo y costos."""
+
+    def __init__(self, values, weights, costs, turnover):
+        self.values = values
+        self.weights = weights
+        self.costs = costs
+        self.turnover = turnover
+
+    @property
+    def total_cost(self):
+        return float(self.costs.sum())
+
+
+class Backtest:
+    """
+    Motor de backtesting con rebalanceo periódico o por desvío y costos de transacción.
+
+    Entre rebalanceos las cantidades son constantes, así que el valor de cada tramo se
+    obtiene con un producto matriz-vector sobre las fechas del tramo.
+    """
+
+    def __init__(self, prices_df, tickers, initial_capital=1000, rebalance="ME", threshold=None,
+                 proportional_cost=0.0, fixed_cost=0.0, cash_rate=0.0, start_date=None, end_date=None):
+        """
+        Parámetros:
+        - prices_df (DataFrame o PriceStore): Datos históricos de precios.
+        - tickers (list): Activos del universo del backtest.
+        - initial_capital (float): Capital inicial.
+        - rebalance (str): Frecuencia calendario de pandas (ver REBALANCE_PERIODS: 'W', 'ME', 'QE', 'YE', ...) o None.
+        - threshold (float): Rebalancear cuando algún peso se desvíe más que este valor del objetivo.
+        - proportional_cost (float): Costo proporcional sobre el monto transado (0.001 = 10 pb).
+        - fixed_cost (float): Costo fijo por activo transado.
+        - cash_rate (float): Tasa anual de la caja no invertida.
+        - start_date, end_date (date): Rango del backtest.
+        """
+        if rebalance is None and threshold is None:
+            raise ValueError("Indica una frecuencia de rebalanceo, un umbral de desvío o ambos.")
+        if rebalance is not None and rebalance not in REBALANCE_PERIODS:
+            raise ValueError(f"Frecuencia de rebalanceo no reconocida. Usa una de: {', '.join(REBALANCE_PERIODS)}.")
+
+        store = as_price_store(prices_df)
+        self.tickers = [ticker.upper().strip() for ticker in tickers]
+        dates, prices = store.matrix(self.tickers, start_date, end_date, ffill=True)
+        self.dates = pd.DatetimeIndex(dates, name="DATE")
+        self.prices = prices
+        self.initial_capital = initial_capital
+        self.rebalance = rebalance
+        self.threshold = threshold
+        self.proportional_cost = proportional_cost
+        self.fixed_cost = fixed_cost
+        self.cash_growth = (1 + cash_rate) ** (1 / 252)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.returns = np.vstack([np.full((1, len(self.tickers)), np.nan), prices[1:] / prices[:-1] - 1])
+
+    def _calendar_rows(self):
+        """Filas del primer día hábil de cada periodo calendario."""
+        if self.rebalance is None or len(self.dates) == 0:
+            return np.array([0])
+        periods = self.dates.to_period(REBALANCE_PERIODS[self.rebalance])
+        return np.flatnonzero(np.concatenate([[True], periods[1:] != periods[:-1]]))
+
+    def _target_weights(self, target, row):
+        if callable(target):
+            weights = target(row, self.returns, self.tickers)
+        else:
+            weights = np.array([target.get(ticker, 0.0) for ticker in self.tickers], dtype=float)
+        if weights is None:
+            return None
+        # Los activos sin precio en la fecha quedan en caja
+        return np.where(np.isnan(self.prices[row]), 0.0, weights)
+
+    def run(self, target):
+        """
+        Ejecuta el backtest.
+
+        Parámetros:
+        - target (dict o callable): Pesos fijos por ticker (el resto queda en caja) o una función
+          (row, returns, tickers) -> pesos, como WalkForwardTarget.
+
+        Retorna:
+        - BacktestResult.
+        """
+        n_rows = len(self.dates)
+        prices = np.nan_to_num(self.prices, nan=0.0)
+        calendar_rows = np.append(self._calendar_rows(), n_rows)
+
+        values = np.empty(n_rows)
+        quantities = np.zeros(len(self.tickers))
+        cash = float(self.initial_capital)
+        weights_log, costs, turnover = {}, {}, {}
+        target_weights = None
+        row = 0
+
+        while row < n_rows:
+            # Rebalanceo en la fila actual
+            value = cash + quantities @ prices[row]
+            new_weights = self._target_weights(target, row)
+            if new_weights is not None:
+                target_weights = new_weights
+                current = quantities * prices[row]
+                trades = target_weights * value - current
+                traded = np.abs(trades) > 1e-9 * max(value, 1.0)
+                cost = self.proportional_cost * np.abs(trades).sum() + self.fixed_cost * traded.sum()
+                value_after = value - cost
+                holdings = target_weights * value_after
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    quantities = np.where(prices[row] > 0, holdings / prices[row], 0.0)
+                cash = value_after - holdings.sum()
+
+                weights_log[self.dates[row]] = target_weights
+                costs[self.dates[row]] = cost
+                turnover[self.dates[row]] = np.abs(trades).sum() / value if value else 0.0
+
+            # Tramo hasta el próximo rebalanceo calendario, valorizado de una vez
+            end = int(calendar_rows[np.searchsorted(calendar_rows, row, side="right")])
+            segment = prices[row:end]
+            cash_path = cash * self.cash_growth ** np.arange(end - row)
+            segment_values = segment @ quantities + cash_path
+
+            if self.threshold is not None and target_weights is not None and end - row > 1:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    drift = np.abs(segment * quantities / segment_values[:, None] - target_weights).max(axis=1)
+                breaches = np.flatnonzero(drift[1:] > self.threshold)
+                if breaches.size:
+                    end = row + 1 + int(breaches[0])
+                    segment_values = segment_values[:end - row]
+                    cash_path = cash_path[:end - row]
+
+            values[row:end] = segment_values
+            if end < n_rows:
+                cash = cash_path[-1] * self.cash_growth
+            row = end
+
+        return BacktestResult(
+            values=pd.Series(values, index=self.dates, name="value"),
+            weights=pd.DataFrame.from_dict(weights_log, orient="index", columns=self.tickers),
+            costs=pd.Series(costs, name="cost", dtype=float),
+            turnover=pd.Series(turnover, name="turnover", dtype=float),
+        )
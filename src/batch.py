@@ -0,0 +1,108 @@
+# src/batch.py
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from optimization import PortfolioOptimization
+from price_store import as_price_store
+from stats_cache import default_stats_cache
+
+
+def _run_job(index, job, mean_returns, cov_matrix):
+    """Resuelve un trabajo en el proceso de trabajo y mide su tiempo."""
+    started = time.perf_counter()
+    try:
+        optimizer = PortfolioOptimization.from_stats(
+            mean_returns,
+            cov_matrix,
+            objective=job.get("objective", "sharpe"),
+            risk_free_rate=job.get("risk_free_rate", 0.02),
+            constraint_set=job.get("constraint_set", (0, 1)),
+        )
+        result = optimizer.solve()
+        weights = dict(zip(optimizer.selected_assets, result.x.tolist())) if result.success else None
+        return {
+            "index": index,
+            "id": job.get("id", index),
+            "success": bool(result.success),
+            "weights": weights,
+            "objective_value": float(result.fun),
+            "iterations": int(result.nit),
+            "message": None if result.success else str(result.message),
+            "elapsed": time.perf_counter() - started,
+        }
+    except Exception as e:
+        return _failure(index, job, f"{type(e).__name__}: {e}", time.perf_counter() - started)
+
+
+def _failure(index, job, message, elapsed=0.0):
+    return {
+        "index": index,
+        "id": job.get("id", index),
+        "success": False,
+        "weights": None,
+        "objective_value": None,
+        "iterations": 0,
+        "message": message,
+        "elapsed": elapsed,
+    }
+
+
+def batch_optimize(prices_df, jobs, executor=None, max_workers=None, start_date=None, end_date=None,
+                   frequency="D", stats_cache=None):
+    """
+    Optimiza muchos trabajos (canasta, objetivo, restricciones) en paralelo.
+
+    Las estadísticas del universo se calculan una sola vez en la caché compartida y a
+    cada trabajo solo se le envía la media y la sub-covarianza de sus activos.
+
+    Parámetros:
+    - prices_df (DataFrame o PriceStore): Datos históricos de precios.
+    - jobs (iterable): Diccionarios con 'assets' y opcionalmente 'objective', 'risk_free_rate',
+      'constraint_set' e 'id'.
+    - executor (Executor): Ejecutor de concurrent.futures. Si es None se crea un ProcessPoolExecutor.
+    - max_workers (int): Número de procesos cuando se crea el ejecutor.
+    - start_date, end_date, frequency: Ventana y frecuencia de estimación.
+    - stats_cache (StatsCache): Caché de estadísticas (por defecto la compartida del proceso).
+
+    Retorna:
+    - Generador de diccionarios de resultado a medida que terminan los trabajos, con
+      'success', 'weights', 'message' (motivo de la falla) y 'elapsed' (segundos).
+    """
+    stats_cache = default_stats_cache if stats_cache is None else stats_cache
+    store = as_price_store(prices_df)
+    universe = stats_cache.universe(store, start_date, end_date, frequency)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    try:
+        futures = {}
+        for index, job in enumerate(jobs):
+            assets = [asset.upper().strip() for asset in job.get("assets", [])]
+            missing = [asset for asset in assets if asset not in store]
+            if not assets or missing:
+                yield _failure(index, job, f"Activos no disponibles: {', '.join(missing)}" if missing else "No se indicaron activos.")
+                continue
+            try:
+                mean_returns, cov_matrix = universe.subset(assets)
+            except ValueError as e:
+                yield _failure(index, job, str(e))
+                continue
+            started = time.perf_counter()
+            try:
+                futures[executor.submit(_run_job, index, job, mean_returns, cov_matrix)] = (index, job, started)
+            except Exception as e:  # Pool caído (BrokenProcessPool) o ejecutor cerrado
+                yield _failure(index, job, f"{type(e).__name__}: {e}")
+
+        for future in as_completed(futures):
+            index, job, started = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # El trabajo no llegó a retornar: el proceso murió o no se pudo serializar
+                result = _failure(index, job, f"{type(e).__name__}: {e}", time.perf_counter() - started)
+            yield result
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
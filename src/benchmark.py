@@ -0,0 +1,233 @@
+# src/benchmark.py
+"""
+Benchmarks de las rutas de cálculo con precios sintéticos correlacionados.
+
+Uso:
+    python benchmark.py --scales 1000x10 5000x100 --nan-density 0.02 -o bench.json
+    python benchmark.py --compare bench_base.json bench.json
+
+Cada escala es FECHASxTICKERS. Los resultados (mínimo y mediana de varias repeticiones)
+se guardan en JSON para comparar versiones; --compare marca las regresiones.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from optimization import PortfolioOptimization
+from portfolio import Portfolio
+from price_store import PriceStore
+from stats_cache import StatsCache
+from utils import load_prices
+from visualization import clear_figure_cache, efficient_frontier_figure
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCALES = ("1000x10", "2500x50", "5000x100")
+OBJECTIVES = ("sharpe", "volatility", "return")
+
+
+def synthetic_prices(n_dates, n_tickers, nan_density=0.0, n_factors=3, seed=None, start_date="2000-01-03"):
+    """
+    Genera precios diarios sintéticos con el formato de load_prices (columna DATE y un ticker por columna).
+
+    Los retornos siguen un modelo de factores (k factores comunes más ruido propio), así que la
+    covarianza tiene estructura realista. nan_density es la fracción aproximada de precios
+    faltantes: la mitad como inicios de cotización escalonados y el resto como huecos sueltos.
+    """
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0.0, 1.0, (n_tickers, n_factors)) * 0.6 / np.sqrt(n_factors)
+    factors = rng.normal(0.0, 0.01, (n_dates, n_factors))
+    drift = rng.normal(0.0003, 0.0002, n_tickers)
+    idiosyncratic = rng.normal(0.0, 1.0, (n_dates, n_tickers)) * rng.uniform(0.005, 0.015, n_tickers)
+    log_returns = drift + factors @ loadings.T + idiosyncratic
+    prices = 100 * np.exp(np.cumsum(log_returns, axis=0))
+
+    if nan_density > 0:
+        # Inicios escalonados: cada ticker pierde en promedio nan_density * n_dates fechas iniciales
+        listing = rng.integers(0, max(1, int(2 * nan_density * n_dates)), n_tickers) // 2
+        prices[np.arange(n_dates)[:, None] < listing[None, :]] = np.nan
+        prices[rng.random((n_dates, n_tickers)) < nan_density / 2] = np.nan
+
+    columns = [f"SYN{i:04d} EQUITY" for i in range(n_tickers)]
+    df = pd.DataFrame(prices, columns=columns)
+    df.insert(0, "DATE", pd.bdate_range(start_date, periods=n_dates))
+    return df
+
+
+def parse_scale(scale):
+    """Convierte 'FECHASxTICKERS' en (n_dates, n_tickers)."""
+    n_dates, n_tickers = scale.lower().split("x")
+    return int(n_dates), int(n_tickers)
+
+
+def time_call(fn, repeat=3, setup=None):
+    """
+    Ejecuta fn varias veces y retorna el mínimo y la mediana en segundos.
+
+    setup (si se entrega) se llama antes de cada repetición, fuera del tiempo medido.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": float(np.median(timings)), "repeat": repeat}
+
+
+def _build_portfolio(store, n_assets=10):
+    """Portafolio equiponderado con los primeros activos que cotizan desde la fecha de inicio común."""
+    start_row = len(store) // 10
+    candidates = [t for t in store.tickers if not np.isnan(store.values[start_row, store.ticker_index(t)])][:n_assets]
+    start_date = pd.Timestamp(store.dates[start_row]).date()
+    portfolio = Portfolio(initial_capital=1000)
+    for ticker in candidates:
+        portfolio.add_asset(ticker, 100 / len(candidates), store, start_date)
+    return portfolio, candidates, start_date, pd.Timestamp(store.dates[-1]).date()
+
+
+def run_scale(n_dates, n_tickers, nan_density=0.0, repeat=3, seed=0, excel=True, n_optimize=20):
+    """Mide las rutas de cálculo para una escala y retorna la lista de resultados."""
+    prices_df = synthetic_prices(n_dates, n_tickers, nan_density, seed=seed)
+    scale = {"n_dates": n_dates, "n_tickers": n_tickers, "nan_density": nan_density}
+    results = []
+
+    def record(case, fn, case_repeat=repeat, setup=None):
+        timing = time_call(fn, case_repeat, setup)
+        logger.info("%dx%d %-28s %.4fs", n_dates, n_tickers, case, timing["min"])
+        results.append(dict(scale, case=case, **timing))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if excel:
+            path = os.path.join(tmpdir, "precios.xlsx")
+            prices_df.to_excel(path, index=False)
+            record("load_prices", lambda: load_prices(path), 1)
+            cache_dir = os.path.join(tmpdir, "cache")
+            record("price_store_build", lambda: PriceStore(path, cache_dir=os.path.join(cache_dir, str(time.perf_counter_ns()))), 1)
+            PriceStore(path, cache_dir=cache_dir)
+            record("price_store_cached", lambda: PriceStore(path, cache_dir=cache_dir))
+        store = PriceStore.from_frame(prices_df)
+
+    portfolio, assets, start_date, end_date = _build_portfolio(store)
+    record("simulate", lambda: portfolio.simulate(store, end_date))
+    record("calculate_returns", lambda: portfolio.calculate_returns(store, start_date, end_date))
+    record("plot_portfolio_value_data", lambda: portfolio.value_series(store, start_date, end_date))
+
+    opt_assets = [t for t in store.tickers if not np.isnan(store.values[:, store.ticker_index(t)]).all()][:n_optimize]
+    for objective in OBJECTIVES:
+        # Caché nueva en cada repetición: se mide el cálculo de estadísticas más la optimización
+        record(f"optimize_{objective}", lambda objective=objective: PortfolioOptimization(
+            store, opt_assets, objective=objective, stats_cache=StatsCache()).optimize())
+
+    optimizer = PortfolioOptimization(store, opt_assets, stats_cache=StatsCache())
+    record("efficient_frontier", lambda: optimizer.efficient_frontier())
+    if importlib.util.find_spec("plotly") is None:
+        logger.info("plotly no disponible: se omite plot_efficient_frontier")
+    else:
+        # Solo se mide armar la figura: la frontera se calcula una vez y la caché de figuras
+        # se vacía antes de cada repetición (si no, se medirían aciertos de la caché)
+        frontier = optimizer.efficient_frontier()
+        record("plot_efficient_frontier", lambda: efficient_frontier_figure(frontier), setup=clear_figure_cache)
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, nan_density=0.0, repeat=3, seed=0, excel=True):
+    """Ejecuta todas las escalas y retorna el documento de resultados."""
+    results = []
+    for scale in scales:
+        n_dates, n_tickers = parse_scale(scale)
+        results.extend(run_scale(n_dates, n_tickers, nan_density, repeat, seed, excel))
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(base, new, threshold=0.2):
+    """
+    Compara dos documentos de resultados por escala y caso.
+
+    Retorna:
+    - Lista de (escala, caso, tiempo base, tiempo nuevo, razón) y la sublista de regresiones
+      (razón mayor que 1 + threshold).
+    """
+    def key(result):
+        return (f"{result['n_dates']}x{result['n_tickers']}@{result['nan_density']}", result["case"])
+
+    base_results = {key(result): result["min"] for result in base["results"]}
+    rows = []
+    for result in new["results"]:
+        if key(result) in base_results:
+            old = base_results[key(result)]
+            rows.append((*key(result), old, result["min"], result["min"] / old if old else float("inf")))
+    regressions = [row for row in rows if row[-1] > 1 + threshold]
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de las rutas de cálculo con precios sintéticos.")
+    parser.add_argument("--scales", nargs="+", default=list(DEFAULT_SCALES), help="Escalas FECHASxTICKERS.")
+    parser.add_argument("--nan-density", type=float, default=0.0, help="Fracción aproximada de precios faltantes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por caso.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla del generador sintético.")
+    parser.add_argument("--no-excel", action="store_true", help="No medir la carga desde Excel (escribir el archivo es lento).")
+    parser.add_argument("--output", "-o", help="Archivo JSON de salida (por defecto la salida estándar).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NUEVO"), help="Comparar dos archivos de resultados.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Tolerancia de regresión en --compare.")
+    parser.add_argument("--log-level", default="INFO", help="Nivel de logging.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.compare:
+        documents = []
+        for filepath in args.compare:
+            with open(filepath, "r", encoding="utf-8") as f:
+                documents.append(json.load(f))
+        rows, regressions = compare(*documents, threshold=args.threshold)
+        for scale, case, old, new, ratio in rows:
+            flag = "  <-- regresión" if ratio > 1 + args.threshold else ""
+            print(f"{scale:>20} {case:<28} {old:10.4f}s {new:10.4f}s {ratio:6.2f}x{flag}")
+        return 1 if regressions else 0
+
+    document = run_benchmarks(args.scales, args.nan_density, args.repeat, args.seed, not args.no_excel)
+    output = json.dumps(document, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# src/chart_data.py
+"""
+Reducción de series para gráficos: el número de puntos enviados al navegador queda acotado
+sin importar el largo de la historia.
+
+1. Según el largo del rango se elige la frecuencia (diaria, semanal o mensual), de modo que
+   al alejarse (rangos de décadas) se grafican cierres semanales o mensuales.
+2. Si aún quedan más puntos que el presupuesto, se diezma con LTTB (Largest-Triangle-Three-Buckets,
+   conserva la forma visual de la línea) o min/max por tramo (conserva los extremos).
+"""
+import hashlib
+
+import numpy as np
+
+from stats_cache import RESAMPLE_RULES
+
+DEFAULT_MAX_POINTS = 1500
+# Cuántas veces el presupuesto se tolera en una frecuencia antes de pasar a la siguiente
+RESAMPLE_FACTOR = 4
+PERIOD_DAYS = {"D": 1, "W": 5, "M": 21}
+
+
+def lttb(x, y, n_out):
+    """
+    Índices de los puntos elegidos por LTTB (el primero y el último siempre se conservan).
+
+    Cada tramo aporta el punto que forma el triángulo de mayor área con el punto elegido
+    en el tramo anterior y el promedio del tramo siguiente. Con n_out < 3 se usan 3 puntos
+    (los extremos y uno intermedio).
+    """
+    n = len(y)
+    n_out = max(n_out, 3)
+    if n_out >= n:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Tramo i = [bounds[i], bounds[i + 1]) para los n_out - 2 puntos intermedios
+    bounds = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    sums_x, sums_y = np.add.reduceat(x[:-1], bounds[:-1]), np.add.reduceat(y[:-1], bounds[:-1])
+    sizes = np.diff(bounds)
+    avg_x = np.append(sums_x / sizes, x[-1])
+    avg_y = np.append(sums_y / sizes, y[-1])
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def minmax(y, n_out):
+    """
+    Índices del mínimo y el máximo de cada tramo ((n_out - 2) // 2 tramos), más el primero y el último.
+
+    Con n_out < 4 se usan 4 puntos (los extremos y el mínimo y máximo globales).
+    """
+    n = len(y)
+    n_out = max(n_out, 4)
+    if n_out >= n:
+        return np.arange(n)
+    n_buckets = (n_out - 2) // 2
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    valid = ~np.isnan(buckets).all(axis=1)
+    buckets, offsets = buckets[valid], offsets[valid]
+    idx = np.concatenate([[0, n - 1], offsets + np.nanargmin(buckets, axis=1), offsets + np.nanargmax(buckets, axis=1)])
+    return np.unique(idx)
+
+
+def choose_frequency(n_dates, max_points=DEFAULT_MAX_POINTS):
+    """Frecuencia de graficación para un rango de n_dates fechas hábiles: 'D', 'W' o 'M'."""
+    for frequency in ("D", "W"):
+        if n_dates / PERIOD_DAYS[frequency] <= RESAMPLE_FACTOR * max_points:
+            return frequency
+    return "M"
+
+
+def downsample(series, max_points=DEFAULT_MAX_POINTS, method="lttb", resample=True):
+    """
+    Reduce una serie indexada por fecha a lo más max_points puntos.
+
+    Parámetros:
+    - series (Series): Serie con DatetimeIndex (sin NaN o con NaN que se descartan).
+    - max_points (int): Presupuesto de puntos.
+    - method (str): 'lttb' o 'minmax'.
+    - resample (bool): Si es True, los rangos largos se pasan antes a cierres semanales o mensuales.
+
+    Retorna:
+    - (serie reducida, frecuencia usada: 'D', 'W' o 'M').
+    """
+    if method not in ("lttb", "minmax"):
+        raise ValueError("Método no reconocido. Usa 'lttb' o 'minmax'.")
+    series = series.dropna()
+    frequency = "D"
+    if resample and len(series) > max_points:
+        frequency = choose_frequency(len(series), max_points)
+        if frequency != "D":
+            series = series.resample(RESAMPLE_RULES[frequency]).last().dropna()
+
+    if len(series) > max_points:
+        values = series.to_numpy(dtype=np.float64)
+        if method == "lttb":
+            idx = lttb(series.index.asi8.astype(np.float64), values, max_points)
+        else:
+            idx = minmax(values, max_points)
+        series = series.iloc[idx]
+    return series, frequency
+
+
+def series_fingerprint(*arrays):
+    """Clave para cachear figuras a partir de los datos (SHA-1 de forma, tipo y bytes de cada arreglo)."""
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(repr((array.shape, array.dtype.str)).encode("utf-8"))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,234 @@
+# src/convex_optimization.py
+"""
+Optimización convexa de portafolios con cvxpy (límites por activo y por grupo, rotación
+máxima respecto del portafolio actual y volatilidad máxima).
+
+Cada problema se compila una sola vez por estructura (número de activos, objetivo, grupos y
+restricciones activas) con cvxpy.Parameter para los datos; resolver con nuevos retornos,
+covarianza o límites solo actualiza los valores de los parámetros.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from profiling import profiler
+
+OBJECTIVES = ("sharpe", "volatility", "return")
+
+
+@profiler.timed("map.classes")
+def asset_classes(dictionary, assets, field="Class"):
+    """Categorías (campo 'Class' o 'Sub_Class' de diccionario.json) presentes entre los activos, ordenadas."""
+    info = {ticker.upper(): values for ticker, values in dictionary.items()}
+    return sorted({info[asset.upper()][field] for asset in assets if info.get(asset.upper(), {}).get(field)})
+
+
+@profiler.timed("map.groups")
+def group_bounds_from_dictionary(dictionary, assets, limits, field="Class"):
+    """
+    Límites por grupo a partir de las categorías de diccionario.json.
+
+    Parámetros:
+    - dictionary (dict): Diccionario de tickers (load_dictionary).
+    - assets (list): Activos del problema.
+    - limits (dict): {categoría: (mínimo, máximo)} para las categorías a limitar.
+    - field (str): Campo del diccionario que define el grupo ('Class' o 'Sub_Class').
+
+    Retorna:
+    - dict {categoría: (activos del grupo, mínimo, máximo)}; los grupos sin activos se omiten.
+    """
+    info = {ticker.upper(): values for ticker, values in dictionary.items()}
+    groups = {}
+    for name, (low, high) in limits.items():
+        members = [asset for asset in assets if info.get(asset.upper(), {}).get(field) == name]
+        if members:
+            groups[name] = (members, low, high)
+    return groups
+
+
+_factors = OrderedDict()
+_factors_lock = threading.Lock()
+MAX_CACHED_FACTORS = 16
+
+
+def _dense_factor(matrix):
+    try:
+        return np.linalg.cholesky(matrix).T
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+        return np.sqrt(np.maximum(eigenvalues, 0.0))[:, None] * eigenvectors.T
+
+
+def covariance_factor(cov_model):
+    """
+    Factores del riesgo: (G, s) con w'Σw = ||G·w||² + ||s ∘ w||².
+
+    - Modelo de factores: G = √F·B' (k x N) y s = √D; Σ nunca se forma y los datos son O(N·k).
+    - Covarianza densa: G con G'G = Σ (Cholesky, o descomposición espectral si Σ es singular)
+      y s = None. La descomposición se guarda por el contenido de Σ, así que resolver de
+      nuevo con la misma covarianza (otro objetivo, otros límites o un rerun) no la repite.
+    """
+    if hasattr(cov_model, "loadings"):
+        return np.sqrt(cov_model.factor_variances)[:, None] * cov_model.loadings.T, np.sqrt(cov_model.specific)
+
+    matrix = np.ascontiguousarray(cov_model.to_dense(), dtype=np.float64)
+    key = (matrix.shape, hashlib.sha1(matrix.tobytes()).hexdigest())
+    with _factors_lock:
+        factor = _factors.get(key)
+        if factor is not None:
+            _factors.move_to_end(key)
+            profiler.count("optimize.factor_cache_hits")
+            return factor, None
+    factor = _dense_factor(matrix)
+    with _factors_lock:
+        _factors[key] = factor
+        while len(_factors) > MAX_CACHED_FACTORS:
+            _factors.popitem(last=False)
+    return factor, None
+
+
+class ConvexPortfolioProblem:
+    """
+    Problema cvxpy parametrizado para una estructura fija.
+
+    Con objective='sharpe' se usa el cambio de variable y = κ·w (κ >= 0), que convierte
+    el máximo Sharpe en un QP: min ||G·y||² sujeto a (μ - rf)'y = 1 y las restricciones
+    lineales multiplicadas por κ.
+
+    Con specific=True el riesgo es el de un modelo de factores, ||G·w||² + ||s ∘ w||² con
+    G = √F·B' (factor_rows = k) y s = √D como parámetros separados (ver covariance_factor).
+    """
+
+    def __init__(self, n_assets, factor_rows, objective, group_matrix=None, turnover=False, max_volatility=False,
+                 specific=False):
+        import cvxpy as cp
+
+        if objective not in OBJECTIVES:
+            raise ValueError("Objetivo no reconocido. Usa 'return', 'volatility' o 'sharpe'.")
+        self.objective = objective
+        n_groups = 0 if group_matrix is None else len(group_matrix)
+
+        self.mu = cp.Parameter(n_assets)
+        self.risk_free_rate = cp.Parameter()
+        self.factor = cp.Parameter((factor_rows, n_assets))
+        self.specific = cp.Parameter(n_assets, nonneg=True) if specific else None
+        self.lower = cp.Parameter(n_assets)
+        self.upper = cp.Parameter(n_assets)
+        self.group_lower = cp.Parameter(n_groups) if n_groups else None
+        self.group_upper = cp.Parameter(n_groups) if n_groups else None
+        self.current = cp.Parameter(n_assets) if turnover else None
+        self.max_turnover = cp.Parameter(nonneg=True) if turnover else None
+        self.max_volatility = cp.Parameter(nonneg=True) if max_volatility else None
+
+        weights = cp.Variable(n_assets)
+        risk_terms = [self.factor @ weights]
+        if specific:
+            risk_terms.append(cp.multiply(self.specific, weights))
+        if objective == "sharpe":
+            scale = cp.Variable(nonneg=True)
+            constraints = [(self.mu - self.risk_free_rate) @ weights == 1, cp.sum(weights) == scale]
+            self._scale = scale
+        else:
+            scale = 1.0
+            constraints = [cp.sum(weights) == 1]
+            self._scale = None
+
+        constraints += [weights >= self.lower * scale, weights <= self.upper * scale]
+        if n_groups:
+            exposure = group_matrix @ weights
+            constraints += [exposure >= self.group_lower * scale, exposure <= self.group_upper * scale]
+        if turnover:
+            constraints.append(cp.norm1(weights - self.current * scale) <= self.max_turnover * scale)
+        if max_volatility:
+            constraints.append(cp.norm(cp.hstack(risk_terms), 2) <= self.max_volatility * scale)
+
+        if objective == "return":
+            problem_objective = cp.Maximize(self.mu @ weights)
+        else:
+            problem_objective = cp.Minimize(sum(cp.sum_squares(term) for term in risk_terms))
+
+        self.weights = weights
+        self.problem = cp.Problem(problem_objective, constraints)
+        self._lock = threading.Lock()
+
+    def solve(self, mu, factor, lower, upper, risk_free_rate=0.0, group_lower=None, group_upper=None,
+              current_weights=None, max_turnover=None, max_volatility=None, solver=None, specific=None):
+        """
+        Actualiza los parámetros y resuelve (arranque en caliente desde la solución anterior).
+
+        factor y specific son los de covariance_factor.
+
+        Retorna:
+        - (pesos o None, estado de cvxpy, iteraciones del solver).
+        """
+        with self._lock:
+            return self._solve(mu, factor, lower, upper, risk_free_rate, group_lower, group_upper,
+                               current_weights, max_turnover, max_volatility, solver, specific)
+
+    def _solve(self, mu, factor, lower, upper, risk_free_rate, group_lower, group_upper,
+               current_weights, max_turnover, max_volatility, solver, specific):
+        self.mu.value = np.asarray(mu, dtype=float)
+        self.risk_free_rate.value = float(risk_free_rate)
+        self.factor.value = np.asarray(factor, dtype=float)
+        if self.specific is not None:
+            self.specific.value = np.asarray(specific, dtype=float)
+        self.lower.value = np.asarray(lower, dtype=float)
+        self.upper.value = np.asarray(upper, dtype=float)
+        if self.group_lower is not None:
+            self.group_lower.value = np.asarray(group_lower, dtype=float)
+            self.group_upper.value = np.asarray(group_upper, dtype=float)
+        if self.current is not None:
+            self.current.value = np.asarray(current_weights, dtype=float)
+            self.max_turnover.value = float(max_turnover)
+        if self.max_volatility is not None:
+            self.max_volatility.value = float(max_volatility)
+
+        import cvxpy as cp
+        try:
+            self.problem.solve(solver=solver, warm_start=True)
+        except cp.error.SolverError as e:
+            return None, f"solver_error: {e}", 0
+
+        status = self.problem.status
+        iterations = getattr(self.problem.solver_stats, "num_iters", None) or 0
+        if status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) or self.weights.value is None:
+            return None, status, iterations
+
+        weights = np.asarray(self.weights.value, dtype=float)
+        if self._scale is not None:
+            if self._scale.value is None or self._scale.value <= 0:
+                return None, status, iterations
+            weights = weights / self._scale.value
+        return weights, status, iterations
+
+
+class ConvexProblemCache:
+    """Problemas ya compilados por estructura, compartidos entre optimizadores (LRU)."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._problems = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, n_assets, factor_rows, objective, group_matrix=None, turnover=False, max_volatility=False,
+            specific=False):
+        groups_key = None if group_matrix is None else (group_matrix.shape, group_matrix.tobytes())
+        key = (n_assets, factor_rows, objective, groups_key, turnover, max_volatility, specific)
+        with self._lock:
+            problem = self._problems.get(key)
+            if problem is not None:
+                self._problems.move_to_end(key)
+                return problem
+        problem = ConvexPortfolioProblem(n_assets, factor_rows, objective, group_matrix, turnover, max_volatility,
+                                         specific)
+        with self._lock:
+            self._problems[key] = problem
+            while len(self._problems) > self.max_entries:
+                self._problems.popitem(last=False)
+        return problem
+
+
+# Caché compartida por el proceso
+default_problem_cache = ConvexProblemCache()
@@ -0,0 +1,195 @@
+# src/covariance.py
+"""
+Estimadores de covarianza para la optimización de portafolios.
+
+Todos reciben una matriz de retornos (fechas x activos, con NaN donde no hay precio) y
+retornan la covarianza por periodo, sin anualizar, estimada sobre la muestra común de los
+activos (las fechas en que todos tienen retorno):
+- 'sample': covarianza muestral (la misma que usa la caché de estadísticas).
+- 'ledoit_wolf': contracción de Ledoit-Wolf (scikit-learn), bien condicionada aunque N se acerque a T.
+- 'ewma': covarianza con ponderación exponencial (vida media en periodos).
+- 'factor': modelo de k factores estadísticos (componentes principales) más riesgo específico.
+
+El modelo de factores se guarda como FactorCovariance (B, F, D) y nunca se materializa
+la matriz N x N para evaluar objetivos: Σw = B·F·(B'w) + D·w cuesta O(N·k).
+"""
+import numpy as np
+
+ESTIMATORS = ("sample", "ledoit_wolf", "ewma", "factor")
+
+
+def _common_window(returns):
+    """
+    Filas en que todos los activos tienen retorno (la muestra común de la canasta).
+
+    Estimar sobre la muestra común mantiene la matriz semidefinida positiva y no encoge la
+    varianza de los activos que empiezan tarde (rellenar sus faltantes con cero sí lo haría).
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    common = returns[np.isfinite(returns).all(axis=1)]
+    if len(common) < 2:
+        raise ValueError("⚠️ Los activos no tienen suficientes fechas en común para estimar la covarianza.")
+    return common
+
+
+def _centered(returns):
+    """Retornos de la muestra común centrados en la media de cada activo."""
+    common = _common_window(returns)
+    return common - common.mean(axis=0)
+
+
+class DenseCovariance:
+    """Covarianza explícita N x N con la misma interfaz que FactorCovariance."""
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def diag(self):
+        return np.diag(self.matrix)
+
+    def matvec(self, weights):
+        return self.matrix @ weights
+
+    def solve(self, rhs, idx):
+        """Resuelve Σ[idx, idx] · x = rhs."""
+        return np.linalg.solve(self.matrix[np.ix_(idx, idx)], rhs)
+
+    def is_positive_definite(self):
+        try:
+            np.linalg.cholesky(self.matrix)
+        except np.linalg.LinAlgError:
+            return False
+        return True
+
+    def to_dense(self):
+        return self.matrix
+
+
+class FactorCovariance:
+    """
+    Covarianza de un modelo de factores: Σ = B · diag(f) · B' + diag(d).
+
+    - loadings (N x k): exposición de cada activo a cada factor.
+    - factor_variances (k): varianza de cada factor (factores no correlacionados).
+    - specific (N): varianza específica de cada activo.
+    """
+
+    def __init__(self, loadings, factor_variances, specific):
+        self.loadings = np.asarray(loadings, dtype=np.float64)
+        self.factor_variances = np.asarray(factor_variances, dtype=np.float64)
+        self.specific = np.asarray(specific, dtype=np.float64)
+
+    @classmethod
+    def from_returns(cls, returns, n_factors=10, min_specific=1e-10):
+        """Estima k factores por componentes principales de los retornos centrados."""
+        centered = _centered(returns)
+        n_obs, n_assets = centered.shape
+        k = max(1, min(n_factors, n_assets - 1, n_obs - 1))
+        if k < min(centered.shape) - 1:
+            # SVD truncada: solo los k componentes mayores, O(T·N·k)
+            from scipy.sparse.linalg import svds
+            _, singular, vt = svds(centered, k=k)
+        else:
+            _, singular, vt = np.linalg.svd(centered, full_matrices=False)
+            singular, vt = singular[:k], vt[:k]
+        loadings = vt.T
+        factor_variances = singular ** 2 / max(n_obs - 1, 1)
+        total = (centered ** 2).sum(axis=0) / max(n_obs - 1, 1)
+        specific = np.maximum(total - (loadings ** 2) @ factor_variances, min_specific)
+        return cls(loadings, factor_variances, specific)
+
+    @property
+    def n_factors(self):
+        return len(self.factor_variances)
+
+    @property
+    def nbytes(self):
+        return self.loadings.nbytes + self.factor_variances.nbytes + self.specific.nbytes
+
+    def __len__(self):
+        return len(self.specific)
+
+    def scaled(self, factor):
+        """Covarianza multiplicada por un escalar (por ejemplo, para anualizar)."""
+        return FactorCovariance(self.loadings, self.factor_variances * factor, self.specific * factor)
+
+    def subset(self, idx):
+        """Modelo restringido a los activos idx (mismos factores)."""
+        return FactorCovariance(self.loadings[idx], self.factor_variances, self.specific[idx])
+
+    def diag(self):
+        return (self.loadings ** 2) @ self.factor_variances + self.specific
+
+    def matvec(self, weights):
+        """Σ · w en O(N·k) (w puede ser un vector o una matriz N x P)."""
+        weights = np.asarray(weights, dtype=np.float64)
+        shape = (-1,) + (1,) * (weights.ndim - 1)
+        factor_exposure = self.factor_variances.reshape(shape) * (self.loadings.T @ weights)
+        return self.loadings @ factor_exposure + self.specific.reshape(shape) * weights
+
+    def solve(self, rhs, idx):
+        """Resuelve Σ[idx, idx] · x = rhs con la identidad de Woodbury en O(|idx|·k²)."""
+        loadings, specific = self.loadings[idx], self.specific[idx]
+        d_inv_rhs = rhs / specific
+        d_inv_b = loadings / specific[:, None]
+        small = np.diag(1 / self.factor_variances) + loadings.T @ d_inv_b
+        return d_inv_rhs - d_inv_b @ np.linalg.solve(small, loadings.T @ d_inv_rhs)
+
+    def is_positive_definite(self):
+        return bool((self.specific > 0).all() and (self.factor_variances >= 0).all())
+
+    def to_dense(self):
+        return (self.loadings * self.factor_variances) @ self.loadings.T + np.diag(self.specific)
+
+
+def sample_covariance(returns):
+    """Covarianza muestral sobre la muestra común de los activos."""
+    return np.atleast_2d(np.cov(_common_window(returns), rowvar=False))
+
+
+def ledoit_wolf_covariance(returns):
+    """Covarianza con contracción de Ledoit-Wolf hacia una matriz escalar."""
+    from sklearn.covariance import ledoit_wolf
+
+    return ledoit_wolf(_centered(returns), assume_centered=True)[0]
+
+
+def ewma_covariance(returns, halflife=63):
+    """Covarianza con ponderación exponencial: la observación de hace `halflife` periodos pesa la mitad."""
+    returns = _common_window(returns)
+    weights = 0.5 ** (np.arange(len(returns))[::-1] / halflife)
+    weights /= weights.sum()
+    centered = returns - weights @ returns
+    return (centered * weights[:, None]).T @ centered
+
+
+def estimate_covariance(returns, method="sample", **options):
+    """
+    Estima la covarianza por periodo de una matriz de retornos.
+
+    Retorna:
+    - ndarray N x N, o FactorCovariance para method='factor'.
+    """
+    if method == "sample":
+        return sample_covariance(returns)
+    if method == "ledoit_wolf":
+        return ledoit_wolf_covariance(returns)
+    if method == "ewma":
+        return ewma_covariance(returns, **options)
+    if method == "factor":
+        return FactorCovariance.from_returns(returns, **options)
+    raise ValueError(f"Estimador de covarianza no reconocido. Usa uno de: {', '.join(ESTIMATORS)}.")
+
+
+def as_covariance_model(cov_matrix):
+    """Envuelve una matriz (ndarray o DataFrame) en DenseCovariance; los modelos se retornan tal cual."""
+    if isinstance(cov_matrix, (DenseCovariance, FactorCovariance)):
+        return cov_matrix
+    return DenseCovariance(cov_matrix)
@@ -0,0 +1,169 @@
+# src/currency.py
+"""
+Valorización multimoneda: conversión vectorizada de la matriz de precios a una moneda base.
+
+La moneda de cada ticker se lee del campo "Currency" de diccionario.json (USD si no está;
+los tickers sin el campo se informan en el log). Los tipos de cambio son columnas del mismo
+PriceStore que los precios, con la convención de Bloomberg "<MONEDA1><MONEDA2> CURNCY" =
+unidades de MONEDA2 por una unidad de MONEDA1 (por ejemplo USDCLP CURNCY o EURUSD CURNCY),
+así que comparten el índice de fechas. Pueden venir en el mismo archivo de precios o en
+fuentes propias (PriceStore(..., fx_sources=...), --fx en main.py e ingest.py).
+
+La conversión de todo el universo es un único producto con broadcasting
+(precios T x N por factores T x N armados desde T x monedas) y el resultado se guarda
+como un PriceStore por moneda base: cambiar la moneda de reporte no recalcula nada.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from price_sources import FX_SUFFIX, is_fx_ticker
+from price_store import PriceStore, ffill_matrix
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CURRENCY = "USD"
+
+
+@profiler.timed("map.currencies")
+def ticker_currencies(dictionary, tickers, default=DEFAULT_CURRENCY):
+    """Moneda de cada ticker según el campo Currency del diccionario (default si no está)."""
+    info = {ticker.upper(): values for ticker, values in dictionary.items()}
+    missing = [ticker for ticker in tickers if not info.get(ticker.upper(), {}).get("Currency")]
+    if missing:
+        logger.warning("Tickers sin campo Currency en el diccionario (se asume %s): %s", default, ", ".join(missing))
+    return {ticker: str(info.get(ticker.upper(), {}).get("Currency") or default).upper() for ticker in tickers}
+
+
+class CurrencyConverter:
+    """
+    Convierte los precios de un PriceStore a distintas monedas base, con caché por moneda.
+
+    Parámetros:
+    - store (PriceStore): Precios y columnas de tipos de cambio.
+    - currencies (dict): Ticker -> moneda (ver ticker_currencies). Las columnas de tipos de
+      cambio no se convierten y quedan fuera de los almacenes convertidos.
+    - max_entries (int): Monedas base guardadas en la caché (LRU).
+    """
+
+    def __init__(self, store, currencies, max_entries=4):
+        self.store = store
+        self.currencies = {ticker: currency.upper() for ticker, currency in currencies.items()}
+        self.max_entries = max_entries
+        self.tickers = [ticker for ticker in store.tickers if not is_fx_ticker(ticker)]
+        self.pairs = {ticker[:6] for ticker in store.tickers if is_fx_ticker(ticker)}
+        self._converted = OrderedDict()
+        self._bases = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dictionary(cls, store, dictionary, **kwargs):
+        return cls(store, ticker_currencies(dictionary, [t for t in store.tickers if not is_fx_ticker(t)]), **kwargs)
+
+    def _fx_column(self, pair):
+        """Serie de un par rellenada hacia adelante (los tipos de cambio no tienen feriados comunes)."""
+        column = np.asarray(self.store.column(f"{pair}{FX_SUFFIX}"), dtype=np.float64)
+        return ffill_matrix(column[:, None])[:, 0]
+
+    def _direct_rate(self, currency, base):
+        """Unidades de base por unidad de currency desde un par directo o inverso, o None."""
+        if f"{currency}{base}" in self.pairs:
+            return self._fx_column(f"{currency}{base}")
+        if f"{base}{currency}" in self.pairs:
+            return 1.0 / self._fx_column(f"{base}{currency}")
+        return None
+
+    def rate(self, currency, base):
+        """
+        Serie (alineada con las fechas del almacén) de unidades de base por unidad de currency.
+
+        Usa el par directo, el inverso o el cruce a través de USD.
+        """
+        currency, base = currency.upper(), base.upper()
+        if currency == base:
+            return np.ones(len(self.store))
+        rate = self._direct_rate(currency, base)
+        if rate is None and DEFAULT_CURRENCY not in (currency, base):
+            to_usd, from_usd = self._direct_rate(currency, DEFAULT_CURRENCY), self._direct_rate(DEFAULT_CURRENCY, base)
+            if to_usd is not None and from_usd is not None:
+                rate = to_usd * from_usd
+        if rate is None:
+            raise ValueError(f"⚠️ No hay tipo de cambio para convertir {currency} a {base}.")
+        return rate
+
+    def available_bases(self):
+        """Monedas a las que se puede convertir todo el universo."""
+        if self._bases is not None:
+            return self._bases
+        candidates = {DEFAULT_CURRENCY} | set(self.currencies.values())
+        candidates |= {pair[:3] for pair in self.pairs} | {pair[3:] for pair in self.pairs}
+        bases = []
+        for base in sorted(candidates):
+            try:
+                for currency in set(self.currencies.values()):
+                    self.rate(currency, base)
+            except ValueError:
+                continue
+            bases.append(base)
+        self._bases = bases
+        return bases
+
+    def convert(self, amount, currency, base, date):
+        """Monto en currency expresado en base con el tipo de cambio de date (o la fecha disponible anterior)."""
+        pos = self.store.snap(date)
+        if pos is None:
+            raise ValueError(f"⚠️ La fecha {date} no está disponible en los datos.")
+        return float(amount) * float(self.rate(currency, base)[pos])
+
+    @profiler.timed("fx.convert")
+    def _convert(self, base):
+        currencies = [self.currencies.get(ticker, DEFAULT_CURRENCY) for ticker in self.tickers]
+        unique = sorted(set(currencies))
+        # Factores por moneda (T x C) y un índice de columna por ticker: un solo broadcast
+        rates = np.column_stack([self.rate(currency, base) for currency in unique]) if unique \
+            else np.ones((len(self.store), 0))
+        position = {currency: i for i, currency in enumerate(unique)}
+        cols = [self.store.ticker_index(ticker) for ticker in self.tickers]
+        values = np.asarray(self.store.values[:, cols], dtype=np.float64) * rates[:, [position[c] for c in currencies]]
+
+        # La versión depende también de la moneda de cada ticker: si cambia en el diccionario,
+        # cambian los precios convertidos y las cachés por versión no deben reutilizarse
+        digest = hashlib.sha1(self.store.version.encode("utf-8"))
+        digest.update(base.encode("utf-8"))
+        digest.update(repr(sorted(zip(self.tickers, currencies))).encode("utf-8"))
+        return PriceStore.from_arrays(self.store.dates, self.tickers, values, digest.hexdigest(), currency=base)
+
+    def converted(self, base=DEFAULT_CURRENCY):
+        """
+        PriceStore con los precios en la moneda base, calculado una sola vez por moneda.
+
+        Si todos los tickers ya están en la moneda base y no hay columnas de tipos de cambio,
+        se retorna un almacén que comparte los arreglos del original sin copiarlos (solo
+        registra la moneda en PriceStore.currency).
+        """
+        base = base.upper()
+        if not self.pairs and all(currency == base for currency in self.currencies.values()):
+            if self.store.currency == base:
+                return self.store
+            return PriceStore.from_arrays(self.store.dates, self.store.tickers, self.store.values, self.store.version,
+                                          currency=base, validity=self.store.validity)
+
+        key = (self.store.version, base)
+        with self._lock:
+            converted = self._converted.get(key)
+            if converted is not None:
+                self._converted.move_to_end(key)
+                profiler.count("fx.cache_hits")
+                return converted
+
+        converted = self._convert(base)
+        logger.info("Precios convertidos a %s (%d tickers)", base, len(self.tickers))
+        with self._lock:
+            self._converted[key] = converted
+            while len(self._converted) > self.max_entries:
+                self._converted.popitem(last=False)
+        return converted
@@ -0,0 +1,117 @@
+# src/ingest.py
+"""
+Ingesta incremental de precios diarios sobre el almacén columnar.
+
+Uso:
+    python ingest.py delta_2025-01-10.csv [otro_delta.xlsx ...]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from price_store import PriceStore
+from stats_cache import default_stats_cache
+from utils import load_dictionary
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PRICES_PATH = os.path.join(BASE_DIR, "data", "precios.xlsx")
+DEFAULT_DICTIONARY_PATH = os.path.join(BASE_DIR, "data", "diccionario.json")
+DEFAULT_FX_PATH = os.path.join(BASE_DIR, "data", "tipos_cambio.xlsx")
+
+
+def load_delta(filepath):
+    """Lee un archivo delta de precios (CSV o XLSX) con columna DATE."""
+    if filepath.lower().endswith(".csv"):
+        return pd.read_csv(filepath)
+    return pd.read_excel(filepath)
+
+
+def validate_delta(delta_df, store, dictionary):
+    """
+    Valida un delta contra el diccionario de tickers y el almacén.
+
+    Los nombres de columna se normalizan igual que en utils.map_tickers. Un ticker es
+    válido si ya tiene historia en el almacén (PriceStore.append no agrega columnas: un
+    ticker nuevo del diccionario requiere recargar las fuentes de origen).
+
+    Retorna:
+    - DataFrame normalizado listo para PriceStore.append.
+    """
+    delta_df = delta_df.copy()
+    delta_df.columns = [str(col).strip().upper() for col in delta_df.columns]
+    if "DATE" not in delta_df.columns:
+        raise ValueError("⚠️ El delta no tiene columna DATE.")
+
+    dates = pd.to_datetime(delta_df["DATE"], errors="coerce")
+    if dates.isna().any():
+        raise ValueError(f"⚠️ Fechas inválidas en el delta: {delta_df.loc[dates.isna(), 'DATE'].tolist()}")
+    delta_df["DATE"] = dates.dt.normalize()
+
+    known = {ticker.upper() for ticker in dictionary}
+    tickers = [col for col in delta_df.columns if col != "DATE"]
+    new = [ticker for ticker in tickers if ticker not in store and ticker in known]
+    if new:
+        raise ValueError(f"⚠️ Tickers sin historia en el almacén (requieren recarga completa): {', '.join(new)}")
+    invalid = [ticker for ticker in tickers if ticker not in store]
+    if invalid:
+        raise ValueError(f"⚠️ Tickers no reconocidos en el delta: {', '.join(invalid)}")
+
+    values = delta_df[tickers].apply(pd.to_numeric, errors="coerce")
+    if (values <= 0).any().any():
+        raise ValueError("⚠️ El delta contiene precios menores o iguales a cero.")
+    delta_df[tickers] = values
+    return delta_df
+
+
+def ingest_delta(store, delta_df, dictionary, stats_cache=None):
+    """
+    Valida y agrega un delta al almacén, actualizando solo las estadísticas afectadas.
+
+    Retorna:
+    - Número de fechas agregadas.
+    """
+    stats_cache = default_stats_cache if stats_cache is None else stats_cache
+    delta_df = validate_delta(delta_df, store, dictionary)
+
+    previous_version, previous_rows = store.version, len(store)
+    first_row = store.append(delta_df)
+    if first_row is None:
+        return 0
+
+    stats_cache.on_append(store, previous_version, first_row)
+    added = len(store) - previous_rows
+    logger.info("Agregadas %d fechas (%s a %s)", added, pd.Timestamp(store.dates[first_row]).date(),
+                pd.Timestamp(store.dates[-1]).date())
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta incremental de precios.")
+    parser.add_argument("deltas", nargs="+", help="Archivos delta (CSV o XLSX) con columna DATE.")
+    parser.add_argument("--prices", default=DEFAULT_PRICES_PATH, help="Archivo de precios base (precios.xlsx).")
+    parser.add_argument("--fx", nargs="+", default=[DEFAULT_FX_PATH] if os.path.exists(DEFAULT_FX_PATH) else None,
+                        help="Archivos o carpetas con tipos de cambio (los mismos que usan la app y main.py).")
+    parser.add_argument("--dictionary", default=DEFAULT_DICTIONARY_PATH, help="Diccionario de tickers.")
+    parser.add_argument("--log-level", default="INFO", help="Nivel de logging.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    store = PriceStore(args.prices, fx_sources=args.fx)
+    dictionary = load_dictionary(args.dictionary)
+    for filepath in args.deltas:
+        try:
+            ingest_delta(store, load_delta(filepath), dictionary)
+        except ValueError as e:
+            logger.error("%s: %s", filepath, e)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
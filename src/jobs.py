@@ -0,0 +1,277 @@
+# src/jobs.py
+"""
+Trabajos en segundo plano para cálculos largos (optimizaciones y fronteras eficientes).
+
+Cada trabajo se identifica por el hash de sus entradas (job_key): si otro usuario o sesión
+pide lo mismo recibe el trabajo existente, en curso o terminado. Los trabajos corren en un
+pool de hilos compartido por el proceso, así que sobreviven a los reruns de Streamlit;
+la interfaz consulta el avance (job.done / job.total) y los resultados parciales.
+
+Uso:
+    job = default_job_manager.submit(job_key("frontier", version, assets), compute, optimizer, owner=session)
+    ...
+    if job.finished:
+        show(job.result)
+    default_job_manager.release(job.key, session)   # la sesión ya no lo necesita
+
+La función recibe el trabajo como primer argumento y puede informar avance con job.report().
+La cancelación es cooperativa: job.cancel() marca el trabajo y la siguiente llamada a
+job.report() lo interrumpe (un trabajo que aún no empezó no llega a correr).
+
+La duración de cada trabajo terminado o fallido queda en profiler.jobs() bajo su descripción,
+ya que el profiler por hilo de la sesión no ve lo que corre en el pool.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de la función del trabajo cuando este fue cancelado."""
+
+
+class JobQueueFull(Exception):
+    """Se lanza en submit cuando el registro está lleno de trabajos que alguien sigue esperando."""
+
+
+def job_key(*parts):
+    """Hash estable de las entradas de un trabajo (cualquier combinación de valores con repr determinista)."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class Job:
+    """
+    Estado de un trabajo: avance, resultado parcial, resultado final o error.
+
+    El estado lo escribe el hilo del trabajo y lo leen las sesiones: todos los campos
+    mutables se leen y escriben bajo el lock del trabajo.
+    """
+
+    def __init__(self, key, description=""):
+        self.key = key
+        self.description = description
+        self.submitted_at = time.time()
+        self._status = PENDING
+        self._done = 0
+        self._total = None
+        self._partial = None
+        self._result = None
+        self._error = None
+        self._started_at = None
+        self._finished_at = None
+        self._owners = set()
+        self._cancelled = threading.Event()
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def _get(self, name):
+        with self._lock:
+            return getattr(self, name)
+
+    status = property(lambda self: self._get("_status"))
+    done = property(lambda self: self._get("_done"))
+    total = property(lambda self: self._get("_total"))
+    result = property(lambda self: self._get("_result"))
+    error = property(lambda self: self._get("_error"))
+    started_at = property(lambda self: self._get("_started_at"))
+    finished_at = property(lambda self: self._get("_finished_at"))
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def progress(self):
+        """Fracción completada en [0, 1] (0 si el total aún no se conoce)."""
+        with self._lock:
+            return min(self._done / self._total, 1.0) if self._total else 0.0
+
+    @property
+    def elapsed(self):
+        with self._lock:
+            if self._started_at is None:
+                return 0.0
+            return (self._finished_at or time.time()) - self._started_at
+
+    @property
+    def partial(self):
+        """
+        Último resultado parcial informado. Si se informó como función sin argumentos, se
+        evalúa aquí (en el hilo que lo consulta) y solo una vez por reporte.
+        """
+        with self._lock:
+            partial = self._partial
+        if not callable(partial):
+            return partial
+        value = partial()
+        with self._lock:
+            if self._partial is partial:
+                self._partial = value
+        return value
+
+    def report(self, done, total=None, partial=None):
+        """
+        Informa avance desde la función del trabajo (y opcionalmente un resultado parcial, o
+        una función que lo construye cuando alguien lo consulta). Lanza JobCancelled si el
+        trabajo fue cancelado.
+        """
+        if self._cancelled.is_set():
+            raise JobCancelled(self.description or self.key)
+        with self._lock:
+            self._done = done
+            if total is not None:
+                self._total = total
+            if partial is not None:
+                self._partial = partial
+
+    def cancel(self):
+        """Pide detener el trabajo; retorna False si ya había terminado."""
+        if self.finished:
+            return False
+        self._cancelled.set()
+        return True
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait(self, timeout=None):
+        """Espera a que termine y retorna el resultado (relanza el error si falló o se canceló)."""
+        if not self._event.wait(timeout):
+            raise TimeoutError(f"El trabajo {self.description or self.key} no terminó en {timeout} s.")
+        with self._lock:
+            if self._status == FAILED:
+                raise self._error
+            if self._status == CANCELLED:
+                raise JobCancelled(self.description or self.key)
+            return self._result
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self._status, self._result, self._error = status, result, error
+            self._partial = None
+            self._finished_at = time.time()
+        if status != CANCELLED:
+            profiler.record_job(self.description or self.key, self.elapsed)
+        self._event.set()
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self._started_at = time.time()
+            if self._cancelled.is_set():
+                self._status = CANCELLED
+            else:
+                self._status = RUNNING
+        if self.status == CANCELLED:
+            self._finish(CANCELLED)
+            return
+        try:
+            result = fn(self, *args, **kwargs)
+        except JobCancelled:
+            logger.info("Trabajo cancelado: %s", self.description or self.key)
+            self._finish(CANCELLED)
+        except Exception as e:
+            logger.exception("Falló el trabajo %s", self.description or self.key)
+            self._finish(FAILED, error=e)
+        else:
+            self._finish(DONE, result=result)
+
+
+class JobManager:
+    """
+    Registro de trabajos por clave con un pool de hilos compartido.
+
+    - submit deduplica por clave: un trabajo pendiente, en curso o terminado se reutiliza;
+      uno fallido o cancelado se vuelve a lanzar.
+    - Cada sesión que pide un trabajo queda registrada como dueña (owner); release la quita
+      y un trabajo sin dueños que no terminó se cancela, así los trabajos abandonados
+      (la sesión pidió otra cosa o se cerró) no ocupan el pool.
+    - Se conservan como máximo max_jobs trabajos: se descartan primero los terminados más
+      antiguos y, si no basta, se cancelan los más antiguos sin dueño. Un trabajo que alguna
+      sesión espera nunca se descarta: si no hay espacio, submit lanza JobQueueFull.
+    """
+
+    def __init__(self, max_workers=None, max_jobs=256):
+        self.max_jobs = max_jobs
+        max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def get(self, key):
+        """Trabajo con esa clave o None."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key, fn, *args, description="", owner=None, **kwargs):
+        """Lanza fn(job, *args, **kwargs) en segundo plano, salvo que ya exista un trabajo con esa clave."""
+        with self._lock:
+            job = self._jobs.get(key)
+            # Un trabajo terminado se reutiliza aunque se haya pedido cancelarlo tarde (su
+            # resultado es válido); uno en curso con la cancelación pedida se vuelve a lanzar
+            status = job.status if job is not None else None
+            if status == DONE or (status in (PENDING, RUNNING) and not job.cancelled):
+                self._jobs.move_to_end(key)
+                if owner is not None:
+                    job._owners.add(owner)
+                return job
+            self._evict(key)
+            job = Job(key, description)
+            if owner is not None:
+                job._owners.add(owner)
+            self._jobs[key] = job
+        self._executor.submit(job._run, fn, args, kwargs)
+        return job
+
+    def release(self, key, owner):
+        """Quita al dueño del trabajo; si nadie más lo espera y no terminó, se cancela."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job._owners.discard(owner)
+            if not job._owners:
+                job.cancel()
+
+    def cancel(self, key):
+        """Cancela un trabajo para todos sus dueños; retorna False si no existe o ya terminó."""
+        with self._lock:
+            job = self._jobs.get(key)
+        return job is not None and job.cancel()
+
+    def _evict(self, incoming):
+        """Hace espacio para el trabajo `incoming` (que reemplaza al de su clave, si existe)."""
+        excess = len(self._jobs) + (incoming not in self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        others = [(key, job) for key, job in self._jobs.items() if key != incoming]
+        finished = [key for key, job in others if job.finished]
+        ownerless = [key for key, job in others if not job.finished and not job._owners]
+        if len(finished) + len(ownerless) < excess:
+            raise JobQueueFull(f"⚠️ Hay {len(self._jobs)} trabajos en espera; intenta de nuevo cuando terminen.")
+        for key in (finished + ownerless)[:excess]:
+            self._jobs.pop(key).cancel()
+
+    def clear(self):
+        """Descarta los trabajos terminados y cancela los que siguen pendientes o en curso."""
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel()
+            self._jobs = OrderedDict((key, job) for key, job in self._jobs.items() if not job.finished)
+
+
+# Registro compartido por el proceso (persiste entre reruns y sesiones de Streamlit)
+default_job_manager = JobManager()
@@ -1,31 +1,230 @@
 # src/main.py
-from utils import load_prices, load_dictionary, map_tickers
-from portfolio import Portfolio
+"""
+Ejecuta el simulador sin interfaz gráfica, pensado para procesos batch nocturnos.
+
+Uso:
+    python main.py portafolios.json --output resultados.json
+    python main.py portafolios.json --prices data/regiones/ data/extra.csv --on-conflict first
+    python main.py portafolios.json --currency CLP   # valorizar en pesos (requiere USDCLP CURNCY en los precios)
+    python main.py portafolios.json --currency CLP --fx data/tipos_cambio.xlsx   # tipos de cambio en otro archivo
+
+El archivo de entrada puede ser un portafolio o una lista de portafolios bajo la clave
+"portfolios". Cada portafolio admite:
+    {
+        "id": "cliente-001",
+        "initial_capital": 1000,
+        "start_date": "2020-01-02",      # opcional, por defecto la primera fecha válida de cada activo
+        "end_date": "2024-12-31",        # opcional, por defecto la última fecha disponible
+        "assets": {"CSPX LN EQUITY": 60, "QQQ US EQUITY": 40},
+        "objectives": ["sharpe", "volatility"]   # opcional, pesos óptimos a calcular
+    }
+"""
+import argparse
 import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from analytics import summary
+from batch import batch_optimize
+from currency import DEFAULT_CURRENCY, CurrencyConverter
+from portfolio import Portfolio
+from price_sources import CONFLICT_POLICIES
+from price_store import PriceStore
+from utils import load_dictionary
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PRICES_PATH = os.path.join(BASE_DIR, "data", "precios.xlsx")
+DEFAULT_DICTIONARY_PATH = os.path.join(BASE_DIR, "data", "diccionario.json")
+DEFAULT_FX_PATH = os.path.join(BASE_DIR, "data", "tipos_cambio.xlsx")
+
+
+def _to_date(value):
+    return None if value is None else pd.Timestamp(value).date()
+
+
+def load_spec(filepath):
+    """
+    Lee el archivo JSON de entrada y retorna la lista de portafolios.
+
+    Falla (ValueError) si el archivo no es un portafolio o una lista de portafolios, o si dos
+    portafolios comparten id: sus resultados se pisarían en la salida.
+    """
+    with open(filepath, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    portfolios = spec.get("portfolios", [spec]) if isinstance(spec, dict) else spec
+    if not isinstance(portfolios, list) or not all(isinstance(p, dict) for p in portfolios):
+        raise ValueError(f"⚠️ {filepath}: se esperaba un portafolio o una lista de portafolios.")
+    for i, portfolio_spec in enumerate(portfolios):
+        portfolio_spec.setdefault("id", i)
+    ids = [portfolio_spec["id"] for portfolio_spec in portfolios]
+    duplicated = sorted({str(i) for i in ids if ids.count(i) > 1})
+    if duplicated:
+        raise ValueError(f"⚠️ {filepath}: ids de portafolio repetidos: {', '.join(duplicated)}.")
+    return portfolios
+
+
+def build_portfolio(store, spec):
+    """Crea un Portfolio a partir de su especificación."""
+    portfolio = Portfolio(initial_capital=spec.get("initial_capital", 1000))
+    start_date = _to_date(spec.get("start_date"))
+    for ticker, percentage in spec["assets"].items():
+        portfolio.add_asset(ticker, percentage, store, start_date)
+    return portfolio
+
+
+def value_portfolio(store, spec, include_series=False, nan_policy="ffill"):
+    """
+    Valoriza un portafolio y calcula su rendimiento en el rango pedido.
+
+    Retorna un diccionario serializable con los activos, el valor final, el
+    rendimiento, las métricas de riesgo y, opcionalmente, la serie de valor completa.
+    """
+    portfolio = build_portfolio(store, spec)
+    assets = portfolio.list_assets()
+    if not assets:
+        raise ValueError("El portafolio no tiene activos con datos de precio.")
+
+    start_date = _to_date(spec.get("start_date")) or max(asset["start_date"] for asset in assets)
+    values = portfolio.value_series(store, start_date, _to_date(spec.get("end_date")), nan_policy=nan_policy)
+    if values.empty:
+        raise ValueError("No hay datos de precios en el rango de fechas seleccionado.")
+
+    start_value, end_value = float(values.iloc[0]), float(values.iloc[-1])
+    result = {
+        "assets": [dict(asset, start_date=str(asset["start_date"])) for asset in assets],
+        "start_date": str(values.index[0].date()),
+        "end_date": str(values.index[-1].date()),
+        "start_value": start_value,
+        "end_value": end_value,
+        "returns": ((end_value - start_value) / start_value) * 100 if start_value else None,
+        "risk": summary(values, store),
+    }
+    if include_series:
+        result["series"] = [{"date": str(date.date()), "value": float(value)} for date, value in values.items()]
+    return result
+
+
+def _optimization_jobs(spec):
+    """Trabajos de batch_optimize para los objetivos pedidos en un portafolio."""
+    return [{
+        "id": (spec["id"], objective),
+        "assets": list(spec["assets"]),
+        "objective": objective,
+        "risk_free_rate": spec.get("risk_free_rate", 0.02),
+        "constraint_set": tuple(spec.get("constraint_set", (0, 1))),
+    } for objective in spec.get("objectives") or []]
+
+
+def run(store, portfolios, include_series=False, nan_policy="ffill", workers=None):
+    """
+    Procesa todos los portafolios y retorna la lista de resultados.
+
+    Un portafolio con error no detiene el resto: su resultado lleva el mensaje en "error"
+    y las optimizaciones fallidas quedan en "optimization_errors" ({objetivo: mensaje}).
+    """
+    results = {}
+    jobs = []
+    for spec in portfolios:
+        if spec["id"] in results:
+            raise ValueError(f"⚠️ Id de portafolio repetido: {spec['id']}.")
+        result = {"id": spec["id"], "error": None}
+        results[spec["id"]] = result
+        try:
+            result.update(value_portfolio(store, spec, include_series, nan_policy))
+            spec_jobs = _optimization_jobs(spec)
+        except Exception as e:
+            # Los errores de datos (KeyError/ValueError) son esperables; el resto se registra con traza
+            expected = isinstance(e, (KeyError, ValueError))
+            logger.error("Portafolio %s: %s", spec["id"], e, exc_info=not expected)
+            result["error"] = str(e) if expected else f"{type(e).__name__}: {e}"
+            continue
+
+        if spec_jobs:
+            result["optimal_weights"] = {}
+            result["optimization_errors"] = {}
+            jobs += spec_jobs
+
+    if jobs:
+        executor = ThreadPoolExecutor(max_workers=1) if workers == 1 else None
+        try:
+            for job_result in batch_optimize(store, jobs, executor=executor, max_workers=workers):
+                portfolio_id, objective = job_result["id"]
+                result = results[portfolio_id]
+                result["optimal_weights"][objective] = job_result["weights"]
+                if not job_result["success"]:
+                    logger.warning("Portafolio %s (%s): %s", portfolio_id, objective, job_result["message"])
+                    result["optimization_errors"][objective] = job_result["message"]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    return list(results.values())
+
+
+def failed(result):
+    """True si la valorización o alguna optimización del portafolio falló."""
+    return result["error"] is not None or bool(result.get("optimization_errors"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de portafolios sin interfaz (batch).")
+    parser.add_argument("spec", help="Archivo JSON con uno o varios portafolios.")
+    parser.add_argument("--prices", nargs="+", default=[DEFAULT_PRICES_PATH],
+                        help="Archivo de precios (precios.xlsx), o varios archivos/carpetas XLSX, CSV o Parquet.")
+    parser.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default="error",
+                        help="Política ante precios en conflicto entre fuentes.")
+    parser.add_argument("--fx", nargs="+", default=[DEFAULT_FX_PATH] if os.path.exists(DEFAULT_FX_PATH) else None,
+                        help="Archivos o carpetas con tipos de cambio ('USDCLP CURNCY', ...), si no vienen con los precios.")
+    parser.add_argument("--dictionary", default=DEFAULT_DICTIONARY_PATH, help="Diccionario de tickers (moneda de cada ticker).")
+    parser.add_argument("--currency", default=DEFAULT_CURRENCY, help="Moneda base de la valorización.")
+    parser.add_argument("--output", "-o", help="Archivo JSON de salida (por defecto la salida estándar).")
+    parser.add_argument("--series", action="store_true", help="Incluir la serie de valor diaria de cada portafolio.")
+    parser.add_argument("--nan-policy", choices=["ffill", "skip"], default="ffill", help="Tratamiento de precios faltantes.")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para las optimizaciones (1 = sin procesos).")
+    parser.add_argument("--log-level", default="INFO", help="Nivel de logging.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-def main():
-    # Cargar datos
-    prices_df = load_prices('../precios.xlsx')
-    dictionary = load_dictionary('../diccionario.json')
+    try:
+        store = PriceStore(args.prices[0] if len(args.prices) == 1 else args.prices,
+                           source_options={"on_conflict": args.on_conflict}, fx_sources=args.fx)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error("%s", e)
+        return 2
+    dictionary = load_dictionary(args.dictionary) if os.path.exists(args.dictionary) else {}
+    try:
+        store = CurrencyConverter.from_dictionary(store, dictionary).converted(args.currency)
+    except ValueError as e:
+        logger.error("%s", e)
+        return 2
+    try:
+        portfolios = load_spec(args.spec)
+    except (OSError, ValueError) as e:
+        logger.error("%s", e)
+        return 2
+    logger.info("Procesando %d portafolios con %d fechas y %d tickers", len(portfolios), len(store), len(store.tickers))
 
-    # Mapear tickers
-    prices_df, ticker_info = map_tickers(prices_df, dictionary)
+    results = run(store, portfolios, args.series, args.nan_policy, args.workers)
 
-    # Crear portafolio
-    portfolio = Portfolio()
-    portfolio.add_asset("CSPX LN EQUITY", 10)  # Ejemplo: 10 unidades de CSPX
-    portfolio.add_asset("QQQ US EQUITY", 5)    # Ejemplo: 5 unidades de QQQ
+    output = json.dumps({"results": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
 
-    # Simular
-    total_value = portfolio.simulate(prices_df)
-    print(f"Valor total del portafolio: ${total_value:.2f}")
+    n_failed = sum(failed(result) for result in results)
+    if n_failed:
+        logger.warning("%d de %d portafolios con error", n_failed, len(results))
+    return 1 if n_failed else 0
 
-    # Mostrar información de los activos
-    for asset in portfolio.assets:
-        ticker = asset["ticker"]
-        if ticker in ticker_info:
-            print(f"\nInformación de {ticker}:")
-            print(json.dumps(ticker_info[ticker], indent=4, ensure_ascii=False))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# src/montecarlo.py
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class ProjectionResult:
+    """Resultado de una proyección de Monte Carlo: bandas por año y probabilidad de la meta."""
+
+    def __init__(self, yearly_totals, monthly_saving, goal=None):
+        self.yearly_totals = yearly_totals  # Matriz caminos x años (ajustada por inflación)
+        self.monthly_saving = monthly_saving
+        self.goal = goal
+
+    @property
+    def n_paths(self):
+        return self.yearly_totals.shape[0]
+
+    def bands(self, percentiles=PERCENTILES):
+        """Percentiles del patrimonio al cierre de cada año."""
+        years = np.arange(1, self.yearly_totals.shape[1] + 1)
+        values = np.percentile(self.yearly_totals, percentiles, axis=0).T
+        bands = pd.DataFrame(values, columns=[f"P{p}" for p in percentiles])
+        bands.insert(0, "Año", years)
+        bands["Ahorro Acumulado"] = self.monthly_saving * 12 * years
+        return bands
+
+    def goal_probability(self, goal=None):
+        """Probabilidad de alcanzar la meta al final del horizonte."""
+        goal = self.goal if goal is None else goal
+        if goal is None or self.yearly_totals.shape[1] == 0:
+            return None
+        return float(np.mean(self.yearly_totals[:, -1] >= goal))
+
+    def goal_probability_by_year(self, goal=None):
+        """Probabilidad de haber alcanzado la meta al cierre de cada año (None si no hay meta)."""
+        goal = self.goal if goal is None else goal
+        if goal is None:
+            return None
+        return (self.yearly_totals >= goal).mean(axis=0)
+
+
+def monthly_returns_from_prices(prices, ticker):
+    """Retornos mensuales históricos de un ticker a partir de un PriceStore."""
+    monthly = prices.frame([ticker]).ffill().resample("ME").last()[ticker]
+    return monthly.pct_change(fill_method=None).dropna().to_numpy()
+
+
+def _simulate_chunk(seed, n_paths, months, monthly_saving, model):
+    """Simula un bloque de caminos y retorna el patrimonio al cierre de cada año."""
+    rng = np.random.default_rng(seed)
+
+    if model["kind"] == "bootstrap":
+        returns = rng.choice(model["history"], size=(n_paths, months), replace=True)
+    else:
+        returns = np.expm1(rng.normal(model["log_mean"], model["log_std"], size=(n_paths, months)))
+    inflation = rng.normal(model["inflation_mean"], model["inflation_std"], size=(n_paths, months))
+
+    # Misma dinámica que el cálculo determinista: se aporta y luego se aplica rendimiento - inflación,
+    # W_t = (W_{t-1} + ahorro) * g_t. La recurrencia hacia adelante no divide por el crecimiento
+    # acumulado, así que un mes de -100% (g_t = 0) deja el patrimonio en cero sin producir inf/NaN.
+    growth = 1 + returns - inflation
+    totals = np.empty((n_paths, months // 12))
+    wealth = np.zeros(n_paths)
+    for month in range(months):
+        wealth = (wealth + monthly_saving) * growth[:, month]
+        if month % 12 == 11:
+            totals[:, month // 12] = wealth
+    return totals
+
+
+def project_retirement(monthly_saving, years, annual_return=7.0, annual_inflation=3.5, annual_volatility=15.0,
+                       inflation_volatility=1.0, n_paths=100_000, history=None, goal=None, seed=None,
+                       chunk_size=10_000, workers=None):
+    """
+    Proyección estocástica del ahorro para el retiro.
+
+    Parámetros:
+    - monthly_saving (float): Ahorro mensual.
+    - years (int): Horizonte en años.
+    - annual_return, annual_volatility (float): Retorno esperado y volatilidad anual en % (modelo lognormal).
+    - annual_inflation, inflation_volatility (float): Inflación esperada y su volatilidad anual en %.
+    - n_paths (int): Número de caminos simulados.
+    - history (array): Retornos mensuales históricos; si se indica, los retornos se remuestrean (bootstrap)
+      y annual_return y annual_volatility no se usan (la inflación sí).
+    - goal (float): Meta de patrimonio para calcular la probabilidad de alcanzarla.
+    - seed (int): Semilla para resultados reproducibles.
+    - chunk_size (int): Caminos por bloque, acota la memoria a chunk_size x meses.
+    - workers (int): Procesos para simular los bloques en paralelo (None = en el proceso actual).
+
+    Retorna:
+    - ProjectionResult.
+    """
+    months = int(years) * 12
+    inflation_std = inflation_volatility / 100 / np.sqrt(12)
+    model = {
+        "inflation_mean": (1 + annual_inflation / 100) ** (1 / 12) - 1,
+        "inflation_std": inflation_std,
+    }
+    if history is not None:
+        model.update(kind="bootstrap", history=np.asarray(history, dtype=float))
+    else:
+        log_std = annual_volatility / 100 / np.sqrt(12)
+        # Media logarítmica tal que el retorno mensual esperado equivale al retorno anual indicado
+        model.update(kind="lognormal", log_std=log_std,
+                     log_mean=np.log1p(annual_return / 100) / 12 - log_std ** 2 / 2)
+
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    # Una semilla independiente por bloque: el resultado no depende de cómo se repartan los bloques
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(seeds[i], size, months, monthly_saving, model) for i, size in enumerate(sizes)]
+
+    if workers and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, *zip(*args)))
+    else:
+        chunks = [_simulate_chunk(*chunk_args) for chunk_args in args]
+
+    yearly_totals = np.vstack(chunks) if chunks else np.zeros((0, int(years)))
+    return ProjectionResult(yearly_totals, monthly_saving, goal)
@@ -1,8 +1,249 @@
+import importlib.util
+import logging
+
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
-import streamlit as st
 import scipy.optimize as sc
+from scipy.linalg import cho_factor, cho_solve
+
+from covariance import as_covariance_model
+from price_store import as_price_store
+from profiling import profiler
+from stats_cache import default_stats_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _psd_solver(matrix, rcond=1e-12):
+    """
+    Función rhs -> matrix⁻¹ · rhs para una covarianza (o un bloque de ella).
+
+    Usa Cholesky cuando la matriz está bien condicionada; si es singular o casi singular
+    (por ejemplo, ETFs casi colineales) usa mínimos cuadrados, que entrega la solución de
+    norma mínima en lugar de fallar o amplificar el ruido.
+    """
+    try:
+        factor = cho_factor(matrix)
+        diag = np.abs(np.diag(factor[0]))
+        # (d_min / d_max)² acota por arriba el inverso del número de condición
+        if diag.min() ** 2 > rcond * diag.max() ** 2:
+            return lambda rhs: cho_solve(factor, rhs)
+    except np.linalg.LinAlgError:
+        pass
+    profiler.count("optimize.lstsq_fallback")
+    return lambda rhs: np.linalg.lstsq(matrix, rhs, rcond=rcond)[0]
+
+
+def _clean_corners(corners, mean, lower, upper):
+    """
+    Descarta esquinas con errores numéricos o que no reducen el retorno. Si dos esquinas
+    seguidas tienen el mismo retorno (activos con igual retorno esperado) queda la segunda,
+    que tiene menor varianza.
+    """
+    corners = np.array(corners)
+    feasible = (np.abs(corners.sum(axis=1) - 1) < 1e-8) & (corners >= lower - 1e-8).all(axis=1) & (corners <= upper + 1e-8).all(axis=1)
+    corners = corners[feasible]
+    returns = corners @ mean
+    keep = np.concatenate([[True], np.diff(returns) <= 1e-12])
+    corners, returns = corners[keep], returns[keep]
+    tied = np.concatenate([returns[:-1] - returns[1:] <= 1e-12 * max(1.0, np.abs(returns).max(initial=0)), [False]])
+    return corners[~tied]
+
+
+def _break_ties(mean, cov, scale=1e-9):
+    """
+    Retornos esperados con los empates deshechos de forma determinista.
+
+    Con dos activos de igual retorno la Línea Crítica no puede liberar al que queda en su
+    límite (los multiplicadores se indeterminan). Dentro de cada grupo empatado se resta
+    scale · rango, con el activo de menor varianza primero; el error en el retorno es
+    del orden de scale y las esquinas se limpian con los retornos originales.
+    """
+    order = np.lexsort((np.diag(cov), -mean))
+    tol = 1e-12 * max(1.0, np.abs(mean).max(initial=0))
+    perturbed = mean.astype(float).copy()
+    rank = 0
+    for prev, i in zip(order[:-1], order[1:]):
+        rank = rank + 1 if abs(mean[prev] - mean[i]) <= tol else 0
+        perturbed[i] = mean[i] - rank * scale * max(1.0, abs(mean[i]))
+    return perturbed
+
+
+def _critical_line(mean, cov, lower, upper, tol=1e-10, on_corner=None, max_iter=None):
+    """
+    Algoritmo de la Línea Crítica de Markowitz con límites por activo.
+
+    Retorna los portafolios esquina de la frontera (de mayor a menor retorno).
+    Entre dos esquinas consecutivas los pesos varían linealmente con el retorno,
+    por lo que cualquier punto de la frontera se obtiene interpolando.
+    on_corner(esquinas) se llama con la lista de esquinas encontradas después de cada una.
+    Falla (RuntimeError) si no termina en max_iter cambios (por defecto 10·N + 100).
+    """
+    n = len(mean)
+    if lower.sum() > 1 + tol or upper.sum() < 1 - tol:
+        raise ValueError("Los límites de pesos no permiten que la suma sea 1.")
+    max_iter = 10 * n + 100 if max_iter is None else max_iter
+    original_mean, mean = mean, _break_ties(mean, cov)
+
+    # Portafolio inicial: máximo retorno llenando primero los activos de mayor retorno
+    w = lower.astype(float).copy()
+    is_free = np.zeros(n, dtype=bool)
+    for i in np.argsort(-mean, kind="stable"):
+        if w.sum() - w[i] + upper[i] >= 1:
+            w[i] = 1 - (w.sum() - w[i])
+            is_free[i] = True
+            break
+        w[i] = upper[i]
+
+    corners = [w.copy()]
+    if on_corner is not None:
+        on_corner(list(corners))
+    last_lam = None
+    for _ in range(max_iter):
+        free, bounded = np.flatnonzero(is_free), np.flatnonzero(~is_free)
+        solve_f = _psd_solver(cov[np.ix_(free, free)])
+        cov_fb = cov[np.ix_(free, bounded)]
+        mean_f, w_b = mean[free], w[bounded]
+        c4 = solve_f(np.ones(len(free)))  # inv(Σ_FF) · 1
+        c2 = solve_f(mean_f)  # inv(Σ_FF) · μ_F
+        c1, c3 = c4.sum(), c2.sum()
+        z = cov_fb @ w_b  # Σ_FB · w_B
+
+        # Caso a) un activo libre pasa a su límite
+        lam_in, i_in, bound_in = None, None, None
+        if len(free) > 1:
+            c = -c1 * c2 + c3 * c4
+            l3 = solve_f(z)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                bound = np.where(c > 0, upper[free], lower[free])
+                lam = ((1 - w_b.sum() + l3.sum()) * c4 - c1 * (bound + l3)) / c
+            lam[np.abs(c) < tol] = np.nan
+            if not np.isnan(lam).all():
+                j = int(np.nanargmax(lam))
+                lam_in, i_in, bound_in = lam[j], free[j], bound[j]
+
+        # Caso b) un activo en su límite pasa a ser libre (todas las candidatas a la vez,
+        # con el complemento de Schur de Σ_FF en lugar de factorizar cada matriz ampliada)
+        lam_out, i_out = None, None
+        if len(bounded) > 0:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                u = solve_f(cov_fb)
+                diag = cov[bounded, bounded]
+                s = diag - np.einsum("ij,ij->j", cov_fb, u)
+                u_ones, u_mean = u.sum(axis=0), mean_f @ u
+                c4_new = (1 - u_ones) / s
+                c2_new = (mean[bounded] - u_mean) / s
+                c1_new = c1 + (1 - u_ones) ** 2 / s
+                c3_new = c3 + (1 - u_ones) * (mean[bounded] - u_mean) / s
+                # Σ_{F',B'} · w_B' para cada candidata, separado en la parte libre y la nueva fila
+                v_i = cov[np.ix_(bounded, bounded)] @ w_b - diag * w_b
+                u_v = u.T @ z - (diag - s) * w_b
+                l3_new = (v_i - u_v) / s
+                ones_l3 = c4 @ z - u_ones * w_b + (1 - u_ones) * l3_new
+                c = -c1_new * c2_new + c3_new * c4_new
+                lam = ((1 - (w_b.sum() - w_b) + ones_l3) * c4_new - c1_new * (w_b + l3_new)) / c
+            lam[np.abs(c) < tol] = np.nan
+            # Un activo colineal con los libres (complemento de Schur ~0) no aporta una dirección nueva
+            lam[s <= 1e-10 * diag] = np.nan
+            if last_lam is not None:
+                # Solo valen cambios estrictamente posteriores (evita reingresar el activo recién acotado)
+                lam[lam >= last_lam - 1e-9 * max(1.0, abs(last_lam))] = np.nan
+            if not np.isnan(lam).all():
+                j = int(np.nanargmax(lam))
+                lam_out, i_out = lam[j], bounded[j]
+
+        if (lam_in is None or lam_in < 0) and (lam_out is None or lam_out < 0):
+            # No hay más cambios: el último tramo termina en el portafolio de mínima varianza
+            last_lam = 0.0
+        elif lam_out is None or (lam_in is not None and lam_in > lam_out):
+            last_lam = lam_in
+            is_free[i_in] = False
+            w[i_in] = bound_in
+        else:
+            last_lam = lam_out
+            is_free[i_out] = True
+
+        free, bounded = np.flatnonzero(is_free), np.flatnonzero(~is_free)
+        solve_f = _psd_solver(cov[np.ix_(free, free)])
+        w_b = w[bounded]
+        w1 = solve_f(cov[np.ix_(free, bounded)] @ w_b)
+        c4, c2 = solve_f(np.ones(len(free))), solve_f(mean[free])
+        g = (-last_lam * c2.sum() + 1 - w_b.sum() + w1.sum()) / c4.sum()
+        w[free] = -w1 + g * c4 + last_lam * c2
+        corners.append(w.copy())
+        if last_lam == 0:
+            break
+        if on_corner is not None:
+            on_corner(list(corners))
+    else:
+        raise RuntimeError(f"La Línea Crítica no terminó en {max_iter} iteraciones.")
+
+    return _clean_corners(corners, original_mean, lower, upper)
+
+
+def _active_set_qp(cov, a, y0=None, max_iter=5000, tol=1e-12):
+    """
+    Resuelve min y'Σy sujeto a a'y = 1, y >= 0 con un método primal de conjunto activo.
+
+    cov es un modelo de covariance (DenseCovariance o FactorCovariance): solo se usan
+    Σ·y y la resolución de sistemas en el conjunto libre, así que con un modelo de
+    factores cada iteración cuesta O(N·k) en lugar de O(N²).
+
+    Cubre la mínima varianza (a = 1) y el máximo Sharpe (a = μ - rf, normalizando y
+    después) con pesos no negativos. Partir de y0, la solución de una estimación
+    parecida, suele dejar el conjunto activo casi resuelto desde la primera iteración.
+
+    Retorna:
+    - (y, iteraciones) o None si no converge o Σ no es definida positiva.
+    """
+    n = len(a)
+    if not cov.is_positive_definite():
+        return None
+
+    if y0 is not None and np.all(y0 >= 0) and a @ y0 > tol:
+        y = y0 / (a @ y0)
+    elif (a > tol).any():
+        k = int(np.argmax(a / np.sqrt(cov.diag())))
+        y = np.zeros(n)
+        y[k] = 1 / a[k]
+    else:
+        return None
+
+    free = y > 0
+    for iteration in range(1, max_iter + 1):
+        idx = np.flatnonzero(free)
+        try:
+            inv_a = cov.solve(a[idx], idx)
+        except np.linalg.LinAlgError:
+            return None
+        denom = a[idx] @ inv_a
+        if denom <= tol:
+            return None
+        target = inv_a / denom
+
+        blocking = target < -tol
+        if blocking.any():
+            # Paso hasta el primer activo que llega a cero; ese activo sale del conjunto libre
+            current = y[idx]
+            ratios = np.where(blocking, current / (current - target), np.inf)
+            j = int(np.argmin(ratios))
+            y[idx] = current + ratios[j] * (target - current)
+            y[idx[j]] = 0.0
+            free[idx[j]] = False
+            continue
+
+        y[:] = 0.0
+        y[idx] = np.maximum(target, 0.0)
+        # Condiciones KKT: Σy - ν·a >= 0 en los activos acotados, con ν = y'Σy
+        gradient = cov.matvec(y)
+        slack = gradient - (y @ gradient) * a
+        slack[free] = np.inf
+        i = int(np.argmin(slack))
+        if slack[i] >= -tol * max(1.0, abs(y @ gradient)):
+            return y, iteration
+        free[i] = True
+
+    return None
 
 
 class PortfolioOptimization:
@@ -13,112 +254,438 @@ class PortfolioOptimization:
     - Maximización del retorno esperado.
     """
 
-    def __init__(self, prices_df, selected_assets, objective="sharpe", risk_free_rate=0.02, constraint_set=(0, 1)):
+    def __init__(self, prices_df, selected_assets, objective="sharpe", risk_free_rate=0.02, constraint_set=(0, 1),
+                 start_date=None, end_date=None, frequency="D", stats_cache=None, covariance="sample",
+                 covariance_options=None, **constraints):
         """
         Inicializa la optimización del portafolio.
 
         Parámetros:
-        - prices_df (DataFrame): Datos históricos de precios de los activos.
+        - prices_df (DataFrame o PriceStore): Datos históricos de precios de los activos.
         - selected_assets (list): Lista de activos seleccionados.
         - objective (str): 'return', 'volatility' o 'sharpe'.
         - risk_free_rate (float): Tasa libre de riesgo (por defecto 0.02).
         - constraint_set (tuple): Límites de pesos de los activos (por defecto (0,1)).
+        - start_date, end_date (date): Ventana de estimación de retornos (por defecto todo el histórico).
+        - frequency (str): Frecuencia de los retornos: 'D', 'W' o 'M'.
+        - stats_cache (StatsCache): Caché de estadísticas (por defecto la compartida del proceso).
+        - covariance (str): Estimador de covarianza: 'sample', 'ledoit_wolf', 'ewma' o 'factor'.
+        - covariance_options (dict): Parámetros del estimador (halflife para 'ewma', n_factors para 'factor').
+        - constraints: Restricciones adicionales (ver _set_constraints): asset_bounds, group_bounds,
+          current_weights, max_turnover, max_volatility y solver.
         """
         if not selected_assets:
-            st.warning("⚠️ No seleccionaste ningún activo.")
-            return None
+            raise ValueError("⚠️ No seleccionaste ningún activo.")
+
+        # Media y covarianza anualizadas extraídas de la caché de estadísticas del universo
+        stats_cache = default_stats_cache if stats_cache is None else stats_cache
+        store = as_price_store(prices_df)
+        mean_returns, cov_matrix = stats_cache.get(store, selected_assets, start_date, end_date, frequency,
+                                                   covariance, covariance_options)
+        self._set_inputs(mean_returns, cov_matrix, selected_assets, objective, risk_free_rate, constraint_set)
+        self._set_constraints(**constraints)
 
-        self.returns = prices_df.set_index("DATE")[selected_assets].pct_change().dropna()
-        self.mean_returns = self.returns.mean() * 252  # Retornos esperados anualizados
-        self.cov_matrix = self.returns.cov() * 252  # Matriz de covarianza anualizada
+    @classmethod
+    def from_stats(cls, mean_returns, cov_matrix, objective="sharpe", risk_free_rate=0.02, constraint_set=(0, 1),
+                   **constraints):
+        """
+        Crea el optimizador directamente a partir de estadísticas ya calculadas.
+
+        Parámetros:
+        - mean_returns (Series): Retornos esperados anualizados indexados por activo.
+        - cov_matrix (DataFrame o FactorCovariance): Covarianza anualizada.
+        """
+        optimizer = cls.__new__(cls)
+        optimizer._set_inputs(mean_returns, cov_matrix, list(mean_returns.index), objective, risk_free_rate, constraint_set)
+        optimizer._set_constraints(**constraints)
+        return optimizer
+
+    def _set_inputs(self, mean_returns, cov_matrix, selected_assets, objective, risk_free_rate, constraint_set):
+        self.mean_returns = mean_returns
+        self.cov_matrix = cov_matrix
         self.selected_assets = selected_assets
         self.objective = objective
         self.risk_free_rate = risk_free_rate
         self.constraint_set = constraint_set
 
+        # Copias NumPy para evaluar objetivos y gradientes sin overhead de pandas. Los objetivos
+        # solo usan Σ·w del modelo, que con factores cuesta O(N·k)
+        self._mu = np.asarray(mean_returns, dtype=float)
+        self._cov_model = as_covariance_model(cov_matrix)
+        self._dense_cov = None
+
+    def _set_constraints(self, asset_bounds=None, group_bounds=None, current_weights=None, max_turnover=None,
+                         max_volatility=None, solver="auto"):
+        """
+        Restricciones adicionales a constraint_set.
+
+        - asset_bounds (dict): {activo: (mínimo, máximo)}; reemplaza constraint_set para esos activos.
+        - group_bounds (dict): {grupo: (activos, mínimo, máximo)} sobre la suma de pesos del grupo
+          (ver convex_optimization.group_bounds_from_dictionary).
+        - current_weights (dict): Pesos actuales {activo: peso}, base de la rotación.
+        - max_turnover (float): Máximo de Σ|w - w_actual|.
+        - max_volatility (float): Volatilidad anualizada máxima.
+        - solver (str): 'auto' (soluciones exactas si aplican, cvxpy con restricciones ricas),
+          'cvxpy' o 'slsqp'.
+        """
+        if solver not in ("auto", "cvxpy", "slsqp"):
+            raise ValueError("Solver no reconocido. Usa 'auto', 'cvxpy' o 'slsqp'.")
+        self.asset_bounds = dict(asset_bounds or {})
+        self.group_bounds = dict(group_bounds or {})
+        self.current_weights = current_weights
+        self.max_turnover = max_turnover
+        self.max_volatility = max_volatility
+        self.solver = solver
+        if solver == "slsqp" and self._has_rich_constraints():
+            raise ValueError("SLSQP no admite límites por grupo, rotación ni volatilidad máxima; usa solver='cvxpy'.")
+
+    def _has_rich_constraints(self):
+        return bool(self.group_bounds) or self.max_turnover is not None or self.max_volatility is not None
+
+    def _bound_arrays(self):
+        """ Límites inferior y superior por activo (±inf donde no hay límite). """
+        num_assets = len(self.selected_assets)
+        low, high = (-np.inf, np.inf) if self.constraint_set is None else self.constraint_set
+        lower, upper = np.full(num_assets, float(low)), np.full(num_assets, float(high))
+        for i, asset in enumerate(self.selected_assets):
+            if asset in self.asset_bounds:
+                lower[i], upper[i] = self.asset_bounds[asset]
+        return lower, upper
+
+    @property
+    def _cov(self):
+        """ Covarianza N x N explícita (con un modelo de factores se materializa una sola vez). """
+        if self._dense_cov is None:
+            self._dense_cov = self._cov_model.to_dense()
+        return self._dense_cov
+
     def _negative_sharpe(self, weights):
         """ Calcula el Sharpe Ratio negativo para maximización. """
-        portfolio_return = np.dot(weights, self.mean_returns)
-        portfolio_std = np.sqrt(np.dot(weights.T, np.dot(self.cov_matrix, weights)))
+        portfolio_return = np.dot(weights, self._mu)
+        portfolio_std = np.sqrt(np.dot(weights, self._cov_model.matvec(weights)))
         return -(portfolio_return - self.risk_free_rate) / portfolio_std  # Se multiplica por -1 para maximizar
 
+    def _negative_sharpe_grad(self, weights):
+        """ Gradiente analítico del Sharpe Ratio negativo. """
+        cov_w = self._cov_model.matvec(weights)
+        portfolio_std = np.sqrt(np.dot(weights, cov_w))
+        excess_return = np.dot(weights, self._mu) - self.risk_free_rate
+        return -self._mu / portfolio_std + excess_return * cov_w / portfolio_std ** 3
+
     def _portfolio_std(self, weights):
         """ Calcula la desviación estándar (volatilidad) del portafolio. """
-        return np.sqrt(np.dot(weights.T, np.dot(self.cov_matrix, weights)))
+        return np.sqrt(np.dot(weights, self._cov_model.matvec(weights)))
+
+    def _portfolio_std_grad(self, weights):
+        """ Gradiente analítico de la volatilidad del portafolio. """
+        cov_w = self._cov_model.matvec(weights)
+        return cov_w / np.sqrt(np.dot(weights, cov_w))
+
+    def _portfolio_variance(self, weights):
+        """ Calcula la varianza del portafolio. """
+        return np.dot(weights, self._cov_model.matvec(weights))
+
+    def _portfolio_variance_grad(self, weights):
+        """ Gradiente analítico de la varianza del portafolio. """
+        return 2 * self._cov_model.matvec(weights)
 
     def _negative_return(self, weights):
         """ Calcula el retorno negativo del portafolio para maximización. """
-        return -np.dot(weights, self.mean_returns)
+        return -np.dot(weights, self._mu)
 
-    def optimize(self):
-        """ Ejecuta la optimización según el objetivo seleccionado. """
+    def _negative_return_grad(self, weights):
+        """ Gradiente analítico del retorno negativo. """
+        return -self._mu
+
+    def _bounds(self):
+        """ Límites de pesos para cada activo (None si no hay límites). """
+        if self.constraint_set is None and not self.asset_bounds:
+            return None
+        lower, upper = self._bound_arrays()
+        return tuple((None if np.isinf(low) else low, None if np.isinf(high) else high) for low, high in zip(lower, upper))
+
+    def _budget_constraint(self):
+        """ Restricción de presupuesto: suma de pesos = 1, con su jacobiano. """
         num_assets = len(self.selected_assets)
-        constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1})  # Restricción: suma de pesos = 1
-        bounds = tuple(self.constraint_set for _ in range(num_assets))
+        return {'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones(num_assets)}
+
+    @profiler.timed("optimize.solve")
+    def solve(self, x0=None):
+        """
+        Resuelve el problema del objetivo seleccionado y retorna el resultado de SciPy.
+
+        x0 permite partir de una solución previa (por ejemplo, el rebalanceo anterior).
+
+        Con solver='auto' (por defecto) los casos con solución exacta no pasan por SLSQP:
+        máximo Sharpe y mínima volatilidad con pesos en [0, 1] se resuelven por conjunto activo
+        y máximo retorno con límites por activo por orden de retorno. El óptimo es el mismo
+        (o mejor, SLSQP se detiene por tolerancia); solver='slsqp' fuerza el cálculo anterior.
+        """
+        num_assets = len(self.selected_assets)
+        objectives = {
+            "sharpe": (self._negative_sharpe, self._negative_sharpe_grad),
+            "volatility": (self._portfolio_std, self._portfolio_std_grad),
+            "return": (self._negative_return, self._negative_return_grad),
+        }
 
         # Selección del objetivo
-        if self.objective == "sharpe":
-            result = sc.minimize(self._negative_sharpe, num_assets * [1. / num_assets], method='SLSQP', bounds=bounds, constraints=constraints)
-        elif self.objective == "volatility":
-            result = sc.minimize(self._portfolio_std, num_assets * [1. / num_assets], method='SLSQP', bounds=bounds, constraints=constraints)
-        elif self.objective == "return":
-            result = sc.minimize(self._negative_return, num_assets * [1. / num_assets], method='SLSQP', bounds=bounds, constraints=constraints)
-        else:
+        if self.objective not in objectives:
             raise ValueError("Objetivo no reconocido. Usa 'return', 'volatility' o 'sharpe'.")
+        fun, jac = objectives[self.objective]
+
+        if self.solver == "cvxpy" or (self.solver == "auto" and self._has_rich_constraints()):
+            return self._solve_convex(fun, jac)
+
+        lower, upper = self._bound_arrays()
+        exact = self.solver == "auto"
+
+        # Pesos en [0, 1]: mínima varianza y máximo Sharpe son QP con solución exacta por conjunto activo
+        if exact and self.objective in ("sharpe", "volatility") and (lower == 0).all() and (upper >= 1).all():
+            a = self._mu - self.risk_free_rate if self.objective == "sharpe" else np.ones(num_assets)
+            solution = _active_set_qp(self._cov_model, a, x0)
+            if solution is not None:
+                y, iterations = solution
+                weights = y / y.sum()
+                profiler.count("optimize.active_set")
+                profiler.count("optimize.iterations", iterations)
+                return sc.OptimizeResult(x=weights, fun=fun(weights), jac=jac(weights), success=True, status=0,
+                                         nit=iterations, nfev=1, message="Solución exacta por conjunto activo")
+
+        # Máximo retorno con límites por activo: problema lineal con solución exacta por orden de retorno
+        if exact and self.objective == "return" and np.isfinite(lower).all() and np.isfinite(upper).all() \
+                and lower.sum() <= 1 <= upper.sum():
+            weights = self._max_return_weights()
+            return sc.OptimizeResult(x=weights, fun=fun(weights), jac=jac(weights), success=True, status=0,
+                                     nit=0, nfev=1, message="Solución exacta por orden de retorno")
+
+        # Con límites por activo generales el QP convexo escala mejor que SLSQP
+        if self.solver == "auto" and self.objective != "return" and self.asset_bounds:
+            result = self._solve_convex(fun, jac)
+            if result is not None:
+                return result
+
+        if x0 is None:
+            x0 = np.full(num_assets, 1. / num_assets)
+        result = sc.minimize(fun, x0, jac=jac, method='SLSQP',
+                             bounds=self._bounds(), constraints=[self._budget_constraint()])
+        profiler.count("optimize.slsqp")
+        profiler.count("optimize.iterations", result.nit)
+        profiler.count("optimize.evaluations", result.nfev)
+        return result
+
+    def _solve_convex(self, fun, jac):
+        """
+        Resuelve con el backend cvxpy (convex_optimization), reutilizando el problema compilado.
+
+        Retorna None si cvxpy no está instalado y no hay restricciones que lo exijan.
+        """
+        if importlib.util.find_spec("cvxpy") is None:
+            if self._has_rich_constraints() or self.solver == "cvxpy":
+                raise ImportError("Las restricciones por grupo, rotación o volatilidad requieren cvxpy.")
+            return None
+        from convex_optimization import covariance_factor, default_problem_cache
+
+        num_assets = len(self.selected_assets)
+        index = {asset: i for i, asset in enumerate(self.selected_assets)}
+        lower, upper = self._bound_arrays()
+        # cvxpy no acepta infinitos en parámetros: un límite de 1000 veces el capital equivale a no tener límite
+        lower, upper = np.clip(lower, -1e3, 1e3), np.clip(upper, -1e3, 1e3)
+
+        group_matrix = group_lower = group_upper = None
+        if self.group_bounds:
+            group_matrix = np.zeros((len(self.group_bounds), num_assets))
+            group_lower, group_upper = np.empty(len(self.group_bounds)), np.empty(len(self.group_bounds))
+            for g, (members, low, high) in enumerate(self.group_bounds.values()):
+                group_matrix[g, [index[asset] for asset in members if asset in index]] = 1.0
+                group_lower[g], group_upper[g] = low, high
+
+        current = None
+        if self.max_turnover is not None:
+            current = np.array([(self.current_weights or {}).get(asset, 0.0) for asset in self.selected_assets])
+
+        factor, specific = covariance_factor(self._cov_model)
+        problem = default_problem_cache.get(num_assets, len(factor), self.objective, group_matrix,
+                                            self.max_turnover is not None, self.max_volatility is not None,
+                                            specific is not None)
+        weights, status, iterations = problem.solve(
+            self._mu, factor, lower, upper, self.risk_free_rate, group_lower, group_upper,
+            current, self.max_turnover, self.max_volatility, specific=specific)
+
+        profiler.count("optimize.cvxpy")
+        profiler.count("optimize.iterations", iterations)
+        if weights is None:
+            return sc.OptimizeResult(x=np.full(num_assets, np.nan), fun=np.nan, success=False, status=2,
+                                     nit=iterations, nfev=0, message=f"cvxpy: {status}")
+        return sc.OptimizeResult(x=weights, fun=fun(weights), jac=jac(weights), success=True, status=0,
+                                 nit=iterations, nfev=1, message=f"cvxpy: {status}")
+
+    def optimize(self):
+        """ Ejecuta la optimización según el objetivo seleccionado. """
+        result = self.solve()
 
         if result.success:
             optimized_weights = dict(zip(self.selected_assets, result.x))
             return optimized_weights
         else:
-            st.warning("⚠️ No se encontró una solución óptima.")
+            logger.warning("No se encontró una solución óptima: %s", result.message)
             return None
 
-    def plot_efficient_frontier(self):
-        """ Genera y grafica la Frontera Eficiente. """
-        risk_levels = np.linspace(0.05, 0.5, 50)
-        optimal_returns = []
+    def _min_variance_weights(self):
+        """ Pesos del portafolio de mínima varianza. """
+        num_assets = len(self.selected_assets)
+        if self._bounds() is None:
+            inv_ones = _psd_solver(self._cov)(np.ones(num_assets))
+            return inv_ones / inv_ones.sum()
+        result = sc.minimize(self._portfolio_variance, np.full(num_assets, 1. / num_assets), jac=self._portfolio_variance_grad,
+                             method='SLSQP', bounds=self._bounds(), constraints=[self._budget_constraint()])
+        return result.x
+
+    def _max_return(self):
+        """
+        Retorno del extremo superior de la frontera.
 
-        for risk in risk_levels:
-            num_assets = len(self.selected_assets)
-            weights = np.ones(num_assets) / num_assets
+        Con límites por activo es el máximo alcanzable. Sin límites el retorno no tiene máximo
+        (basta apalancarse), así que la frontera se corta donde su volatilidad iguala la del
+        activo más volátil, el mismo rango de riesgo que cubren los activos.
+        """
+        if self._bounds() is not None:
+            return np.dot(self._max_return_weights(), self._mu)
+        a, b, c = self._closed_form_coefficients()[:3]
+        d = a * c - b ** 2
+        max_variance = self._cov_model.diag().max()
+        # σ²(t) = (a·t² - 2·b·t + c) / d en la frontera sin límites
+        return (b + np.sqrt(max(b ** 2 - a * (c - d * max_variance), 0.0))) / a
+
+    def _closed_form_coefficients(self):
+        """ Constantes de la frontera analítica: a = 1'Σ⁻¹1, b = 1'Σ⁻¹μ, c = μ'Σ⁻¹μ, Σ⁻¹1 y Σ⁻¹μ. """
+        solve = _psd_solver(self._cov)
+        ones = np.ones(len(self.selected_assets))
+        inv_ones, inv_mu = solve(ones), solve(self._mu)
+        return ones @ inv_ones, ones @ inv_mu, self._mu @ inv_mu, inv_ones, inv_mu
+
+    def _max_return_weights(self):
+        """ Pesos de máximo retorno con límites por activo: se llenan primero los activos de mayor retorno. """
+        lower, upper = self._bound_arrays()
+        weights = lower.copy()
+        remaining = 1 - weights.sum()
+        for i in np.argsort(-self._mu):
+            step = min(upper[i] - lower[i], remaining)
+            weights[i] += step
+            remaining -= step
+            if remaining <= 0:
+                break
+        return weights
+
+    def _frontier_slsqp(self, targets, x0, progress=None):
+        """ Frontera por SLSQP con gradientes analíticos y arranque en caliente desde el punto anterior. """
+        bounds = self._bounds()
+        weights = np.full((len(targets), len(self.selected_assets)), np.nan)
+        x = x0
+
+        for i, target in enumerate(targets):
             constraints = [
-                {'type': 'eq', 'fun': lambda x: np.sum(x) - 1},  # Suma de pesos = 1
-                {'type': 'ineq', 'fun': lambda x: risk - np.sqrt(np.dot(x.T, np.dot(self.cov_matrix, x)))}
+                self._budget_constraint(),
+                {'type': 'ineq', 'fun': lambda w, t: np.dot(w, self._mu) - t,
+                 'jac': lambda w, t: self._mu, 'args': (target,)},  # Retorno mínimo exigido
             ]
-            bounds = tuple(self.constraint_set for _ in range(num_assets))
+            result = sc.minimize(self._portfolio_variance, x, jac=self._portfolio_variance_grad, method='SLSQP',
+                                 bounds=bounds, constraints=constraints)
+            if result.success:
+                weights[i] = result.x
+                x = result.x
+            if progress is not None:
+                # La frontera parcial se arma solo si alguien la consulta (ver efficient_frontier)
+                solved = weights[:i + 1].copy()
+                progress(i + 1, len(targets), lambda solved=solved: self._frontier_frame(solved))
 
-            result = sc.minimize(self._negative_return, weights, method='SLSQP', bounds=bounds, constraints=constraints)
+        return weights
 
-            if result.success:
-                optimal_returns.append(-result.fun)  # Multiplicado por -1 para reflejar el retorno real
-            else:
-                optimal_returns.append(None)
-
-        # Filtrar valores inválidos
-        risk_levels_filtered = [r for r, ret in zip(risk_levels, optimal_returns) if ret is not None]
-        optimal_returns_filtered = [ret for ret in optimal_returns if ret is not None]
-
-        if not risk_levels_filtered:
-            st.warning("⚠️ No se pudo calcular la frontera eficiente.")
-            return
-
-        # Crear gráfico con Plotly
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=risk_levels_filtered,
-            y=optimal_returns_filtered,
-            mode='lines',
-            name='Frontera Eficiente',
-            line=dict(color='green', width=2)
-        ))
-
-        # Personalizar gráfico
-        fig.update_layout(
-            title="📈 Frontera Eficiente de Portafolio",
-            xaxis_title="Riesgo (Volatilidad Anualizada)",
-            yaxis_title="Retorno Esperado",
-            template="plotly_white"
-        )
-
-        # Mostrar en Streamlit
-        st.plotly_chart(fig, use_container_width=True)
+    def _interpolate_corners(self, corners, n_points):
+        """ Puntos de la frontera interpolando las esquinas (de mayor a menor retorno) para cada retorno objetivo. """
+        # Retornos crecientes para interpolar tramo a tramo
+        corners = corners[::-1]
+        corner_returns = corners @ self._mu
+        targets = np.linspace(corner_returns[0], corner_returns[-1], n_points)
+        weights = np.empty((n_points, len(self.selected_assets)))
+        for j in range(weights.shape[1]):
+            weights[:, j] = np.interp(targets, corner_returns, corners[:, j])
+        return weights
+
+    def _frontier_critical_line(self, n_points, progress=None):
+        """
+        Frontera por la Línea Crítica: se interpolan los portafolios esquina para cada retorno objetivo.
+
+        Con progress, cada esquina nueva informa la frontera parcial (desde el máximo retorno
+        hasta la esquina) como función que la arma al consultarla; el total no se conoce de antemano.
+        """
+        lower, upper = self._bound_arrays()
+        on_corner = None if progress is None else lambda corners: progress(
+            len(corners), None, lambda: self._frontier_frame(
+                self._interpolate_corners(_clean_corners(corners, self._mu, lower, upper), n_points)))
+        corners = _critical_line(self._mu, self._cov, lower, upper, on_corner=on_corner)
+        return self._interpolate_corners(corners, n_points)
+
+    def _frontier_closed_form(self, targets):
+        """ Frontera analítica de Markowitz (solo restricción de presupuesto, sin límites por activo). """
+        a, b, c, inv_ones, inv_mu = self._closed_form_coefficients()
+        d = a * c - b ** 2
+        # w(t) = g + h * t, evaluado para todos los retornos objetivo a la vez
+        g = (c * inv_ones - b * inv_mu) / d
+        h = (a * inv_mu - b * inv_ones) / d
+        return g[None, :] + np.asarray(targets)[:, None] * h[None, :]
+
+    @profiler.timed("optimize.frontier")
+    def efficient_frontier(self, n_points=50, method="auto", progress=None):
+        """
+        Calcula la Frontera Eficiente como datos.
+
+        Parámetros:
+        - n_points (int): Número de puntos de la frontera.
+        - method (str): 'auto' (analítico según las restricciones),
+          'slsqp' (gradientes analíticos y arranque en caliente), 'critical_line'
+          (Línea Crítica con límites por activo) o 'closed_form' (solo sin límites por activo).
+          La frontera respeta constraint_set y asset_bounds; las restricciones por grupo,
+          rotación y volatilidad máxima no se aplican.
+        - progress (callable): progress(listos, total, frontera parcial). La frontera parcial es
+          una función sin argumentos que retorna el DataFrame (se arma solo si se consulta).
+          Se llama después de cada punto con 'slsqp' y de cada esquina con 'critical_line'
+          (total None: el número de esquinas no se conoce); al terminar se informa la frontera final.
+
+        Retorna:
+        - DataFrame con columnas 'risk' y 'return' y los pesos de cada activo por punto.
+          Los puntos sin solución se omiten.
+        """
+        bounded = self._bounds() is not None
+        if method == "auto":
+            method = "critical_line" if bounded else "closed_form"
+
+        if method == "slsqp":
+            min_var_weights = self._min_variance_weights()
+            targets = np.linspace(np.dot(min_var_weights, self._mu), self._max_return(), n_points)
+            weights = self._frontier_slsqp(targets, min_var_weights, progress)
+        elif method == "critical_line":
+            lower, upper = self._bound_arrays()
+            if not (np.isfinite(lower).all() and np.isfinite(upper).all()):
+                raise ValueError("La Línea Crítica requiere límites finitos para todos los activos.")
+            weights = self._frontier_critical_line(n_points, progress)
+        elif method == "closed_form":
+            if bounded:
+                raise ValueError("La solución analítica solo aplica sin límites por activo (constraint_set=None).")
+            targets = np.linspace(np.dot(self._min_variance_weights(), self._mu), self._max_return(), n_points)
+            weights = self._frontier_closed_form(targets)
+        else:
+            raise ValueError("Método no reconocido. Usa 'auto', 'slsqp', 'critical_line' o 'closed_form'.")
+
+        frontier = self._frontier_frame(weights)
+        if progress is not None and method != "slsqp":
+            progress(len(weights), len(weights), lambda: frontier)
+        return frontier
+
+    def _frontier_frame(self, weights):
+        """ Puntos de la frontera (riesgo, retorno y pesos), omitiendo los que no tienen solución. """
+        solved = ~np.isnan(weights).any(axis=1)
+        weights = weights[solved]
+        frontier = pd.DataFrame(weights, columns=self.selected_assets)
+        frontier.insert(0, "return", weights @ self._mu)
+        frontier.insert(0, "risk", np.sqrt(np.einsum("ij,ji->i", weights, self._cov_model.matvec(weights.T))))
+        return frontier
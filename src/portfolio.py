@@ -1,92 +1,466 @@
+import logging
+
+import numpy as np
 import pandas as pd
 
+from price_store import ffill_matrix, as_price_store
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+def _purchase(store, ticker, percentage, capital, start_date=None):
+    """
+    Compra inicial de un activo: precio y cantidad para un porcentaje del capital.
+
+    Retorna (start_date, price, quantity, allocated_amount) o None si el ticker nunca tuvo precio.
+    """
+    if not (0 < percentage <= 100):
+        raise ValueError("El porcentaje debe estar entre 0 y 100.")
+
+    col = store.ticker_index(ticker)
+
+    # Si no se proporciona start_date, tomar la primera fecha válida del ticker
+    if start_date is None:
+        first_date = store.first_valid_date(ticker)
+        if first_date is None:
+            logger.warning("%s nunca ha tenido datos de precio. No se agregará al portafolio.", ticker)
+            return None  # No agregar el activo
+        start_date = first_date.date()  # Primera fecha donde el ticker tiene datos
+        price = float(store.values[store.validity.first_row[col], col])
+    else:
+        # Fechas sin precio (feriados, fines de semana) usan el último precio válido anterior
+        quote = store.asof(ticker, start_date)
+        if quote is None:
+            raise ValueError(f"⚠️ {ticker} no tiene precios en o antes de {start_date}.")
+        start_date, price = quote[0].date(), quote[1]
+
+    allocated_amount = (capital * percentage) / 100  # Monto a invertir
+    quantity = allocated_amount / price  # Cantidad de unidades compradas
+    return start_date, price, quantity, allocated_amount
+
+
+class Holdings:
+    """
+    Posiciones de un portafolio como estructura de arreglos.
+
+    Cada posición ocupa una fila de los arreglos NumPy (cantidad, precio y monto de compra,
+    moneda de compra, porcentaje y fecha de inicio); `tickers` guarda el nombre y un
+    diccionario da su fila. La cantidad son unidades del activo, así que el valor se obtiene
+    en cualquier moneda base; el precio y el monto quedan en la moneda en que se compró
+    ("" si los precios no estaban convertidos a una moneda base).
+    Agregar usa capacidad amortizada, quitar mueve la última fila al hueco y actualizar
+    escribe en la fila: las tres operaciones son O(1). Un ticker repetido se acumula en su
+    posición existente.
+    """
+
+    __slots__ = ("tickers", "quantity", "price", "cost", "currency", "percentage", "start_date", "_size",
+                 "_position", "_columns")
+
+    _FIELDS = ("quantity", "price", "cost", "currency", "percentage", "start_date")
+
+    def __init__(self, capacity=8):
+        self.tickers = []
+        self.quantity = np.empty(capacity)
+        self.price = np.empty(capacity)
+        self.cost = np.empty(capacity)
+        self.currency = np.full(capacity, "", dtype="U3")
+        self.percentage = np.empty(capacity)
+        self.start_date = np.empty(capacity, dtype="datetime64[D]")
+        self._size = 0
+        self._position = {}
+        self._columns = None  # (versión del almacén, columnas de los tickers en el almacén)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, ticker):
+        return ticker in self._position
+
+    def _grow(self):
+        capacity = max(8, 2 * len(self.quantity))
+        for field in self._FIELDS:
+            array = getattr(self, field)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            setattr(self, field, grown)
+
+    def add(self, ticker, quantity, price, cost, percentage, start_date, currency=""):
+        """Agrega una posición (o la acumula si el ticker ya está) y retorna su fila."""
+        i = self._position.get(ticker)
+        if i is not None:
+            if self.currency[i] != currency:
+                raise ValueError(f"⚠️ {ticker} ya se compró en {self.currency[i] or 'la moneda de origen'}: "
+                                 f"no se puede acumular una compra en {currency or 'la moneda de origen'}.")
+            self.quantity[i] += quantity
+            self.cost[i] += cost
+            self.percentage[i] += percentage
+            self.price[i] = self.cost[i] / self.quantity[i]  # Precio promedio de compra
+            self.start_date[i] = min(self.start_date[i], np.datetime64(start_date, "D"))
+            return i
+
+        if self._size == len(self.quantity):
+            self._grow()
+        i = self._size
+        self.quantity[i], self.price[i], self.cost[i], self.currency[i] = quantity, price, cost, currency
+        self.percentage[i], self.start_date[i] = percentage, np.datetime64(start_date, "D")
+        self.tickers.append(ticker)
+        self._position[ticker] = i
+        self._size += 1
+        self._columns = None
+        return i
+
+    def remove(self, ticker):
+        """Quita una posición moviendo la última fila a su lugar."""
+        i = self._position.pop(ticker)
+        last = self._size - 1
+        if i != last:
+            for field in self._FIELDS:
+                array = getattr(self, field)
+                array[i] = array[last]
+            self.tickers[i] = self.tickers[last]
+            self._position[self.tickers[i]] = i
+        self.tickers.pop()
+        self._size = last
+        self._columns = None
+
+    def update(self, ticker, **fields):
+        """Actualiza campos de una posición (quantity, price, cost, currency, percentage, start_date)."""
+        i = self._position[ticker]
+        for field, value in fields.items():
+            if field not in self._FIELDS:
+                raise ValueError(f"Campo no reconocido: {field}.")
+            getattr(self, field)[i] = value
+
+    def view(self, field):
+        """Arreglo de un campo limitado a las posiciones existentes (sin copia)."""
+        return getattr(self, field)[:self._size]
+
+    def columns(self, store):
+        """Columnas de los tickers en el almacén (-1 si no está), calculadas una vez por versión."""
+        if self._columns is None or self._columns[0] != store.version:
+            columns = np.array([store.ticker_index(t) if t in store else -1 for t in self.tickers], dtype=np.int64)
+            self._columns = (store.version, columns)
+        return self._columns[1]
+
+    def record(self, i):
+        """Posición de la fila i como diccionario (el formato histórico de Portfolio.assets)."""
+        return {
+            "ticker": self.tickers[i],
+            "percentage": float(self.percentage[i]),
+            "cantidad": float(self.quantity[i]),
+            "initial_price": float(self.price[i]),
+            "initial_value": float(self.cost[i]),
+            "currency": str(self.currency[i]),
+            "start_date": pd.Timestamp(self.start_date[i]).date(),
+        }
+
+    def records(self):
+        """Posiciones como lista de diccionarios."""
+        return [self.record(i) for i in range(self._size)]
+
+    def to_dict(self):
+        """Serialización compacta (listas por campo) para session_state o JSON."""
+        data = {"tickers": list(self.tickers)}
+        for field in self._FIELDS:
+            data[field] = self.view(field).tolist() if field != "start_date" else self.view(field).astype(str).tolist()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        holdings = cls(capacity=max(8, len(data["tickers"])))
+        n = len(data["tickers"])
+        for field in cls._FIELDS:
+            if field in data:  # Serializaciones anteriores no traen la moneda de compra
+                getattr(holdings, field)[:n] = np.asarray(data[field], dtype=getattr(holdings, field).dtype)
+        holdings.tickers = list(data["tickers"])
+        holdings._position = {ticker: i for i, ticker in enumerate(holdings.tickers)}
+        holdings._size = n
+        return holdings
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        restored = Holdings.from_dict(state)
+        for slot in Holdings.__slots__:
+            setattr(self, slot, getattr(restored, slot))
+
+
 class Portfolio:
+    __slots__ = ("initial_capital", "holdings", "_records")
+
     def __init__(self, initial_capital=1000):
         self.initial_capital = initial_capital
-        self.assets = []  # Lista de activos con su % de inversión y cantidad comprada
+        self.holdings = Holdings()  # Activos con su % de inversión y cantidad comprada
+        self._records = None
+
+    @property
+    def assets(self):
+        """Vista de compatibilidad: lista de diccionarios por activo."""
+        return self.list_assets()
+
+    def add_asset(self, ticker, percentage, prices_df, start_date=None, currency=None):
+        """
+        Añade un activo al portafolio asignando un porcentaje del capital inicial. Retorna el activo agregado o None.
 
-    def add_asset(self, ticker, percentage, prices_df, start_date=None):
-        """Añade un activo al portafolio asignando un porcentaje del capital inicial."""
+        currency es la moneda de los precios (y del capital) de la compra; por defecto la del
+        almacén convertido (PriceStore.currency). Se guarda con la posición para que cambiar la
+        moneda de reporte no re-etiquete el precio y el monto de compra.
+        """
         ticker = ticker.upper().strip()
+        store = as_price_store(prices_df)
+        currency = (currency or store.currency or "").upper()
 
-        if not (0 < percentage <= 100):
-            raise ValueError("El porcentaje debe estar entre 0 y 100.")
+        purchase = _purchase(store, ticker, percentage, self.initial_capital, start_date)
+        if purchase is None:
+            return None
+        start_date, price, quantity, allocated_amount = purchase
 
-        # Si no se proporciona start_date, tomar la primera fecha válida del ticker
-        if start_date is None:
-            valid_dates = prices_df.loc[~prices_df[ticker].isna(), "DATE"]
-            if valid_dates.empty:
-                print(f"⚠️ {ticker} nunca ha tenido datos de precio. No se agregará al portafolio.")
-                return  # No agregar el activo
-            start_date = valid_dates.min().date()  # Primera fecha donde el ticker tiene datos
+        i = self.holdings.add(ticker, quantity, price, allocated_amount, percentage, start_date, currency)
+        self._records = None
 
-        start_row = prices_df[prices_df["DATE"].dt.date == start_date].iloc[0]
+        logger.info("%s: Asignados $%.2f, Precio inicial: $%.2f, Cantidad: %.4f, Fecha inicio: %s",
+                    ticker, allocated_amount, price, quantity, start_date)
+        return self.holdings.record(i)
 
-        price = start_row[ticker]
-        allocated_amount = (self.initial_capital * percentage) / 100  # Monto a invertir
-        quantity = allocated_amount / price  # Cantidad de unidades compradas
+    def remove_asset(self, ticker):
+        """Quita un activo del portafolio."""
+        self.holdings.remove(ticker.upper().strip())
+        self._records = None
 
-        self.assets.append({
-            "ticker": ticker,
-            "percentage": percentage,
-            "cantidad": quantity,
-            "initial_price": price,
-            "initial_value": allocated_amount,
-            "start_date": start_date  # Guardamos la fecha inicial válida
-        })
+    def update_asset(self, ticker, **fields):
+        """Actualiza campos de un activo (ver Holdings.update)."""
+        self.holdings.update(ticker.upper().strip(), **fields)
+        self._records = None
 
-        print(f"✅ {ticker}: Asignados ${allocated_amount:.2f}, Precio inicial: ${price:.2f}, Cantidad: {quantity:.4f}, Fecha inicio: {start_date}")
+    def to_dict(self):
+        """Serialización compacta del portafolio (capital y posiciones por campo)."""
+        return {"initial_capital": self.initial_capital, "holdings": self.holdings.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        portfolio = cls(data["initial_capital"])
+        portfolio.holdings = Holdings.from_dict(data["holdings"])
+        return portfolio
 
     def list_assets(self):
-        """Lista los activos en el portafolio."""
-        return self.assets
+        """Lista los activos en el portafolio (se arma una vez por cambio de las posiciones)."""
+        if self._records is None:
+            self._records = self.holdings.records()
+        return self._records
+
+    @profiler.timed("portfolio.value_series")
+    def value_series(self, prices_df, start_date=None, end_date=None, nan_policy="skip"):
+        """
+        Calcula la serie de valor del portafolio para todas las fechas entre start_date y end_date.
+
+        Se arma un vector de cantidades y una matriz de precios alineada (fechas x activos),
+        y el valor de cada fecha es un único producto matriz-vector.
+
+        Parámetros:
+        - prices_df (DataFrame o PriceStore): Datos históricos de precios.
+        - start_date, end_date (date): Rango de fechas (inclusive). None = sin límite.
+        - nan_policy (str): 'skip' ignora los activos sin precio en la fecha,
+          'ffill' usa el último precio válido anterior (hasta MAX_STALENESS_DAYS días, ver PriceStore.matrix).
+
+        Retorna:
+        - Series con el valor total del portafolio indexada por fecha.
+        """
+        if nan_policy not in ("skip", "ffill"):
+            raise ValueError("nan_policy no reconocido. Usa 'skip' o 'ffill'.")
 
+        store = as_price_store(prices_df)
+        columns = self.holdings.columns(store)
+        held = columns >= 0
+        tickers = [store.tickers[col] for col in columns[held]]
+        quantities = self.holdings.view("quantity")[held]
+
+        dates, prices = store.matrix(tickers, start_date, end_date, ffill=(nan_policy == "ffill"))
+        values = np.nan_to_num(prices, nan=0.0) @ quantities
+
+        return pd.Series(values, index=pd.DatetimeIndex(dates, name="DATE"), name="value")
+
+    @profiler.timed("portfolio.simulate")
     def simulate(self, prices_df, date):
-        """Calcula el valor actual del portafolio basado en los precios de los activos en una fecha específica."""
-        if date not in prices_df["DATE"].dt.date.values:
+        """
+        Calcula el valor actual del portafolio basado en los precios de los activos en una fecha específica.
+
+        Si la fecha no es un día hábil se usa la fecha disponible anterior.
+        """
+        store = as_price_store(prices_df)
+        pos = store.snap(date)
+        if pos is None:
             raise ValueError(f"⚠️ La fecha {date} no está disponible en los datos.")
 
-        row = prices_df[prices_df["DATE"].dt.date == date].iloc[0]
-        total_value = 0
-        print(f"\n📅 Simulación del portafolio en {date}:")
-
-        for asset in self.assets:
-            ticker = asset["ticker"]
-            cantidad = asset["cantidad"]
-            initial_value = asset["initial_value"]
-
-            if ticker in row.index and not pd.isna(row[ticker]):
-                price = row[ticker]
-                current_value = price * cantidad
-                total_value += current_value
-                
-                print(f"📈 {ticker}: Cantidad: {cantidad:.4f}, Precio actual: ${price:.2f}, Valor actual: ${current_value:.2f} (vs ${initial_value:.2f} inicial)")
-            else:
-                print(f"⚠️ {ticker}: No se encontró precio para esta fecha.")
-
-        print(f"💰 Valor total del portafolio en {date}: ${total_value:.2f}")
+        values = self.value_series(store, store.dates[pos], store.dates[pos])
+        total_value = float(values.iloc[0])
+        logger.debug("Valor total del portafolio en %s: $%.2f", date, total_value)
         return total_value
 
-    def calculate_returns(self, prices_df, start_date, end_date):
-        """Calcula el rendimiento del portafolio entre dos fechas."""
-        
-        if start_date not in prices_df["DATE"].dt.date.values or end_date not in prices_df["DATE"].dt.date.values:
-            raise ValueError("Una de las fechas seleccionadas no está disponible en los datos.")
+    def current_weights(self, prices_df, date=None):
+        """
+        Pesos actuales de las posiciones a valor de mercado: cantidad × último precio en o antes
+        de date (por defecto la última fecha del almacén), normalizados para sumar 1.
 
-        print(f"\n📊 Calculando rendimiento del portafolio de {start_date} a {end_date}...")
+        Los porcentajes de compra no sirven como pesos actuales: cambian con los precios.
+        Retorna un diccionario vacío si ninguna posición tiene precio.
+        """
+        store = as_price_store(prices_df)
+        date = store.dates[-1] if date is None else date
+        values = {}
+        for ticker, quantity in zip(self.holdings.tickers, self.holdings.view("quantity")):
+            try:
+                quote = store.asof(ticker, date) if ticker in store else None
+            except ValueError as e:
+                # Un activo que dejó de cotizar no tiene valor de mercado actual
+                logger.warning("%s", e)
+                quote = None
+            values[ticker] = float(quantity) * quote[1] if quote is not None else 0.0
+        total = sum(values.values())
+        if total <= 0:
+            return {}
+        return {ticker: value / total for ticker, value in values.items()}
 
-        start_value = self.simulate(prices_df, start_date)
-        end_value = self.simulate(prices_df, end_date)
+    @profiler.timed("portfolio.calculate_returns")
+    def calculate_returns(self, prices_df, start_date, end_date):
+        """Calcula el rendimiento del portafolio entre dos fechas (ajustadas a la fecha disponible anterior)."""
+        store = as_price_store(prices_df)
+        start_row, end_row = store.snap(start_date), store.snap(end_date)
+        if start_row is None or end_row is None or start_row > end_row:
+            raise ValueError("Una de las fechas seleccionadas no está disponible en los datos.")
 
-        print(f"🔍 Valor inicial: ${start_value:.2f}, Valor final: ${end_value:.2f}")
+        values = self.value_series(store, store.dates[start_row], store.dates[end_row])
+        start_value = float(values.iloc[0])
+        end_value = float(values.iloc[-1])
 
         if start_value == 0:
-            print("⚠️ El valor inicial del portafolio es 0, no se puede calcular el rendimiento.")
+            logger.warning("El valor inicial del portafolio es 0, no se puede calcular el rendimiento.")
             return None  # Evitar división por cero
-        
-        # Corrección: Asegurar que se calcula el rendimiento correctamente
+
         returns = ((end_value - start_value) / start_value) * 100
-        print(f"📉 Rendimiento total del portafolio: {returns:.2f}%")
+        logger.debug("Rendimiento del portafolio de %s a %s: %.2f%% ($%.2f -> $%.2f)",
+                     start_date, end_date, returns, start_value, end_value)
 
         return returns
 
+
+class PortfolioBook:
+    """
+    Libro de K portafolios almacenado como una matriz densa de cantidades K x N.
+
+    Las columnas son los tickers del PriceStore, de modo que todas las series de valor
+    se obtienen con un producto matricial contra la matriz de precios T x N, procesada
+    por bloques de fechas para acotar la memoria.
+    """
+
+    def __init__(self, prices_df, initial_capital=1000):
+        self.store = as_price_store(prices_df)
+        self.initial_capital = initial_capital
+        self.ids = []
+        self._rows = []
+        self._quantities = None  # Matriz K x N construida bajo demanda
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_portfolios(cls, prices_df, portfolios):
+        """Construye el libro a partir de objetos Portfolio existentes (dict id -> Portfolio)."""
+        book = cls(prices_df)
+        for portfolio_id, portfolio in portfolios.items():
+            holdings = portfolio.holdings
+            row = np.zeros(len(book.store.tickers))
+            np.add.at(row, [book.store.ticker_index(ticker) for ticker in holdings.tickers], holdings.view("quantity"))
+            book._append(portfolio_id, row)
+        return book
+
+    def _append(self, portfolio_id, row):
+        self.ids.append(portfolio_id)
+        self._rows.append(row)
+        self._quantities = None
+        return len(self.ids) - 1
+
+    def add_portfolio(self, portfolio_id, allocations, start_date=None, initial_capital=None):
+        """
+        Agrega un portafolio con la misma semántica que Portfolio.add_asset.
+
+        Parámetros:
+        - portfolio_id: Identificador del portafolio.
+        - allocations (dict): Ticker -> porcentaje, o ticker -> (porcentaje, start_date) para fechas por activo.
+        - start_date (date): Fecha de compra común (por defecto la primera fecha válida de cada activo).
+        - initial_capital (float): Capital del portafolio (por defecto el del libro).
+
+        Retorna:
+        - Fila del portafolio en la matriz de cantidades.
+        """
+        capital = self.initial_capital if initial_capital is None else initial_capital
+        row = np.zeros(len(self.store.tickers))
+        for ticker, allocation in allocations.items():
+            ticker = ticker.upper().strip()
+            percentage, asset_start = allocation if isinstance(allocation, (tuple, list)) else (allocation, start_date)
+            purchase = _purchase(self.store, ticker, percentage, capital, asset_start)
+            if purchase is not None:
+                row[self.store.ticker_index(ticker)] += purchase[2]
+        return self._append(portfolio_id, row)
+
+    @property
+    def quantities(self):
+        """Matriz densa de cantidades K x N."""
+        if self._quantities is None:
+            self._quantities = np.vstack(self._rows) if self._rows else np.zeros((0, len(self.store.tickers)))
+        return self._quantities
+
+    @profiler.timed("book.iter_values")
+    def iter_values(self, start_date=None, end_date=None, nan_policy="skip", chunk_size=2048):
+        """
+        Genera las series de valor por bloques de fechas.
+
+        Retorna:
+        - Generador de (dates, values), con values de forma (fechas del bloque) x K.
+        """
+        if nan_policy not in ("skip", "ffill"):
+            raise ValueError("nan_policy no reconocido. Usa 'skip' o 'ffill'.")
+
+        # Solo intervienen los tickers que algún portafolio tiene
+        active = np.flatnonzero(self.quantities.any(axis=0))
+        weights = self.quantities[:, active].T  # N_activos x K
+        lo, hi = self.store.date_range(start_date, end_date)
+
+        carry = None
+        if nan_policy == "ffill" and lo > 0:
+            # Último precio válido anterior al rango, para arrastrarlo al primer bloque: se busca
+            # en el índice de validez por ticker, sin leer el prefijo de la matriz de precios
+            carry = np.full((1, len(active)), np.nan)
+            for j, col in enumerate(active):
+                row = self.store.validity.last_valid_row(col, lo - 1)
+                if row is not None:
+                    carry[0, j] = self.store.values[row, col]
+
+        for chunk_start in range(lo, hi, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, hi)
+            prices = np.asarray(self.store.values[chunk_start:chunk_end, active], dtype=np.float64)
+            if nan_policy == "ffill":
+                if carry is not None:
+                    prices = ffill_matrix(np.vstack([carry, prices]))[1:]
+                else:
+                    prices = ffill_matrix(prices)
+                carry = prices[-1:]
+            yield self.store.dates[chunk_start:chunk_end], np.nan_to_num(prices, nan=0.0) @ weights
+
+    def value_series(self, start_date=None, end_date=None, nan_policy="skip", chunk_size=2048):
+        """Series de valor de todos los portafolios como DataFrame (fechas x portafolios)."""
+        chunks = list(self.iter_values(start_date, end_date, nan_policy, chunk_size))
+        if not chunks:
+            return pd.DataFrame(columns=self.ids, dtype=float)
+        dates = np.concatenate([dates for dates, _ in chunks])
+        values = np.vstack([values for _, values in chunks])
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name="DATE"), columns=self.ids)
+
+    def simulate(self, date, nan_policy="skip"):
+        """Valor de todos los portafolios en una fecha (o la fecha disponible anterior), como Series indexada por id."""
+        pos = self.store.snap(date)
+        if pos is None:
+            raise ValueError(f"⚠️ La fecha {date} no está disponible en los datos.")
+        date = self.store.dates[pos]
+        _, values = next(self.iter_values(date, date, nan_policy))
+        return pd.Series(values[0], index=self.ids, name=pd.Timestamp(date))
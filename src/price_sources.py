@@ -0,0 +1,276 @@
+# src/price_sources.py
+"""
+Carga de precios repartidos en varios archivos y hojas (XLSX, CSV, Parquet).
+
+Cada fuente (archivo, o hoja de un libro Excel) se lee en paralelo en un pool de procesos,
+porque openpyxl consume CPU. Las fuentes se validan (columna DATE, tickers contra el
+diccionario) y se unen por fecha en una sola matriz alineada.
+
+Las columnas de tipos de cambio ("<MONEDA1><MONEDA2> CURNCY", ver currency.py) pueden venir en
+sus propias fuentes y no se validan contra el diccionario.
+
+Conflictos entre fuentes (el mismo ticker con precios en la misma fecha) y fechas repetidas
+dentro de una fuente se resuelven con una política explícita:
+- 'error': falla si los precios en conflicto difieren.
+- 'first': gana la fuente que aparece primero (orden de descubrimiento).
+- 'last': gana la última fuente.
+
+Uso:
+    python price_sources.py data/regiones/ data/extra.csv --dictionary data/diccionario.json -o precios.xlsx
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = (".xlsx", ".xls", ".csv", ".parquet")
+CONFLICT_POLICIES = ("error", "first", "last")
+UNKNOWN_POLICIES = ("error", "warn", "drop")
+FX_SUFFIX = " CURNCY"
+
+
+def is_fx_ticker(ticker):
+    """True si la columna es un tipo de cambio ('USDCLP CURNCY')."""
+    return ticker.endswith(FX_SUFFIX) and len(ticker) == 6 + len(FX_SUFFIX)
+
+
+def discover_sources(paths):
+    """
+    Archivos de precios a partir de archivos y carpetas (las carpetas se recorren recursivamente).
+
+    Retorna las rutas en orden: primero en el orden entregado y, dentro de cada carpeta, alfabético.
+    Se omiten los archivos temporales de Excel (~$...) y las carpetas ocultas (.cache).
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, "**", "*"), recursive=True)
+            sources += sorted(
+                f for f in found
+                if f.lower().endswith(EXTENSIONS) and not os.path.basename(f).startswith("~$")
+                and not any(part.startswith(".") for part in os.path.relpath(f, path).split(os.sep)[:-1])
+            )
+        elif os.path.exists(path):
+            sources.append(path)
+        else:
+            raise FileNotFoundError(f"⚠️ No existe la fuente de precios {path}.")
+    return list(dict.fromkeys(sources))
+
+
+def _tasks(sources):
+    """Una tarea por archivo, o por hoja en los libros Excel."""
+    tasks = []
+    for path in sources:
+        if path.lower().endswith((".xlsx", ".xls")):
+            tasks += [(path, sheet) for sheet in pd.ExcelFile(path).sheet_names]
+        else:
+            tasks.append((path, None))
+    return tasks
+
+
+def read_source(path, sheet=None):
+    """
+    Lee y normaliza una fuente (se ejecuta en los procesos de trabajo).
+
+    Retorna:
+    - (etiqueta, fechas datetime64, tickers, matriz float64). Las filas sin fecha ni precios
+      (filas vacías al final de una hoja) se descartan.
+    """
+    label = path if sheet is None else f"{path}[{sheet}]"
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        df = pd.read_csv(path)
+    elif lower.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_excel(path, sheet_name=sheet)
+
+    df.columns = [str(col).strip().upper() for col in df.columns]
+    if "DATE" not in df.columns:
+        raise ValueError(f"⚠️ {label}: falta la columna DATE.")
+    tickers = [col for col in df.columns if col != "DATE" and not col.startswith("UNNAMED:")]
+    values = df[tickers].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+
+    empty = df["DATE"].isna() & np.isnan(values).all(axis=1)
+    dates = pd.to_datetime(df["DATE"], errors="coerce")
+    invalid = dates.isna() & ~empty
+    if invalid.any():
+        examples = df.loc[invalid, "DATE"].head(5).tolist()
+        raise ValueError(f"⚠️ {label}: {int(invalid.sum())} fechas inválidas en DATE (por ejemplo {examples}).")
+
+    keep = ~empty.to_numpy()
+    duplicated = [ticker for ticker in set(tickers) if tickers.count(ticker) > 1]
+    if duplicated:
+        raise ValueError(f"⚠️ {label}: tickers repetidos en las columnas: {', '.join(sorted(duplicated))}.")
+    return label, dates[keep].dt.normalize().to_numpy(dtype="datetime64[ns]"), tickers, values[keep]
+
+
+def _read_task(task):
+    return read_source(*task)
+
+
+def _validate_tickers(parsed, dictionary, unknown):
+    """Aplica la política de tickers fuera del diccionario (los tipos de cambio siempre se conservan)."""
+    known = {ticker.upper() for ticker in dictionary}
+    result = []
+    for label, dates, tickers, values in parsed:
+        missing = [ticker for ticker in tickers if ticker not in known and not is_fx_ticker(ticker)]
+        if missing:
+            message = f"{label}: tickers fuera del diccionario: {', '.join(missing)}"
+            if unknown == "error":
+                raise ValueError(f"⚠️ {message}")
+            logger.warning(message)
+            if unknown == "drop":
+                cols = [i for i, ticker in enumerate(tickers) if ticker in known or is_fx_ticker(ticker)]
+                tickers, values = [tickers[i] for i in cols], values[:, cols]
+        result.append((label, dates, tickers, values))
+    return result
+
+
+def _merge(parsed, on_conflict, dtype):
+    """Une las fuentes en una matriz (fechas x tickers) resolviendo conflictos según la política."""
+    all_dates = np.unique(np.concatenate([dates for _, dates, _, _ in parsed])) if parsed \
+        else np.array([], dtype="datetime64[ns]")
+    tickers = list(dict.fromkeys(ticker for _, _, source_tickers, _ in parsed for ticker in source_tickers))
+    column = {ticker: i for i, ticker in enumerate(tickers)}
+    matrix = np.full((len(all_dates), len(tickers)), np.nan)
+    owner = np.full(matrix.shape, -1, dtype=np.int32)
+    conflicts = 0
+
+    # Con 'first' se escriben las fuentes en orden inverso: la primera queda encima
+    order = range(len(parsed) - 1, -1, -1) if on_conflict == "first" else range(len(parsed))
+    for s in order:
+        label, dates, source_tickers, values = parsed[s]
+        if on_conflict == "first":
+            # Dentro de la fuente gana la primera fila de cada fecha
+            dates, first = np.unique(dates, return_index=True)
+            values = values[first]
+        elif len(np.unique(dates)) != len(dates):
+            # 'last': gana la última fila de cada fecha; con 'error' las repetidas deben coincidir
+            unique_dates, last, group = np.unique(dates[::-1], return_index=True, return_inverse=True)
+            last_values = values[::-1][last]
+            if on_conflict == "error":
+                # Cada fila se compara con la última de su fecha (no solo la primera con la última)
+                if not np.allclose(values[::-1], last_values[group.ravel()], rtol=1e-9, atol=0.0, equal_nan=True):
+                    raise ValueError(f"⚠️ {label}: fechas repetidas con precios distintos.")
+            dates, values = unique_dates, last_values
+
+        rows = np.searchsorted(all_dates, dates)
+        cols = np.array([column[ticker] for ticker in source_tickers], dtype=np.int64)
+        block = matrix[np.ix_(rows, cols)]
+        present = ~np.isnan(values)
+        overlap = present & ~np.isnan(block)
+        if overlap.any():
+            differs = overlap & ~np.isclose(block, values, rtol=1e-9, atol=0.0, equal_nan=True)
+            conflicts += int(differs.sum())
+            if on_conflict == "error" and differs.any():
+                r, c = np.argwhere(differs)[0]
+                other = parsed[owner[rows[r], cols[c]]][0]
+                raise ValueError(f"⚠️ Conflicto de precios para {source_tickers[c]} el "
+                                 f"{pd.Timestamp(dates[r]).date()} entre {other} y {label} "
+                                 f"({int(differs.sum())} celdas en conflicto).")
+        matrix[np.ix_(rows, cols)] = np.where(present, values, block)
+        owners = owner[np.ix_(rows, cols)]
+        owner[np.ix_(rows, cols)] = np.where(present, s, owners)
+
+    if conflicts:
+        logger.warning("%d precios en conflicto entre fuentes resueltos con la política '%s'", conflicts, on_conflict)
+    return all_dates, tickers, matrix.astype(dtype, copy=False)
+
+
+@profiler.timed("load.sources")
+def load_price_sources(paths, dictionary=None, on_conflict="error", unknown="warn", dtype=np.float64,
+                       executor=None, max_workers=None):
+    """
+    Descubre, lee en paralelo, valida y une fuentes de precios.
+
+    Parámetros:
+    - paths (str o list): Archivos y/o carpetas (ver discover_sources).
+    - dictionary (dict): Diccionario de tickers para validar las columnas (None = sin validar).
+    - on_conflict (str): 'error', 'first' o 'last' (ver el docstring del módulo).
+    - unknown (str): Tickers fuera del diccionario: 'error', 'warn' (se conservan) o 'drop'.
+    - dtype: np.float64 (por defecto) o np.float32 para reducir memoria a la mitad.
+    - executor (Executor): Ejecutor de concurrent.futures. Si es None y hay más de una fuente,
+      se crea un ProcessPoolExecutor.
+    - max_workers (int): Número de procesos cuando se crea el ejecutor (1 = lectura secuencial).
+
+    Retorna:
+    - DataFrame con columna DATE y un ticker por columna, en el formato de utils.load_prices.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"Política de conflicto no reconocida. Usa una de: {', '.join(CONFLICT_POLICIES)}.")
+    if unknown not in UNKNOWN_POLICIES:
+        raise ValueError(f"Política de tickers desconocidos no reconocida. Usa una de: {', '.join(UNKNOWN_POLICIES)}.")
+
+    sources = discover_sources(paths)
+    if not sources:
+        raise ValueError("⚠️ No se encontraron archivos de precios.")
+    tasks = _tasks(sources)
+    logger.info("Leyendo %d fuentes de precios (%d archivos)", len(tasks), len(sources))
+
+    if len(tasks) == 1 or (executor is None and max_workers == 1):
+        parsed = [_read_task(task) for task in tasks]
+    elif executor is not None:
+        parsed = list(executor.map(_read_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            parsed = list(pool.map(_read_task, tasks))
+
+    if dictionary is not None:
+        parsed = _validate_tickers(parsed, dictionary, unknown)
+    dates, tickers, values = _merge(parsed, on_conflict, dtype)
+
+    df = pd.DataFrame(values, columns=tickers)
+    df.insert(0, "DATE", pd.DatetimeIndex(dates))
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida y une fuentes de precios en un solo archivo.")
+    parser.add_argument("paths", nargs="+", help="Archivos o carpetas con XLSX/CSV/Parquet.")
+    parser.add_argument("--dictionary", help="Diccionario de tickers para validar las columnas.")
+    parser.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default="error", help="Política ante precios en conflicto.")
+    parser.add_argument("--unknown", choices=UNKNOWN_POLICIES, default="warn", help="Política ante tickers fuera del diccionario.")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos de lectura (1 = secuencial).")
+    parser.add_argument("--output", "-o", help="Archivo de salida (.xlsx, .csv o .parquet). Sin salida solo se valida.")
+    parser.add_argument("--log-level", default="INFO", help="Nivel de logging.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    dictionary = None
+    if args.dictionary:
+        from utils import load_dictionary
+        dictionary = load_dictionary(args.dictionary)
+
+    try:
+        df = load_price_sources(args.paths, dictionary, args.on_conflict, args.unknown, max_workers=args.workers)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error("%s", e)
+        return 1
+    logger.info("%d fechas x %d tickers", len(df), df.shape[1] - 1)
+
+    if args.output:
+        lower = args.output.lower()
+        if lower.endswith(".csv"):
+            df.to_csv(args.output, index=False)
+        elif lower.endswith(".parquet"):
+            df.to_parquet(args.output, index=False)
+        else:
+            df.to_excel(args.output, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,836 @@
+# src/price_store.py
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from price_sources import discover_sources, load_price_sources
+from profiling import profiler
+from utils import load_prices
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto de load_price_sources: solo las opciones distintas quedan en meta.json
+_SOURCE_DEFAULTS = {"on_conflict": "error", "unknown": "warn", "dtype": "float64"}
+
+# Días corridos que un precio puede arrastrarse (fines de semana y feriados largos): más allá
+# de la última fecha de datos, o para un ticker que dejó de cotizar, el precio se considera vencido
+MAX_STALENESS_DAYS = 10
+
+
+def ffill_matrix(values):
+    """Rellena hacia adelante los NaN de una matriz (fechas x activos) con NumPy."""
+    valid = ~np.isnan(values)
+    idx = np.where(valid, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = values[idx, np.arange(values.shape[1])]
+    # Las filas previas al primer precio válido siguen siendo NaN
+    filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return filled
+
+
+def _append_npy(filepath, rows):
+    """
+    Agrega filas al final de un .npy en disco sin reescribir los datos existentes.
+
+    Solo se reescribe la cabecera con la nueva forma; si la cabecera nueva no cabe en el
+    espacio de la anterior, se reescribe el archivo completo.
+    """
+    with open(filepath, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+        rows = np.ascontiguousarray(rows, dtype=dtype)
+
+        header = io.BytesIO()
+        header_info = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+                       "shape": (shape[0] + rows.shape[0],) + tuple(shape[1:])}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_info)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_info)
+        header = header.getvalue()
+
+        if not fortran_order and len(header) + 8 == data_offset:
+            f.seek(0)
+            f.write(np.lib.format.magic(*version))
+            f.write(header)
+            f.seek(0, os.SEEK_END)
+            f.write(rows.tobytes())
+            return
+
+    existing = np.load(filepath)
+    tmp_path = filepath + ".tmp.npy"
+    np.save(tmp_path, np.concatenate([existing, rows]))
+    os.replace(tmp_path, filepath)
+
+
+class ValidityIndex:
+    """
+    Índice de precios válidos por ticker, construido una sola vez por versión de los datos.
+
+    - first_row, last_row: primera y última fila con precio de cada ticker (-1 si nunca cotizó).
+    - bits: mapa de bits de filas válidas (fechas x ceil(tickers / 8) bytes, un bit por ticker).
+
+    Evita recorrer la columna de precios en cada consulta: "qué tickers cotizan en una fecha"
+    lee una fila del mapa y "último precio válido en o antes de una fecha" retrocede por
+    bloques de filas solo dentro de los huecos del ticker.
+    """
+
+    def __init__(self, first_row, last_row, bits, n_tickers):
+        self.first_row = first_row
+        self.last_row = last_row
+        self.bits = bits
+        self.n_tickers = n_tickers
+
+    @classmethod
+    def from_values(cls, values, chunk_size=4096):
+        """Construye el índice recorriendo la matriz de precios por bloques (sirve para memory-maps)."""
+        n_tickers = values.shape[1]
+        index = cls(np.full(n_tickers, -1, dtype=np.int64), np.full(n_tickers, -1, dtype=np.int64),
+                    np.zeros((0, (n_tickers + 7) // 8), dtype=np.uint8), n_tickers)
+        chunks = []
+        for start in range(0, len(values), chunk_size):
+            chunks.append(index._scan(np.asarray(values[start:start + chunk_size]), start))
+        if chunks:
+            index.bits = np.concatenate(chunks)
+        return index
+
+    def _scan(self, values, offset):
+        """Actualiza primera/última fila con un bloque de filas y retorna sus bits."""
+        valid = ~np.isnan(values)
+        has_valid = valid.any(axis=0)
+        first = offset + valid.argmax(axis=0)
+        last = offset + len(valid) - 1 - valid[::-1].argmax(axis=0)
+        new = has_valid & (self.first_row < 0)
+        self.first_row[new] = first[new]
+        self.last_row[has_valid] = last[has_valid]
+        return np.packbits(valid, axis=1)
+
+    def extend(self, values):
+        """Agrega las filas nuevas de la matriz (PriceStore.append)."""
+        self.bits = np.concatenate([self.bits, self._scan(np.asarray(values), len(self.bits))])
+
+    @property
+    def nbytes(self):
+        return self.first_row.nbytes + self.last_row.nbytes + self.bits.nbytes
+
+    def valid(self, row):
+        """Máscara booleana de los tickers con precio en una fila."""
+        return np.unpackbits(self.bits[row], count=self.n_tickers).astype(bool)
+
+    def is_valid(self, row, col):
+        return bool(self.bits[row, col >> 3] & (0x80 >> (col & 7)))
+
+    def last_valid_row(self, col, row, block=256):
+        """Última fila con precio del ticker col en o antes de row (None si no hay)."""
+        first, last = self.first_row[col], self.last_row[col]
+        if first < 0 or row < first:
+            return None
+        if row >= last:
+            return int(last)
+        byte, mask = col >> 3, 0x80 >> (col & 7)
+        hi = row + 1
+        while hi > first:
+            lo = max(first, hi - block)
+            hits = np.flatnonzero(self.bits[lo:hi, byte] & mask)
+            if hits.size:
+                return int(lo + hits[-1])
+            hi = lo
+        return None
+
+    def save(self, filepath):
+        tmp_path = filepath + ".tmp.npz"
+        np.savez(tmp_path, first_row=self.first_row, last_row=self.last_row, bits=self.bits)
+        os.replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath, n_tickers):
+        with np.load(filepath) as data:
+            return cls(data["first_row"], data["last_row"], data["bits"], n_tickers)
+
+
+def _file_sha1(filepath):
+    """Calcula el hash SHA-1 del contenido de un archivo."""
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sources_sha1(filepaths):
+    """Hash combinado de varias fuentes (nombre y contenido de cada archivo)."""
+    digest = hashlib.sha1()
+    for filepath in filepaths:
+        digest.update(os.path.abspath(filepath).encode("utf-8"))
+        digest.update(_file_sha1(filepath).encode("ascii"))
+    return digest.hexdigest()
+
+
+def default_deltas_dir(source_path):
+    """Carpeta de los deltas de PriceStore.append para un origen (archivo, carpeta o lista de fuentes)."""
+    if isinstance(source_path, (str, os.PathLike)) and os.path.isfile(source_path):
+        return os.path.splitext(os.path.abspath(source_path))[0] + ".deltas"
+    if isinstance(source_path, (str, os.PathLike)):
+        return os.path.join(os.path.abspath(source_path), ".deltas")
+    return os.path.join(os.path.dirname(os.path.abspath(source_path[0])), ".deltas")
+
+
+def deltas_fingerprint(source_path):
+    """Huella barata de los deltas agregados a un origen (nombres de archivo); cambia con cada append."""
+    directory = default_deltas_dir(source_path)
+    if not os.path.isdir(directory):
+        return ()
+    return tuple(sorted(f for f in os.listdir(directory) if f.endswith(".npz")))
+
+
+class PriceStore:
+    """
+    Almacén columnar de precios con índice de fechas y tickers.
+
+    El Excel de origen se convierte una sola vez en una caché binaria
+    (matriz float64 fechas x tickers en .npy, abierta con memory-map, más el índice
+    de fechas y tickers). La caché se reconstruye sola cuando cambia la fecha de
+    modificación y el hash del archivo de origen.
+
+    El origen también puede ser una carpeta o una lista de archivos y carpetas con varias
+    fuentes (XLSX/CSV/Parquet, todas las hojas); se leen en paralelo y se unen con
+    price_sources.load_price_sources. Los tipos de cambio que no vienen con los precios se
+    agregan como fuentes adicionales con fx_sources (la caché y los deltas siguen junto al origen).
+
+    Junto a la matriz se guarda un ValidityIndex (primera/última fecha válida y mapa de bits
+    por ticker), de modo que las consultas por fecha no recorren columnas de precios.
+    Las fechas que no son días hábiles se ajustan a la fecha disponible anterior.
+
+    Las fechas agregadas con append se guardan además como deltas en una carpeta junto al
+    origen (precios.deltas/ para precios.xlsx, .deltas/ dentro de una carpeta de fuentes).
+    La caché es desechable; los deltas no: cada reconstrucción los vuelve a aplicar sobre
+    las fuentes de origen.
+    """
+
+    def __init__(self, source_path=None, cache_dir=None, source_options=None, fx_sources=None):
+        """
+        Inicializa el almacén.
+
+        Parámetros:
+        - source_path (str o list): Archivo de precios (precios.xlsx), carpeta o lista de fuentes.
+        - cache_dir (str): Carpeta de la caché (por defecto .cache junto al origen o dentro de la carpeta).
+        - source_options (dict): Opciones de load_price_sources para varias fuentes
+          (dictionary, on_conflict, unknown, dtype, max_workers).
+        - fx_sources (str o list): Archivos o carpetas con tipos de cambio ('<PAR> CURNCY').
+        """
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.deltas_dir = None
+        self.source_options = dict(source_options or {})
+        self.fx_sources = fx_sources
+        self.currency = None  # Moneda de todos los precios, si se convirtieron (CurrencyConverter)
+        self._meta = None
+        self._sync_lock = threading.Lock()
+        if source_path is not None:
+            if self.cache_dir is None:
+                self.cache_dir = self._default_cache_dir()
+            self.deltas_dir = self._default_deltas_dir()
+            self.refresh()
+
+    def _single_file(self):
+        return isinstance(self.source_path, (str, os.PathLike)) and os.path.isfile(self.source_path)
+
+    def _default_cache_dir(self):
+        if self._single_file():
+            return os.path.join(os.path.dirname(os.path.abspath(self.source_path)), ".cache")
+        if isinstance(self.source_path, (str, os.PathLike)):
+            return os.path.join(os.path.abspath(self.source_path), ".cache")
+        return os.path.join(os.path.dirname(os.path.abspath(self.source_path[0])), ".cache")
+
+    def _default_deltas_dir(self):
+        return default_deltas_dir(self.source_path)
+
+    def _source_files(self):
+        files = [self.source_path] if self._single_file() else discover_sources(self.source_path)
+        if self.fx_sources:
+            files += [f for f in discover_sources(self.fx_sources) if f not in files]
+        return files
+
+    def _plain_file(self, files):
+        """True si el origen es solo el archivo de precios de la app (se lee con utils.load_prices)."""
+        return self._single_file() and len(files) == 1
+
+    def _options_fingerprint(self, files):
+        """
+        Opciones de carga que cambian el contenido de la caché, sin las que tienen su valor por
+        defecto (max_workers no cambia el resultado). El diccionario se guarda como hash y solo
+        cuenta si la política de tickers desconocidos lo usa ('error' o 'drop').
+        """
+        options = dict(self.source_options)
+        if self._plain_file(files):
+            # utils.load_prices no usa las opciones de varias fuentes; dtype se aplica igual
+            options = {"dtype": options["dtype"]} if "dtype" in options else {}
+        fingerprint = {}
+        for key, value in options.items():
+            if key == "max_workers":
+                continue
+            if key == "dtype":
+                value = np.dtype(value).name
+            elif key == "dictionary":
+                if value is None or options.get("unknown", _SOURCE_DEFAULTS["unknown"]) == "warn":
+                    continue
+                value = hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+            if _SOURCE_DEFAULTS.get(key) != value:
+                fingerprint[key] = value
+        return fingerprint
+
+    @classmethod
+    def from_frame(cls, prices_df):
+        """Construye un almacén en memoria a partir de un DataFrame con columna DATE."""
+        store = cls()
+        dates, tickers, values = cls._normalize_frame(prices_df)
+        digest = hashlib.sha1(dates.tobytes())
+        digest.update(json.dumps(tickers).encode("utf-8"))
+        digest.update(values.tobytes())
+        store._set_data(dates, tickers, values, digest.hexdigest())
+        return store
+
+    @classmethod
+    def from_arrays(cls, dates, tickers, values, version, currency=None, validity=None):
+        """Construye un almacén en memoria a partir de arreglos ya normalizados (por ejemplo, precios convertidos)."""
+        store = cls()
+        store._set_data(dates, tickers, values, version, validity)
+        store.currency = currency
+        return store
+
+    @staticmethod
+    def _normalize_frame(prices_df):
+        """
+        Normaliza columnas y fechas igual que la app y separa índice y matriz.
+
+        La matriz queda en float32 si todas las columnas de precios ya lo son (dtype=np.float32
+        en load_price_sources) y en float64 en cualquier otro caso.
+        """
+        df = prices_df.copy()
+        df.columns = [str(col).strip().upper() for col in df.columns]
+        df["DATE"] = pd.to_datetime(df["DATE"], errors="coerce").dt.normalize()
+        df = df.dropna(subset=["DATE"]).sort_values(by="DATE", kind="stable")
+        tickers = [col for col in df.columns if col != "DATE"]
+        dates = df["DATE"].to_numpy(dtype="datetime64[ns]")
+        dtype = np.float32 if tickers and all(df[t].dtype == np.float32 for t in tickers) else np.float64
+        values = np.ascontiguousarray(df[tickers].to_numpy(dtype=dtype))
+        return dates, tickers, values
+
+    def _set_data(self, dates, tickers, values, version, validity=None):
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.values = values
+        self.version = version
+        self.validity = ValidityIndex.from_values(values) if validity is None else validity
+        self._ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    # ------------------------------------------------------------------
+    # Caché en disco
+    # ------------------------------------------------------------------
+    def _cache_paths(self):
+        return {
+            "meta": os.path.join(self.cache_dir, "meta.json"),
+            "dates": os.path.join(self.cache_dir, "dates.npy"),
+            "values": os.path.join(self.cache_dir, "values.npy"),
+            "validity": os.path.join(self.cache_dir, "validity.npz"),
+        }
+
+    def _read_meta(self):
+        paths = self._cache_paths()
+        if not all(os.path.exists(p) for p in paths.values()):
+            return None
+        with open(paths["meta"], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        path = self._cache_paths()["meta"]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _rebuild(self, files, mtime_ns, size, sha1):
+        """Lee las fuentes de origen, aplica los deltas y escribe la caché binaria."""
+        if self._plain_file(files):
+            prices_df = load_prices(self.source_path)
+        else:
+            prices_df = load_price_sources(files, **self.source_options)
+        dates, tickers, values = self._normalize_frame(prices_df)
+        if "dtype" in self.source_options:
+            values = values.astype(self.source_options["dtype"], copy=False)
+        deltas = self.delta_files()
+        if deltas:
+            dates, values = self._merge_deltas(deltas, dates, tickers, values)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        paths = self._cache_paths()
+        for key, array in (("dates", dates), ("values", values)):
+            tmp_path = paths[key] + ".tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, paths[key])
+        ValidityIndex.from_values(values).save(paths["validity"])
+        meta = {
+            "source": os.path.abspath(files[0]),
+            "sources": [os.path.abspath(f) for f in files],
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "sha1": sha1,
+            "tickers": tickers,
+            "rows": len(dates),
+            "deltas": deltas,
+            "options": self._options_fingerprint(files),
+        }
+        if deltas or meta["options"]:
+            digest = hashlib.sha1(sha1.encode("ascii"))
+            digest.update(json.dumps(meta["options"], sort_keys=True).encode("utf-8"))
+            digest.update(json.dumps(deltas).encode("utf-8"))
+            meta["version"] = digest.hexdigest()
+        self._write_meta(meta)
+        return meta
+
+    @profiler.timed("load.price_store")
+    def refresh(self):
+        """
+        Verifica las fuentes de origen, las opciones de carga (source_options) y los deltas, y
+        reconstruye la caché si algo cambió.
+
+        La caché también se reconstruye si quedó a medio escribir (por ejemplo, un append
+        interrumpido): el número de filas de la matriz no coincide con el de meta.json.
+        """
+        files = self._source_files()
+        if not files:
+            raise ValueError(f"⚠️ No se encontraron archivos de precios en {self.source_path}.")
+        stats = [os.stat(f) for f in files]
+        mtime_ns, size = max(st.st_mtime_ns for st in stats), sum(st.st_size for st in stats)
+        sources = [os.path.abspath(f) for f in files]
+        meta = self._read_meta()
+
+        def rebuild(sha1=None):
+            sha1 = sha1 or (_file_sha1(files[0]) if self._plain_file(files) else _sources_sha1(files))
+            profiler.count("price_store.rebuilds")
+            return self._rebuild(files, mtime_ns, size, sha1)
+
+        if meta is None or meta["mtime_ns"] != mtime_ns or meta["size"] != size \
+                or meta.get("sources", [meta["source"]]) != sources:
+            sha1 = _file_sha1(files[0]) if self._plain_file(files) else _sources_sha1(files)
+            if meta is not None and meta["sha1"] == sha1:
+                # Solo cambió la fecha de modificación: la caché sigue siendo válida
+                meta.update(mtime_ns=mtime_ns, size=size, sources=sources)
+                self._write_meta(meta)
+            else:
+                meta = rebuild(sha1)
+        if meta.get("options", {}) != self._options_fingerprint(files):
+            logger.info("Cambiaron las opciones de carga (%s): se reconstruye la caché", self._options_fingerprint(files))
+            meta = rebuild()
+        elif meta.get("deltas", []) != self.delta_files(meta):
+            logger.info("Los deltas de %s cambiaron: se reconstruye la caché", self.deltas_dir)
+            meta = rebuild()
+
+        if not self._load_cache(meta):
+            logger.warning("Caché de precios incompleta en %s: se reconstruye", self.cache_dir)
+            meta = rebuild()
+            self._load_cache(meta)
+        return self
+
+    def _load_cache(self, meta):
+        """Abre la caché; retorna False si está inconsistente (filas distintas entre archivos y meta.json)."""
+        paths = self._cache_paths()
+        dates = np.load(paths["dates"])
+        values = np.load(paths["values"], mmap_mode="r")
+        validity = ValidityIndex.load(paths["validity"], len(meta["tickers"]))
+        rows = meta.get("rows", len(dates))
+        if not (len(dates) == values.shape[0] == len(validity.bits) == rows):
+            return False
+        self._set_data(dates, meta["tickers"], values, meta.get("version", meta["sha1"]), validity)
+        self._meta = meta
+        return True
+
+    def sync(self, stats_cache=None):
+        """
+        Incorpora los deltas que otro proceso agregó a este origen (ingest.py) desde la última carga.
+
+        Si en disco solo se agregaron fechas (mismas fuentes y opciones, y los deltas cargados
+        siguen al inicio de la lista) el almacén se actualiza en el lugar y stats_cache.on_append
+        extiende las estadísticas ya calculadas con las filas nuevas, en lugar de reconstruir el
+        almacén con otra versión y recalcularlas desde cero. Cualquier otro cambio se recarga
+        con refresh.
+
+        Retorna:
+        - Posición de la primera fila agregada, o None si no hubo fechas nuevas.
+        """
+        with self._sync_lock:
+            previous = self._meta
+            if previous is None or previous.get("deltas", []) == self.delta_files():
+                return None
+            previous_version, previous_rows = self.version, len(self)
+            self.refresh()
+            meta = self._meta
+            appended = (meta["sha1"] == previous["sha1"] and meta.get("options", {}) == previous.get("options", {})
+                        and meta["tickers"] == previous["tickers"] and len(self) > previous_rows
+                        and meta.get("deltas", [])[:len(previous.get("deltas", []))] == previous.get("deltas", []))
+            if not appended or self.version == previous_version:
+                return None
+            if stats_cache is not None:
+                stats_cache.on_append(self, previous_version, previous_rows)
+            logger.info("Se incorporaron %d fechas agregadas por otro proceso", len(self) - previous_rows)
+            return previous_rows
+
+    # ------------------------------------------------------------------
+    # Deltas (fechas agregadas con append)
+    # ------------------------------------------------------------------
+    def delta_files(self, meta=None):
+        """
+        Nombres de los deltas guardados, en el orden en que se agregaron.
+
+        El orden es el de meta.json (por defecto el de la caché) para los deltas que ya registra,
+        seguido de los demás por nombre (marca de tiempo de creación, ver _save_delta).
+        """
+        if self.deltas_dir is None or not os.path.isdir(self.deltas_dir):
+            return []
+        names = {f for f in os.listdir(self.deltas_dir) if f.endswith(".npz")}
+        meta = self._read_meta() if meta is None and self.cache_dir is not None else meta
+        known = [name for name in (meta or {}).get("deltas", []) if name in names]
+        return known + sorted(names.difference(known))
+
+    def _save_delta(self, dates, tickers, values, version):
+        """
+        Guarda un delta de forma atómica (archivo temporal, fsync y os.replace).
+
+        El nombre empieza con la marca de tiempo en nanosegundos y un identificador aleatorio:
+        dos appends simultáneos (dos ingestas, o la ingesta y la app) nunca escriben el mismo
+        archivo, y el orden por nombre es el de creación.
+        """
+        os.makedirs(self.deltas_dir, exist_ok=True)
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}-{version[:12]}.npz"
+        path = os.path.join(self.deltas_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, dates=dates, tickers=np.array(tickers, dtype=str), values=values)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return name
+
+    def _merge_deltas(self, names, dates, tickers, values):
+        """
+        Agrega al final de la matriz de origen las fechas de los deltas posteriores a ella.
+
+        Las fechas que las fuentes de origen ya traen ganan sobre las del delta.
+        """
+        column = {ticker: i for i, ticker in enumerate(tickers)}
+        all_dates, blocks = [dates], [values]
+        last = dates[-1] if len(dates) else None
+        for name in names:
+            with np.load(os.path.join(self.deltas_dir, name), allow_pickle=False) as data:
+                delta_dates, delta_tickers, delta_values = data["dates"], data["tickers"].tolist(), data["values"]
+            new = np.ones(len(delta_dates), dtype=bool) if last is None else delta_dates > last
+            if not new.all():
+                logger.info("%s: %d fechas ya están en las fuentes de origen", name, int((~new).sum()))
+            keep = [i for i, ticker in enumerate(delta_tickers) if ticker in column]
+            if len(keep) < len(delta_tickers):
+                dropped = [ticker for ticker in delta_tickers if ticker not in column]
+                logger.warning("%s: tickers que ya no están en el origen se descartan: %s", name, ", ".join(dropped))
+            if not new.any():
+                continue
+            rows = np.full((int(new.sum()), len(tickers)), np.nan, dtype=values.dtype)
+            rows[:, [column[delta_tickers[i]] for i in keep]] = delta_values[new][:, keep]
+            all_dates.append(delta_dates[new])
+            blocks.append(rows)
+            last = delta_dates[new][-1]
+        return np.concatenate(all_dates), np.concatenate(blocks)
+
+    def append(self, delta_df):
+        """
+        Agrega al final del almacén las fechas nuevas de un DataFrame de precios.
+
+        Las fechas iguales o anteriores a la última fecha del almacén se ignoran (reingestar
+        el mismo archivo no duplica datos). Los tickers ausentes en el delta quedan en NaN.
+        En disco solo se escriben las filas nuevas (en la caché y como delta junto al origen,
+        ver la clase); la versión de los datos cambia.
+
+        Retorna:
+        - Posición de la primera fila agregada, o None si no había fechas nuevas.
+        """
+        dates, tickers, values = self._normalize_frame(delta_df)
+        unknown = [ticker for ticker in tickers if ticker not in self]
+        if unknown:
+            raise ValueError(f"⚠️ Tickers sin historia en el almacén (requieren recarga completa): {', '.join(unknown)}")
+
+        if len(self.dates):
+            new_rows = dates > self.dates[-1]
+            if not new_rows.all():
+                logger.info("Se ignoran %d filas con fechas ya cargadas", int((~new_rows).sum()))
+            dates, values = dates[new_rows], values[new_rows]
+        if len(dates) == 0:
+            return None
+        if len(np.unique(dates)) != len(dates):
+            raise ValueError("⚠️ El delta contiene fechas duplicadas.")
+
+        rows = np.full((len(dates), len(self.tickers)), np.nan)
+        rows[:, [self.ticker_index(ticker) for ticker in tickers]] = values
+
+        digest = hashlib.sha1(self.version.encode("utf-8"))
+        digest.update(dates.tobytes())
+        digest.update(rows.tobytes())
+        version = digest.hexdigest()
+        first_row = len(self.dates)
+
+        validity = self.validity
+        if self.cache_dir is None:
+            validity.extend(rows)
+            self._set_data(np.concatenate([self.dates, dates]), self.tickers,
+                           np.concatenate([np.asarray(self.values), rows]), version, validity)
+            return first_row
+
+        # Primero el delta (durable y atómico), después la caché; meta.json se escribe al final y
+        # confirma el cambio. Si algo falla entre medio, refresh detecta la caché incompleta o el
+        # delta sin aplicar y la reconstruye con el delta incluido.
+        name = self._save_delta(dates, tickers, values, version)
+        paths = self._cache_paths()
+        _append_npy(paths["values"], rows)
+        _append_npy(paths["dates"], dates)
+        # El índice en memoria se extiende recién con los datos ya escritos: si una escritura
+        # falla, el almacén en memoria sigue igual al de disco
+        validity.extend(rows)
+        validity.save(paths["validity"])
+        meta = self._read_meta()
+        meta.update(version=version, rows=first_row + len(dates), deltas=meta.get("deltas", []) + [name])
+        self._write_meta(meta)
+        self._load_cache(meta)
+        return first_row
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def __contains__(self, ticker):
+        return ticker in self._ticker_index
+
+    def __len__(self):
+        return len(self.dates)
+
+    def ticker_index(self, ticker):
+        """Posición de la columna de un ticker (O(1))."""
+        try:
+            return self._ticker_index[ticker]
+        except KeyError:
+            raise KeyError(f"⚠️ El ticker {ticker} no está en los datos de precios.") from None
+
+    def date_index(self, date):
+        """Posición exacta de una fecha en el índice (O(log n)) o None si no existe."""
+        target = np.datetime64(pd.Timestamp(date).normalize(), "ns")
+        pos = int(np.searchsorted(self.dates, target))
+        if pos < len(self.dates) and self.dates[pos] == target:
+            return pos
+        return None
+
+    def date_range(self, start_date=None, end_date=None):
+        """Rango [lo, hi) de filas entre dos fechas (inclusive)."""
+        lo = 0 if start_date is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date), "ns"), side="left"))
+        hi = len(self.dates) if end_date is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end_date), "ns"), side="right"))
+        return lo, max(lo, hi)
+
+    def snap(self, date, direction="backward", max_gap=MAX_STALENESS_DAYS):
+        """
+        Fila de la fecha disponible más cercana: en o antes de date ('backward') o en o después
+        ('forward').
+
+        None si la fecha queda fuera del rango de datos: antes de la primera fecha ('backward'),
+        después de la última ('forward'), o a más de max_gap días corridos pasado el extremo
+        (una fecha posterior a los datos no es "la última fecha"). max_gap=None no pone límite.
+        """
+        target = np.datetime64(pd.Timestamp(date).normalize(), "ns")
+        gap = None if max_gap is None else np.timedelta64(int(max_gap), "D")
+        if direction == "backward":
+            pos = int(np.searchsorted(self.dates, target, side="right")) - 1
+            if pos < 0 or (gap is not None and pos == len(self.dates) - 1 and target - self.dates[pos] > gap):
+                return None
+            return pos
+        if direction == "forward":
+            pos = int(np.searchsorted(self.dates, target, side="left"))
+            if pos >= len(self.dates) or (gap is not None and pos == 0 and self.dates[pos] - target > gap):
+                return None
+            return pos
+        raise ValueError("Dirección no reconocida. Usa 'backward' o 'forward'.")
+
+    def first_valid_date(self, ticker):
+        """Primera fecha con precio del ticker (None si nunca cotizó)."""
+        row = self.validity.first_row[self.ticker_index(ticker)]
+        return None if row < 0 else pd.Timestamp(self.dates[row])
+
+    def last_valid_date(self, ticker):
+        """Última fecha con precio del ticker (None si nunca cotizó)."""
+        row = self.validity.last_row[self.ticker_index(ticker)]
+        return None if row < 0 else pd.Timestamp(self.dates[row])
+
+    def tradable(self, date):
+        """Tickers con precio en la fecha (o en la fecha disponible anterior si no es día hábil)."""
+        pos = self.snap(date)
+        if pos is None:
+            return []
+        return [self.tickers[i] for i in np.flatnonzero(self.validity.valid(pos))]
+
+    def asof(self, ticker, date, max_staleness=MAX_STALENESS_DAYS):
+        """
+        Último precio válido del ticker en o antes de date.
+
+        Falla (ValueError) si ese precio tiene más de max_staleness días corridos respecto de
+        date, por ejemplo un ticker que dejó de cotizar; max_staleness=None acepta cualquier antigüedad.
+
+        Retorna:
+        - (fecha del precio, precio), o None si el ticker no tiene precios hasta esa fecha.
+        """
+        pos = self.snap(date, max_gap=max_staleness)
+        if pos is None:
+            return None
+        col = self.ticker_index(ticker)
+        row = self.validity.last_valid_row(col, pos)
+        if row is None:
+            return None
+        quote_date = pd.Timestamp(self.dates[row])
+        if max_staleness is not None and (pd.Timestamp(date).normalize() - quote_date).days > max_staleness:
+            raise ValueError(f"⚠️ El último precio de {ticker} antes de {pd.Timestamp(date).date()} es del "
+                             f"{quote_date.date()}: más de {max_staleness} días sin cotizar.")
+        return quote_date, float(self.values[row, col])
+
+    def price(self, ticker, date):
+        """
+        Precio de un ticker en una fecha (NaN si no hay dato, None si la fecha está fuera de los datos).
+
+        Las fechas que no son días hábiles usan la fecha disponible anterior.
+        """
+        pos = self.snap(date)
+        if pos is None:
+            return None
+        return float(self.values[pos, self.ticker_index(ticker)])
+
+    def row(self, date):
+        """Precios de todos los tickers en una fecha (o la fecha disponible anterior) como Series."""
+        pos = self.snap(date)
+        if pos is None:
+            raise ValueError(f"⚠️ La fecha {date} no está disponible en los datos.")
+        return pd.Series(np.asarray(self.values[pos]), index=self.tickers, name=pd.Timestamp(self.dates[pos]))
+
+    def column(self, ticker):
+        """Serie histórica de un ticker como vista de la matriz."""
+        return self.values[:, self.ticker_index(ticker)]
+
+    def matrix(self, tickers, start_date=None, end_date=None, ffill=False, max_staleness=MAX_STALENESS_DAYS):
+        """
+        Matriz de precios alineada para un conjunto de tickers.
+
+        Parámetros:
+        - tickers (list): Tickers (columnas) a extraer.
+        - start_date, end_date (date): Rango de fechas (inclusive).
+        - ffill (bool): Si es True, rellena NaN con el último precio válido, incluso anterior al rango.
+        - max_staleness (int): Con ffill, días corridos que un precio puede arrastrarse (como en
+          asof); pasado ese plazo, por ejemplo un ticker que dejó de cotizar, queda NaN.
+          None arrastra sin límite.
+
+        Retorna:
+        - (dates, values): Fechas datetime64 y matriz float64 (fechas x tickers).
+        """
+        cols = [self.ticker_index(ticker) for ticker in tickers]
+        lo, hi = self.date_range(start_date, end_date)
+        dates = self.dates[lo:hi]
+        values = np.asarray(self.values[lo:hi, cols], dtype=np.float64)
+        if ffill:
+            values = self._ffill(values, dates, cols, lo, max_staleness)
+        return dates, values
+
+    def _ffill(self, values, dates, cols, lo, max_staleness):
+        """
+        Rellena hacia adelante las filas [lo, hi) sin leer el prefijo de la matriz: el último precio
+        anterior al rango sale del índice de validez. Cada valor lleva la fecha de su precio de origen
+        para descartar los que superan max_staleness días.
+        """
+        seed = np.full(len(cols), np.nan)
+        seed_dates = np.full(len(cols), np.datetime64("NaT"), dtype=dates.dtype)
+        if lo > 0:
+            for j, col in enumerate(cols):
+                row = self.validity.last_valid_row(col, lo - 1)
+                if row is not None:
+                    seed[j], seed_dates[j] = self.values[row, col], self.dates[row]
+
+        source = np.where(~np.isnan(values), np.arange(len(values))[:, None], -1)
+        np.maximum.accumulate(source, axis=0, out=source)
+        carried = source < 0
+        filled = np.where(carried, seed, values[np.maximum(source, 0), np.arange(len(cols))])
+        if max_staleness is not None and len(dates):
+            source_dates = np.where(carried, seed_dates, dates[np.maximum(source, 0)])
+            stale = (dates[:, None] - source_dates) > np.timedelta64(int(max_staleness), "D")
+            filled[stale] = np.nan
+        return filled
+
+    def frame(self, tickers=None, start_date=None, end_date=None):
+        """DataFrame de precios indexado por DATE."""
+        tickers = self.tickers if tickers is None else list(tickers)
+        dates, values = self.matrix(tickers, start_date, end_date)
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name="DATE"), columns=tickers)
+
+    def to_frame(self):
+        """DataFrame con columna DATE, en el mismo formato que utils.load_prices normalizado."""
+        return self.frame().reset_index()
+
+
+# Almacenes ya construidos por contenido de DataFrame: huella -> PriceStore (LRU)
+_frame_stores = OrderedDict()
+_frame_stores_lock = threading.Lock()
+MAX_FRAME_STORES = 8
+
+
+def frame_fingerprint(prices):
+    """
+    Huella del contenido de un DataFrame de precios: forma, columnas, primera y última fila del
+    índice y SHA-1 de los bytes de cada columna. Cuesta una pasada de hash por los datos, mucho
+    menos que convertirlos, y cambia con cualquier edición en el lugar (df.loc[...] = ..., df[col] *= fx).
+    """
+    digest = hashlib.sha1(repr((prices.shape, tuple(prices.columns))).encode("utf-8"))
+    if len(prices):
+        digest.update(repr((prices.index[0], prices.index[-1])).encode("utf-8"))
+    for _, column in prices.items():
+        values = column.to_numpy()
+        if values.dtype == object:
+            digest.update(repr(values.tolist()).encode("utf-8"))
+        else:
+            digest.update(values.dtype.str.encode("ascii"))
+            digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def as_price_store(prices):
+    """
+    Devuelve un PriceStore a partir de un PriceStore o un DataFrame de precios.
+
+    La conversión de un DataFrame se hace una sola vez por contenido (ver frame_fingerprint):
+    volver a pasar el mismo DataFrame, o uno igual, reutiliza el almacén; si se modificó en el
+    lugar, la huella cambia y se convierte de nuevo.
+    """
+    if isinstance(prices, PriceStore):
+        return prices
+    key = frame_fingerprint(prices)
+    with _frame_stores_lock:
+        store = _frame_stores.get(key)
+        if store is not None:
+            _frame_stores.move_to_end(key)
+    if store is not None:
+        profiler.count("price_store.frame_hits")
+        return store
+
+    store = PriceStore.from_frame(prices)
+    with _frame_stores_lock:
+        _frame_stores[key] = store
+        while len(_frame_stores) > MAX_FRAME_STORES:
+            _frame_stores.popitem(last=False)
+    return store
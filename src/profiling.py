@@ -0,0 +1,148 @@
+# src/profiling.py
+"""
+Instrumentación liviana de las etapas de cálculo (tiempos y contadores).
+
+Uso:
+    from profiling import profiler
+
+    @profiler.timed("portfolio.simulate")
+    def simulate(...): ...
+
+    with profiler.stage("plot.render"):
+        ...
+    profiler.count("optimize.iterations", result.nit)
+
+Desactivado (por defecto) cada punto instrumentado cuesta una lectura de atributo.
+El estado es por hilo, de modo que cada sesión de Streamlit mide solo su propia ejecución.
+Los trabajos en segundo plano (jobs.py) corren en otros hilos: sus duraciones se registran
+aparte con record_job, en un registro compartido por el proceso (profiler.jobs()).
+"""
+import csv
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    """Acumula tiempo de pared por etapa (llamadas, total, máximo) y contadores con nombre."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(self._local, "enabled", False)
+
+    def enable(self, enabled=True):
+        """Activa o desactiva la instrumentación en el hilo actual y reinicia las mediciones."""
+        self._local.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self._local.stages = {}
+        self._local.counters = {}
+
+    def record(self, name, elapsed):
+        """Registra una medición de `elapsed` segundos para la etapa `name`."""
+        stats = self._local.stages.get(name)
+        if stats is None:
+            self._local.stages[name] = {"calls": 1, "total": elapsed, "max": elapsed}
+        else:
+            stats["calls"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    def record_job(self, name, elapsed):
+        """
+        Registra la duración de un trabajo en segundo plano en el registro compartido
+        (siempre activo: cuesta un lock por trabajo terminado).
+        """
+        with self._jobs_lock:
+            stats = self._jobs.get(name)
+            if stats is None:
+                self._jobs[name] = {"calls": 1, "total": elapsed, "max": elapsed, "last": elapsed}
+            else:
+                stats["calls"] += 1
+                stats["total"] += elapsed
+                stats["max"] = max(stats["max"], elapsed)
+                stats["last"] = elapsed
+
+    def jobs(self):
+        """Copia de las duraciones de trabajos en segundo plano: {nombre: {calls, total, max, last}}."""
+        with self._jobs_lock:
+            return {name: dict(stats) for name, stats in self._jobs.items()}
+
+    def reset_jobs(self):
+        with self._jobs_lock:
+            self._jobs.clear()
+
+    @contextmanager
+    def _measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def stage(self, name):
+        """Context manager que mide una etapa (no hace nada si está desactivado)."""
+        if not self.enabled:
+            return _DISABLED
+        return self._measure(name)
+
+    def timed(self, name):
+        """Decorador que mide cada llamada a la función como la etapa `name`."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self._measure(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        """Suma n al contador `name`."""
+        if self.enabled:
+            self._local.counters[name] = self._local.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Copia de las mediciones actuales: {'stages': {...}, 'counters': {...}}."""
+        stages = getattr(self._local, "stages", {})
+        counters = getattr(self._local, "counters", {})
+        return {"stages": {name: dict(stats) for name, stats in stages.items()}, "counters": dict(counters)}
+
+    def rows(self):
+        """Mediciones como filas planas (kind, name, calls, total, max, value)."""
+        snapshot = self.snapshot()
+        rows = [
+            {"kind": "stage", "name": name, "calls": stats["calls"], "total": stats["total"], "max": stats["max"], "value": None}
+            for name, stats in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["total"])
+        ]
+        rows += [
+            {"kind": "counter", "name": name, "calls": None, "total": None, "max": None, "value": value}
+            for name, value in sorted(snapshot["counters"].items())
+        ]
+        return rows
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_csv(self):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=["kind", "name", "calls", "total", "max", "value"])
+        writer.writeheader()
+        writer.writerows(self.rows())
+        return buffer.getvalue()
+
+
+# Instancia compartida por los módulos de cálculo
+profiler = Profiler()
@@ -0,0 +1,430 @@
+# src/stats_cache.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from covariance import estimate_covariance
+from price_store import ffill_matrix
+from profiling import profiler
+
+# Períodos por año usados para anualizar según la frecuencia de los retornos
+PERIODS_PER_YEAR = {"D": 252, "W": 52, "M": 12}
+RESAMPLE_RULES = {"W": "W-FRI", "M": "ME"}
+# Memoria máxima de los momentos recortables del universo (CommonMoments)
+MAX_MOMENT_BYTES = 128 * 1024 ** 2
+
+
+class ReturnMoments:
+    """
+    Sumas por pares de retornos que permiten actualizar media y covarianza de forma incremental.
+
+    Para cada par (i, j) se acumulan el número de observaciones comunes, la suma de x_i en
+    esas observaciones y la suma de x_i * x_j. Agregar o quitar t filas cuesta O(t·N²),
+    sin recalcular sobre toda la historia.
+    """
+
+    def __init__(self, n_assets):
+        self.count = np.zeros((n_assets, n_assets))
+        self.sums = np.zeros((n_assets, n_assets))
+        self.cross = np.zeros((n_assets, n_assets))
+
+    @property
+    def nbytes(self):
+        return self.count.nbytes + self.sums.nbytes + self.cross.nbytes
+
+    def _update(self, returns, sign):
+        returns = np.atleast_2d(returns)
+        valid = ~np.isnan(returns)
+        x = np.where(valid, returns, 0.0)
+        mask = valid.astype(np.float64)
+        self.count += sign * (mask.T @ mask)
+        self.sums += sign * (x.T @ mask)
+        self.cross += sign * (x.T @ x)
+
+    def add(self, returns):
+        """Agrega filas de retornos (fechas x activos, NaN = sin dato)."""
+        self._update(returns, 1)
+
+    def remove(self, returns):
+        """Quita filas de retornos agregadas antes (ventanas móviles)."""
+        self._update(returns, -1)
+
+    def mean(self):
+        """Media de cada activo sobre todas sus observaciones."""
+        count = np.diag(self.count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, np.diag(self.sums) / count, np.nan)
+
+    def cov(self, indices=None):
+        """Covarianza muestral por pares (equivalente a DataFrame.cov)."""
+        if indices is None:
+            count, sums, cross = self.count, self.sums, self.cross
+        else:
+            idx = np.ix_(indices, indices)
+            count, sums, cross = self.count[idx], self.sums[idx], self.cross[idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = (cross - sums * sums.T / count) / (count - 1)
+        cov[count < 2] = np.nan
+        return cov
+
+
+class CommonMoments:
+    """
+    Sumas de retornos desde cada fecha de inicio del universo, de las que se recortan media y
+    covarianza de cualquier canasta sobre su muestra común.
+
+    Con precios rellenados hacia adelante, cada ticker tiene retorno desde su primera fecha en
+    adelante, así que la muestra común de una canasta son las filas desde el inicio más tardío
+    de sus activos. Para cada fecha de inicio distinta se guardan la suma de los retornos y la
+    matriz de productos cruzados desde esa fecha hasta el final (k x N y k x N x N): las
+    estadísticas de una canasta se recortan en O(n²) y agregar t fechas cuesta O((k + t)·N²).
+
+    Los tickers con huecos después de su inicio (contiguous = False) no siguen ese patrón y sus
+    canastas se estiman directamente sobre los retornos (ver UniverseStats.subset).
+    """
+
+    def __init__(self, starts, contiguous, block_starts, sums, cross, n_rows):
+        self.starts = starts              # primera fila con retorno de cada ticker (-1 = sin datos)
+        self.contiguous = contiguous
+        self.block_starts = block_starts
+        self.sums = sums
+        self.cross = cross
+        self.n_rows = n_rows
+
+    @property
+    def nbytes(self):
+        return self.sums.nbytes + self.cross.nbytes
+
+    @staticmethod
+    def estimated_nbytes(n_blocks, n_assets):
+        return 8 * n_blocks * n_assets * (n_assets + 1)
+
+    @staticmethod
+    def _layout(valid):
+        """Primera fila con dato de cada columna (-1 si no tiene) y si tiene dato en todas las siguientes."""
+        has_data = valid.any(axis=0)
+        first = np.where(has_data, valid.argmax(axis=0), -1)
+        contiguous = ~has_data | (valid.sum(axis=0) == len(valid) - first)
+        return first, contiguous
+
+    @staticmethod
+    def _suffix_sums(x, block_starts):
+        """Suma y productos cruzados de x[s:] para cada inicio s de block_starts (ordenados)."""
+        n_assets = x.shape[1]
+        sums = np.zeros((len(block_starts), n_assets))
+        cross = np.zeros((len(block_starts), n_assets, n_assets))
+        ends = np.append(block_starts[1:], len(x))
+        acc_sums, acc_cross = np.zeros(n_assets), np.zeros((n_assets, n_assets))
+        for b in range(len(block_starts) - 1, -1, -1):
+            segment = x[block_starts[b]:ends[b]]
+            acc_sums = acc_sums + segment.sum(axis=0)
+            acc_cross = acc_cross + segment.T @ segment
+            sums[b], cross[b] = acc_sums, acc_cross
+        return sums, cross
+
+    @classmethod
+    def from_returns(cls, returns, max_bytes=None):
+        """Momentos de una matriz de retornos (fechas x tickers, NaN = sin dato); None si superan max_bytes."""
+        valid = ~np.isnan(returns)
+        starts, contiguous = cls._layout(valid)
+        block_starts = np.unique(starts[contiguous & (starts >= 0)])
+        if max_bytes is not None and cls.estimated_nbytes(len(block_starts), returns.shape[1]) > max_bytes:
+            return None
+        sums, cross = cls._suffix_sums(np.where(valid, returns, 0.0), block_starts)
+        return cls(starts, contiguous, block_starts, sums, cross, len(returns))
+
+    def extended(self, returns):
+        """Momentos con filas de retornos agregadas al final; no modifica los actuales."""
+        valid = ~np.isnan(returns)
+        x = np.where(valid, returns, 0.0)
+        first, new_contiguous = self._layout(valid)
+        started = self.starts >= 0
+        # Los tickers que ya tenían datos deben seguir teniéndolos; el resto puede empezar en las filas nuevas
+        starts = np.where(started | (first < 0), self.starts, first + self.n_rows)
+        contiguous = np.where(started, self.contiguous & valid.all(axis=0), new_contiguous)
+        new_blocks = np.unique(starts[~started & (first >= 0) & contiguous])
+        new_sums, new_cross = self._suffix_sums(x, new_blocks - self.n_rows)
+        return CommonMoments(
+            starts, contiguous,
+            np.concatenate([self.block_starts, new_blocks]),
+            np.concatenate([self.sums + x.sum(axis=0), new_sums]),
+            np.concatenate([self.cross + x.T @ x, new_cross]),
+            self.n_rows + len(returns),
+        )
+
+    def subset(self, idx):
+        """
+        Media, covarianza y número de observaciones de las columnas idx sobre su muestra común
+        (media y covarianza None si hay menos de dos), o None si algún activo tiene huecos.
+        """
+        if not self.contiguous[idx].all():
+            return None
+        start = self.starts[idx].max()
+        n_obs = 0 if (self.starts[idx] < 0).any() else self.n_rows - start
+        if n_obs < 2:
+            return None, None, n_obs
+        b = np.searchsorted(self.block_starts, start)
+        sums = self.sums[b, idx]
+        mean = sums / n_obs
+        cov = (self.cross[b][np.ix_(idx, idx)] - np.outer(sums, sums) / n_obs) / (n_obs - 1)
+        return mean, cov, n_obs
+
+
+class UniverseStats:
+    """
+    Retornos de todo el universo de tickers, desde los que se extraen las estadísticas de cada canasta.
+
+    La media y la covarianza de una canasta se estiman sobre su muestra común (las fechas en que
+    todos sus activos tienen retorno), como pct_change().dropna() sobre la canasta: media y
+    covarianza salen de las mismas observaciones y la covarianza es semidefinida positiva.
+    Una covarianza por pares del universo, en cambio, mezcla muestras distintas por activo y
+    puede tener valores propios negativos cuando hay tickers con historia corta.
+
+    Las estadísticas se recortan de los CommonMoments del universo, calculados una sola vez
+    (moments=None si ocuparían más de MAX_MOMENT_BYTES: se estiman por canasta sobre los retornos).
+    """
+
+    def __init__(self, tickers, returns, last_prices=None, periods=252, moments=None):
+        self.tickers = list(tickers)
+        self.returns = returns
+        self.valid = ~np.isnan(returns)
+        # Estado para actualizar incrementalmente cuando llegan fechas nuevas (solo retornos diarios)
+        self.last_prices = last_prices
+        self.periods = periods
+        self.moments = moments
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    @property
+    def nbytes(self):
+        return self.returns.nbytes + self.valid.nbytes + (self.moments.nbytes if self.moments is not None else 0)
+
+    def extend(self, new_prices):
+        """
+        Nuevas estadísticas con los retornos de precios de fechas nuevas (filas x tickers del universo).
+
+        Solo se calculan los retornos y momentos de las filas nuevas. No modifica este objeto,
+        que puede estar compartido en la caché con otros hilos.
+        """
+        prices = ffill_matrix(np.vstack([self.last_prices, new_prices]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            returns = prices[1:] / prices[:-1] - 1
+        moments = self.moments.extended(returns) if self.moments is not None else None
+        if moments is not None and moments.nbytes > MAX_MOMENT_BYTES:
+            moments = None
+        return UniverseStats(self.tickers, np.vstack([self.returns, returns]), prices[-1:], self.periods, moments)
+
+    def common_returns(self, assets):
+        """Retornos de los activos en las fechas en que todos tienen dato."""
+        idx = [self._index[asset] for asset in assets]
+        rows = self.valid[:, idx].all(axis=1)
+        return self.returns[np.ix_(rows, idx)]
+
+    def subset(self, assets):
+        """Media y covarianza anualizadas de un conjunto de activos sobre su muestra común."""
+        assets = list(assets)
+        idx = [self._index[asset] for asset in assets]
+        sliced = self.moments.subset(idx) if self.moments is not None else None
+        if sliced is not None:
+            mean, cov, n_obs = sliced
+        else:
+            returns = self.common_returns(assets)
+            n_obs = len(returns)
+            if n_obs >= 2:
+                mean, cov = returns.mean(axis=0), np.atleast_2d(np.cov(returns, rowvar=False))
+        if n_obs < 2:
+            raise ValueError(f"⚠️ Los activos {', '.join(assets)} no tienen suficientes fechas en común.")
+        mean = pd.Series(mean * self.periods, index=assets)
+        cov = pd.DataFrame(cov * self.periods, index=assets, columns=assets)
+        return mean, cov
+
+
+def compute_returns(store, start_date=None, end_date=None, frequency="D", tickers=None):
+    """Retornos simples del universo completo (o de tickers) en la ventana y frecuencia indicadas."""
+    if frequency not in PERIODS_PER_YEAR:
+        raise ValueError("Frecuencia no reconocida. Usa 'D', 'W' o 'M'.")
+
+    prices = store.frame(tickers, start_date=start_date, end_date=end_date).ffill()
+    if frequency != "D":
+        prices = prices.resample(RESAMPLE_RULES[frequency]).last()
+    return prices.pct_change(fill_method=None)
+
+
+@profiler.timed("stats.compute")
+def compute_universe_stats(store, start_date=None, end_date=None, frequency="D"):
+    """
+    Calcula los retornos y momentos de todos los tickers una sola vez por ventana y frecuencia.
+
+    Las estadísticas de cada canasta se recortan después con UniverseStats.subset.
+    """
+    returns = compute_returns(store, start_date, end_date, frequency)
+    periods = PERIODS_PER_YEAR[frequency]
+    last_prices = None
+    if frequency == "D":
+        # Retornos diarios: se guarda el último precio para poder extenderlos con fechas nuevas
+        lo, hi = store.date_range(start_date, end_date)
+        last_prices = ffill_matrix(np.asarray(store.values[lo:hi], dtype=np.float64))[-1:]
+    values = returns.to_numpy(dtype=np.float64)
+    moments = CommonMoments.from_returns(values, MAX_MOMENT_BYTES)
+    return UniverseStats(returns.columns, values, last_prices, periods, moments)
+
+
+class StatsCache:
+    """
+    Caché LRU de estadísticas de retornos con límite de memoria.
+
+    Las entradas se indexan por (versión de los datos, ventana de fechas, frecuencia)
+    para el universo completo, y por (versión, activos, ventana, frecuencia) para
+    los subconjuntos ya extraídos. Es segura entre hilos (varias sesiones de Streamlit).
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @staticmethod
+    def _window(start_date, end_date):
+        return (
+            None if start_date is None else pd.Timestamp(start_date).normalize(),
+            None if end_date is None else pd.Timestamp(end_date).normalize(),
+        )
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                profiler.count("stats_cache.misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        profiler.count("stats_cache.hits")
+        return entry[0]
+
+    def _put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            # Expulsar las entradas menos usadas si se supera el número o la memoria permitida
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_bytes
+
+    def universe(self, store, start_date=None, end_date=None, frequency="D"):
+        """Estadísticas del universo completo, calculadas una sola vez por ventana y frecuencia."""
+        key = ("universe", store.version, self._window(start_date, end_date), frequency)
+        stats = self._get(key)
+        if stats is None:
+            stats = compute_universe_stats(store, start_date, end_date, frequency)
+            self._put(key, stats, stats.nbytes)
+        return stats
+
+    def get(self, store, assets, start_date=None, end_date=None, frequency="D", covariance="sample",
+            covariance_options=None):
+        """
+        Retorna (mean_returns, cov_matrix) anualizados para un conjunto de activos.
+
+        Parámetros:
+        - store (PriceStore): Almacén de precios.
+        - assets (list): Activos seleccionados.
+        - start_date, end_date (date): Ventana de estimación (inclusive).
+        - frequency (str): 'D', 'W' o 'M'.
+        - covariance (str): Estimador de covariance.ESTIMATORS. Con 'factor' la covarianza
+          se retorna como FactorCovariance en lugar de DataFrame.
+        - covariance_options (dict): Parámetros del estimador (halflife, n_factors).
+        """
+        assets = list(assets)
+        if covariance != "sample":
+            return self._get_estimated(store, assets, start_date, end_date, frequency, covariance,
+                                       covariance_options or {})
+
+        key = ("subset", store.version, tuple(assets), self._window(start_date, end_date), frequency)
+        stats = self._get(key)
+        if stats is None:
+            mean, cov = self.universe(store, start_date, end_date, frequency).subset(assets)
+            stats = (mean, cov)
+            self._put(key, stats, mean.nbytes + cov.to_numpy().nbytes)
+        return stats
+
+    def _get_estimated(self, store, assets, start_date, end_date, frequency, covariance, options):
+        """Media y covarianza con un estimador distinto de la muestral (misma muestra común), cacheadas por estimador."""
+        window = self._window(start_date, end_date)
+        key = ("estimator", store.version, tuple(assets), (covariance, tuple(sorted(options.items()))), window, frequency)
+        stats = self._get(key)
+        if stats is None:
+            returns = compute_returns(store, start_date, end_date, frequency, assets).to_numpy()[1:]
+            cov = estimate_covariance(returns, covariance, **options)
+            periods = PERIODS_PER_YEAR[frequency]
+            # Media sobre la misma muestra común que el estimador, sin armar la covarianza muestral
+            common = returns[np.isfinite(returns).all(axis=1)]
+            mean = pd.Series(common.mean(axis=0) * periods, index=assets)
+            if hasattr(cov, "scaled"):
+                cov, nbytes = cov.scaled(periods), cov.nbytes
+            else:
+                cov = pd.DataFrame(cov * periods, index=assets, columns=assets)
+                nbytes = cov.to_numpy().nbytes
+            stats = (mean, cov)
+            self._put(key, stats, mean.nbytes + nbytes)
+        return stats
+
+    def on_append(self, store, previous_version, first_row):
+        """
+        Actualiza la caché después de agregar fechas al almacén (PriceStore.append).
+
+        - Las entradas cuya ventana termina antes de la primera fecha nueva siguen siendo válidas
+          y solo se re-indexan con la nueva versión.
+        - Las estadísticas diarias del universo con ventana abierta se extienden con los
+          retornos de las fechas nuevas, sin recalcular toda la historia.
+        - El resto (frecuencias semanales/mensuales y subconjuntos afectados) se descarta.
+        """
+        first_date = pd.Timestamp(store.dates[first_row])
+        new_prices = np.asarray(store.values[first_row:], dtype=np.float64)
+        updated = OrderedDict()
+
+        with self._lock:
+            self._nbytes = 0
+            for key, (value, nbytes) in self._entries.items():
+                if key[1] != previous_version:
+                    updated[key] = (value, nbytes)
+                    self._nbytes += nbytes
+                    continue
+
+                window_end = key[-2][1]
+                new_key = (key[0], store.version) + key[2:]
+                if window_end is not None and window_end < first_date:
+                    updated[new_key] = (value, nbytes)
+                elif key[0] == "universe" and window_end is None and value.last_prices is not None:
+                    # extend retorna un objeto nuevo: quien ya leyó la versión anterior no ve cambios
+                    value = value.extend(new_prices)
+                    nbytes = value.nbytes
+                    updated[new_key] = (value, nbytes)
+                else:
+                    continue
+                self._nbytes += nbytes
+
+            self._entries = updated
+
+    def clear(self):
+        """Vacía la caché."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+# Caché compartida por el proceso (persiste entre reruns de Streamlit)
+default_stats_cache = StatsCache()
@@ -1,15 +1,248 @@
 import pandas as pd
 import streamlit as st
-from utils import load_prices, load_dictionary, map_tickers
+from utils import load_dictionary
+from price_store import PriceStore
 from portfolio import Portfolio
-from visualization import plot_portfolio_value  # ✅ Importamos el nuevo módulo
+from visualization import plot_portfolio_value, plot_efficient_frontier, clear_figure_cache
 import os
+import time
+import uuid
 from optimization import PortfolioOptimization
+from analytics import rolling_volatility, summary as risk_summary
+from profiling import profiler
+from stats_cache import default_stats_cache
+from covariance import ESTIMATORS
+from convex_optimization import asset_classes, group_bounds_from_dictionary
+from currency import DEFAULT_CURRENCY, CurrencyConverter
+from jobs import CANCELLED, FAILED, JobQueueFull, default_job_manager, job_key
+
+# Intervalo de consulta de los trabajos en segundo plano
+JOB_POLL_SECONDS = 0.5
 
+COVARIANCE_LABELS = {
+    "sample": "Muestral",
+    "ledoit_wolf": "Ledoit-Wolf (contracción)",
+    "ewma": "EWMA (vida media 63 días)",
+    "factor": "Modelo de factores (10 factores)",
+}
 
 
+def file_fingerprint(filepath):
+    """Huella barata de un archivo (fecha de modificación y tamaño) para usar como clave de caché."""
+    stat = os.stat(filepath)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def prices_fingerprint(prices_path, fx_path=None):
+    """
+    Huella del archivo de precios y del de tipos de cambio. Los deltas agregados con ingest.py
+    no cuentan: el almacén ya cargado los incorpora con PriceStore.sync (ver load_prices_synced).
+    """
+    fx = file_fingerprint(fx_path) if fx_path else None
+    return file_fingerprint(prices_path), fx
+
+
+@st.cache_resource(show_spinner="Cargando precios...", max_entries=2)
+def load_price_store(prices_path, fx_path, fingerprint):
+    """Almacén de precios compartido por todas las sesiones mientras los archivos de origen no cambien."""
+    return PriceStore(prices_path, fx_sources=fx_path)
+
+
+def load_prices_synced(prices_path, fx_path):
+    """
+    Almacén compartido con los deltas que ingest.py haya agregado desde la última ejecución.
+
+    Las fechas nuevas se agregan al almacén existente y las estadísticas ya calculadas se
+    extienden con ellas (StatsCache.on_append), sin reconstruir ni recalcular todo.
+    """
+    prices = load_price_store(prices_path, fx_path, prices_fingerprint(prices_path, fx_path))
+    prices.sync(default_stats_cache)
+    return prices
+
+
+@st.cache_data(show_spinner=False)
+def load_dictionary_cached(dictionary_path, fingerprint):
+    return load_dictionary(dictionary_path)
+
+
+@st.cache_resource(show_spinner=False)
+def load_converter(_prices, version, _dictionary, dictionary_fingerprint):
+    """Conversor de monedas por versión de los precios; guarda los precios convertidos por moneda base."""
+    return CurrencyConverter.from_dictionary(_prices, _dictionary)
+
+
+def _constraints(bounds=(), groups=(), current=(), max_turnover=None, max_volatility=None):
+    """Restricciones de PortfolioOptimization a partir de sus versiones en tuplas (claves de caché)."""
+    return {
+        "asset_bounds": dict((asset, (low, high)) for asset, low, high in bounds),
+        "group_bounds": {name: (list(members), low, high) for name, members, low, high in groups},
+        "current_weights": dict(current),
+        "max_turnover": max_turnover,
+        "max_volatility": max_volatility,
+    }
+
+
+def _optimize_job(job, prices, assets, objective, covariance, constraints):
+    """
+    Optimización en dos etapas: estimar media y covarianza y resolver. Cancelar interrumpe el
+    trabajo entre etapas; una resolución ya iniciada termina (es un único llamado al solver).
+    """
+    job.report(0, 2)
+    optimizer = PortfolioOptimization(prices, list(assets), objective=objective, covariance=covariance,
+                                      **_constraints(**constraints))
+    job.report(1, 2)
+    weights = optimizer.optimize()
+    job.report(2, 2)
+    return weights
+
+
+def _frontier_job(job, prices, assets, covariance, bounds):
+    optimizer = PortfolioOptimization(prices, list(assets), covariance=covariance, **_constraints(bounds))
+    return optimizer.efficient_frontier(progress=lambda done, total, partial: job.report(done, total, partial))
+
+
+def session_owner():
+    """Identificador de la sesión como dueña de sus trabajos en segundo plano."""
+    return st.session_state.setdefault("job_owner", uuid.uuid4().hex)
+
+
+def submit_optimization(prices, assets, objective, covariance="sample", constraints=None, owner=None):
+    """
+    Lanza (o reutiliza) la optimización en segundo plano, identificada por la versión de los datos,
+    los activos, el objetivo, el estimador y las restricciones (en tuplas, ver _constraints).
+    """
+    constraints = constraints or {}
+    key = job_key("optimize", prices.version, tuple(assets), objective, covariance, sorted(constraints.items()))
+    return default_job_manager.submit(key, _optimize_job, prices, tuple(assets), objective, covariance, constraints,
+                                      description=f"{objective} · {COVARIANCE_LABELS.get(covariance, covariance)}",
+                                      owner=owner)
+
+
+def submit_frontier(prices, assets, covariance="sample", bounds=(), owner=None):
+    """Lanza (o reutiliza) la frontera con los límites por activo; informa las esquinas o puntos listos como avance."""
+    key = job_key("frontier", prices.version, tuple(assets), covariance, bounds)
+    return default_job_manager.submit(key, _frontier_job, prices, tuple(assets), covariance, bounds,
+                                      description=f"Frontera · {COVARIANCE_LABELS.get(covariance, covariance)}",
+                                      owner=owner)
+
+
+def set_job(state_key, job):
+    """Guarda el trabajo del panel y suelta el anterior de la sesión (se cancela si nadie más lo espera)."""
+    previous = st.session_state.get(state_key)
+    if previous is not None and previous != job.key:
+        default_job_manager.release(previous, session_owner())
+    st.session_state[state_key] = job.key
+
+
+def show_optimization(weights):
+    if weights:
+        st.write("📊 **Pesos óptimos:**")
+        st.write(pd.DataFrame(weights.items(), columns=["Activo", "Peso (%)"]))
+    else:
+        st.warning("⚠️ No se encontró una solución óptima.")
+
+
+def show_frontier(frontier):
+    if not frontier.empty:
+        plot_efficient_frontier(frontier=frontier)
+
+
+def job_panel(state_key, render):
+    """
+    Muestra el trabajo guardado en session_state[state_key]. Mientras corre, solo este fragmento
+    se vuelve a ejecutar cada JOB_POLL_SECONDS para mostrar el avance y el resultado parcial.
+    """
+    key = st.session_state.get(state_key)
+    job = default_job_manager.get(key) if key else None
+    if job is None:
+        return
+    polling = not job.finished
+    st.fragment(run_every=JOB_POLL_SECONDS if polling else None)(_job_view)(state_key, key, render, polling)
+
+
+def _job_view(state_key, key, render, polling):
+    job = default_job_manager.get(key)
+    if job is None:
+        return
+    if not job.finished:
+        st.progress(job.progress, text=f"⏳ {job.description}: {job.done}/{job.total or '?'} ({job.elapsed:.1f} s)")
+        if st.button("⏹️ Cancelar", key=f"cancel_{state_key}"):
+            # Se cancela solo si ninguna otra sesión espera el mismo trabajo
+            default_job_manager.release(key, session_owner())
+            st.session_state[state_key] = None
+            st.rerun()
+        partial = job.partial
+        if partial is not None:
+            render(partial)
+    elif polling:
+        # Terminó durante la consulta: una ejecución completa deja de consultar
+        st.rerun()
+    elif job.status == CANCELLED:
+        st.info(f"⏹️ {job.description}: cancelado.")
+    elif job.status == FAILED:
+        st.error(f"⚠️ {job.description}: {job.error}")
+    else:
+        st.caption(f"{job.description} ({job.elapsed:.2f} s)")
+        render(job.result)
+
+
+def invalidate_caches():
+    """Descarta los datos cacheados (precios, diccionario, estadísticas y optimizaciones)."""
+    load_price_store.clear()
+    load_dictionary_cached.clear()
+    load_converter.clear()
+    default_job_manager.clear()
+    clear_figure_cache()
+    default_stats_cache.clear()
+
+
+def performance_panel(rerun_start):
+    """
+    Panel lateral con los tiempos por etapa, contadores del optimizador y aciertos de caché de
+    esta ejecución, y las duraciones de los trabajos en segundo plano (que corren fuera de ella).
+    """
+    with st.sidebar.expander("⏱️ Rendimiento"):
+        st.checkbox("Medir etapas en cada ejecución", key="performance_panel")
+        jobs = profiler.jobs()
+        if jobs:
+            st.caption("Trabajos en segundo plano (todas las sesiones)")
+            st.dataframe(pd.DataFrame({
+                "Trabajo": list(jobs),
+                "Ejecuciones": [stats["calls"] for stats in jobs.values()],
+                "Último (ms)": [round(stats["last"] * 1000, 1) for stats in jobs.values()],
+                "Máximo (ms)": [round(stats["max"] * 1000, 1) for stats in jobs.values()],
+            }), hide_index=True)
+        if not profiler.enabled:
+            st.caption("Activa la medición para ver los tiempos de la próxima ejecución.")
+            return
+
+        profiler.record("rerun", time.perf_counter() - rerun_start)
+        rows = pd.DataFrame(profiler.rows())
+        stages = rows[rows["kind"] == "stage"]
+        st.dataframe(pd.DataFrame({
+            "Etapa": stages["name"],
+            "Llamadas": stages["calls"].astype(int),
+            "Total (ms)": (stages["total"] * 1000).round(1),
+            "Máximo (ms)": (stages["max"] * 1000).round(1),
+        }), hide_index=True)
+
+        counters = profiler.snapshot()["counters"]
+        hits, misses = counters.get("stats_cache.hits", 0), counters.get("stats_cache.misses", 0)
+        if hits + misses:
+            st.write(f"🗃️ Aciertos de la caché de estadísticas: {hits / (hits + misses):.0%} ({hits}/{hits + misses})")
+        solver_counters = {name: value for name, value in counters.items() if not name.startswith("stats_cache.")}
+        if solver_counters:
+            st.dataframe(pd.DataFrame(solver_counters.items(), columns=["Contador", "Valor"]), hide_index=True)
+
+        st.download_button("⬇️ JSON", profiler.to_json(), "rendimiento.json", "application/json")
+        st.download_button("⬇️ CSV", profiler.to_csv(), "rendimiento.csv", "text/csv")
+
 
 def main():
+    rerun_start = time.perf_counter()
+    # La medición se activa desde el panel de rendimiento y abarca toda la ejecución
+    profiler.enable(st.session_state.get("performance_panel", False))
+
     st.title("📊 Simulación de Portafolio de Activos")
 
     # Obtener el directorio del script actual
@@ -18,25 +251,34 @@ def main():
     # Construir rutas absolutas a los archivos
     prices_path = os.path.join(BASE_DIR, "data", "precios.xlsx")
     dictionary_path = os.path.join(BASE_DIR, "data", "diccionario.json")
-
-    # Cargar datos usando las rutas absolutas
-    prices_df = load_prices(prices_path)
-    dictionary = load_dictionary(dictionary_path)
-
-    # Normalizar nombres de columnas y convertir fechas
-    prices_df.columns = prices_df.columns.str.strip().str.upper()
-    prices_df["DATE"] = pd.to_datetime(prices_df["DATE"], errors="coerce")
-
-    # Filtrar solo fechas válidas
-    prices_df = prices_df.dropna(subset=["DATE"]).sort_values(by="DATE")
+    # Tipos de cambio ('USDCLP CURNCY', ...) en un archivo propio, opcional
+    fx_path = os.path.join(BASE_DIR, "data", "tipos_cambio.xlsx")
+    fx_path = fx_path if os.path.exists(fx_path) else None
+
+    if st.sidebar.button("🔄 Recargar datos"):
+        invalidate_caches()
+
+    # Datos cacheados entre reruns y sesiones, indexados por la huella de cada archivo (el almacén
+    # columnar solo vuelve a parsear el Excel si cambió su contenido; los deltas se agregan en el lugar)
+    prices = load_prices_synced(prices_path, fx_path)
+    dictionary = load_dictionary_cached(dictionary_path, file_fingerprint(dictionary_path))
+
+    # Moneda de reporte: los precios convertidos se calculan una vez por moneda y quedan en caché
+    converter = load_converter(prices, prices.version, dictionary, file_fingerprint(dictionary_path))
+    bases = converter.available_bases()
+    if len(bases) > 1:
+        base_currency = st.sidebar.selectbox("💱 Moneda de reporte", bases, index=bases.index(DEFAULT_CURRENCY)
+                                             if DEFAULT_CURRENCY in bases else 0)
+    else:
+        base_currency = bases[0] if bases else DEFAULT_CURRENCY
+    prices = converter.converted(base_currency)
 
     # Verificar fechas disponibles en los datos
-    if prices_df.empty or "DATE" not in prices_df.columns:
+    if len(prices) == 0:
         st.error("⚠️ No se encontraron datos de precios. Verifica el archivo `precios.xlsx`.")
         return
 
-    available_dates = prices_df["DATE"].dt.date.unique()
-    min_date, max_date = available_dates[0], available_dates[-1]
+    min_date, max_date = pd.Timestamp(prices.dates[0]).date(), pd.Timestamp(prices.dates[-1]).date()
     st.sidebar.write(f"📅 Fechas disponibles: {min_date} - {max_date}")
 
     # Selección de la fecha de inicio del portafolio
@@ -50,7 +292,7 @@ def main():
 
     # Sección para definir asignación del capital
     st.sidebar.header("⚖️ Gestión de Portafolio")
-    tickers = [col for col in prices_df.columns if col != "DATE"]
+    tickers = prices.tickers
 
     allocation = {}
     total_allocation = 0
@@ -73,12 +315,13 @@ def main():
             log_messages = []
             missing_tickers = []
 
+            # Tickers con precio en la fecha de inicio, desde el índice de validez del almacén
+            tradable = set(prices.tradable(start_date))
+
             for ticker, percentage in allocation.items():
                 if percentage > 0:
-                    valid_dates = prices_df.loc[~prices_df[ticker].isna(), "DATE"]
-
-                    if not valid_dates.empty and start_date in valid_dates.dt.date.values:
-                        st.session_state.portfolio.add_asset(ticker, percentage, prices_df, start_date)
+                    if ticker in tradable:
+                        st.session_state.portfolio.add_asset(ticker, percentage, prices, start_date, base_currency)
                         log_messages.append(f"📌 {ticker}: {percentage}% asignado ({start_date})")
                     else:
                         missing_tickers.append(ticker)
@@ -94,10 +337,21 @@ def main():
     assets = portfolio.list_assets()
     if assets:
         df_assets = pd.DataFrame(assets)
-        df_assets["inversión_inicial"] = df_assets["initial_value"]
-        df_assets = df_assets[["ticker", "percentage", "cantidad", "initial_price", "inversión_inicial"]]
-        df_assets.columns = ["Ticker", "% Asignado", "Cantidad Comprada", "Precio Inicial", "Inversión Inicial"]
-        st.table(df_assets)
+        columns = {"ticker": "Ticker", "percentage": "% Asignado", "cantidad": "Cantidad Comprada",
+                   "initial_price": "Precio Inicial", "initial_value": "Inversión Inicial", "currency": "Moneda"}
+        # El precio y el monto quedan en la moneda de compra; si la moneda de reporte cambió,
+        # el monto se muestra también convertido con el tipo de cambio de la fecha de compra
+        if (df_assets["currency"] != base_currency).any():
+            try:
+                df_assets["converted"] = [
+                    converter.convert(asset["initial_value"], asset["currency"] or converter.currencies.get(
+                        asset["ticker"], DEFAULT_CURRENCY), base_currency, asset["start_date"])
+                    for asset in assets
+                ]
+                columns["converted"] = f"Inversión Inicial ({base_currency})"
+            except ValueError as e:
+                st.warning(e)
+        st.table(df_assets[list(columns)].rename(columns=columns))
     else:
         st.write("❌ No se han añadido activos al portafolio.")
 
@@ -107,7 +361,7 @@ def main():
 
     if st.button("🔄 Simular Valor del Portafolio"):
         try:
-            total_value = portfolio.simulate(prices_df, selected_date)
+            total_value = portfolio.simulate(prices, selected_date)
             st.write(f"💰 **Valor total del portafolio en {selected_date}: ${total_value:.2f}**")
         except ValueError as e:
             st.error(e)
@@ -118,17 +372,26 @@ def main():
     end_date = st.date_input("📅 Fecha de Fin", min_value=start_date_rend, max_value=max_date, key="end_date")
 
     if st.button("📊 Mostrar Evolución del Portafolio"):
-        plot_portfolio_value(portfolio, prices_df, start_date_rend, end_date)
+        plot_portfolio_value(portfolio, prices, start_date_rend, end_date, currency=base_currency)
 
     if st.button("📊 Calcular Rendimiento del Portafolio"):
         try:
-            returns = portfolio.calculate_returns(prices_df, start_date_rend, end_date)
+            returns = portfolio.calculate_returns(prices, start_date_rend, end_date)
             st.write(f"📊 **Rendimiento del portafolio de {start_date_rend} a {end_date}: {returns:.2f}%**")
         except ValueError as e:
             st.error(e)
 
+    if st.button("📉 Métricas de Riesgo"):
+        values = portfolio.value_series(prices, start_date_rend, end_date, nan_policy="ffill")
+        if len(values) < 2:
+            st.warning("⚠️ No hay suficientes datos en el rango seleccionado.")
+        else:
+            metrics = risk_summary(values, prices)
+            st.write(pd.DataFrame(metrics.items(), columns=["Métrica", "Valor"]))
+            st.line_chart(rolling_volatility(values).rename("Volatilidad móvil (63 días)"))
+
     # Selección de los activos del portafolio
-    selected_assets = [asset["ticker"] for asset in portfolio.list_assets()]
+    selected_assets = list(portfolio.holdings.tickers)
 
     # Verificar si hay activos seleccionados antes de continuar
     if not selected_assets:
@@ -138,26 +401,63 @@ def main():
         st.sidebar.header("⚖️ Restricciones de Asignación")
         custom_bounds = {}
 
+        # Sin límite por defecto: solo se restringen los activos cuyo rango se mueve
         for asset in selected_assets:
-            min_w = st.sidebar.slider(f"🔽 Mínimo % en {asset}", 0.0, 1.0, 0.05, step=0.05)
-            max_w = st.sidebar.slider(f"🔼 Máximo % en {asset}", min_w, 1.0, 0.50, step=0.05)
-            custom_bounds[asset] = (min_w, max_w)
+            low, high = st.sidebar.slider(f"⚖️ Rango % en {asset}", 0.0, 1.0, (0.0, 1.0), step=0.05)
+            if (low, high) != (0.0, 1.0):
+                custom_bounds[asset] = (low, high)
+
+        # Límites por clase de activo (campo Class de diccionario.json)
+        classes = asset_classes(dictionary, selected_assets)
+        class_limits = {}
+        for name in classes:
+            low, high = st.sidebar.slider(f"🏷️ Rango % en {name}", 0.0, 1.0, (0.0, 1.0), step=0.05)
+            if (low, high) != (0.0, 1.0):
+                class_limits[name] = (low, high)
+        group_bounds = group_bounds_from_dictionary(dictionary, selected_assets, class_limits)
+
+        max_volatility = st.sidebar.number_input("📉 Volatilidad anual máxima (0 = sin límite)", 0.0, 1.0, 0.0, step=0.01)
+        max_turnover = st.sidebar.number_input("🔁 Rotación máxima vs. portafolio actual (0 = sin límite)", 0.0, 2.0, 0.0, step=0.05)
+        current_weights = portfolio.current_weights(prices) if max_turnover else {}
+
+        constraints = {
+            "bounds": tuple((asset, low, high) for asset, (low, high) in custom_bounds.items()),
+            "groups": tuple((name, tuple(members), low, high) for name, (members, low, high) in group_bounds.items()),
+            "current": tuple(current_weights.items()),
+            "max_turnover": max_turnover or None,
+            "max_volatility": max_volatility or None,
+        }
 
     st.header("🔬 Optimización de Portafolio")
     objective = st.selectbox("Selecciona el objetivo de optimización:", ["sharpe", "volatility", "return"])
+    covariance = st.selectbox("Estimador de covarianza:", list(ESTIMATORS),
+                              format_func=lambda name: COVARIANCE_LABELS.get(name, name))
 
     if st.button("🚀 Optimizar Portafolio"):
-        optimizer = PortfolioOptimization(prices_df, selected_assets, objective=objective)
-        optimized_weights = optimizer.optimize()
-
-        if optimized_weights:
-            st.write("📊 **Pesos óptimos:**")
-            st.write(pd.DataFrame(optimized_weights.items(), columns=["Activo", "Peso (%)"]))
+        if not selected_assets:
+            st.warning("⚠️ No seleccionaste ningún activo.")
+        else:
+            # El trabajo sigue corriendo aunque la página se vuelva a ejecutar
+            try:
+                set_job("optimize_job", submit_optimization(prices, selected_assets, objective, covariance, constraints,
+                                                            owner=session_owner()))
+            except JobQueueFull as e:
+                st.warning(str(e))
+    job_panel("optimize_job", show_optimization)
 
     # Frontera Eficiente
     if st.button("📈 Mostrar Frontera Eficiente"):
-        optimizer = PortfolioOptimization(prices_df, selected_assets)
-        optimizer.plot_efficient_frontier()
+        if not selected_assets:
+            st.warning("⚠️ No seleccionaste ningún activo.")
+        else:
+            try:
+                set_job("frontier_job", submit_frontier(prices, selected_assets, covariance, constraints["bounds"],
+                                                        owner=session_owner()))
+            except JobQueueFull as e:
+                st.warning(str(e))
+    job_panel("frontier_job", show_frontier)
+
+    performance_panel(rerun_start)
 
 
 if __name__ == "__main__":
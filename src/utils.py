@@ -1,12 +1,20 @@
 # src/utils.py
-import pandas as pd
 import json
+import logging
+
+import pandas as pd
+
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
 
+@profiler.timed("load.excel")
 def load_prices(filepath):
     df = pd.read_excel(filepath)
     df['DATE'] = pd.to_datetime(df['DATE']).dt.normalize()  # Convertir a datetime
     return df
 
+@profiler.timed("load.dictionary")
 def load_dictionary(filepath):
     """Carga el diccionario JSON."""
     with open(filepath, 'r', encoding='utf-8') as f:
@@ -15,6 +23,7 @@ def load_dictionary(filepath):
 
 # src/utils.py
 
+@profiler.timed("map.tickers")
 def map_tickers(prices_df, dictionary):
     """Mapea los tickers a nombres y categorías con validación."""
     # Normalizar nombres de columnas (eliminar espacios y convertir a mayúsculas)
@@ -25,7 +34,7 @@ def map_tickers(prices_df, dictionary):
     invalid_tickers = [ticker for ticker in valid_tickers if ticker not in dictionary]
     
     if invalid_tickers:
-        print(f"Advertencia: Los siguientes tickers no están en el diccionario: {', '.join(invalid_tickers)}")
+        logger.warning("Los siguientes tickers no están en el diccionario: %s", ", ".join(invalid_tickers))
     
     # Crear un DataFrame con la información del diccionario
     ticker_info = {ticker.upper(): info for ticker, info in dictionary.items()}
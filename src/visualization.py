@@ -1,34 +1,89 @@
-import pandas as pd
-import plotly.graph_objects as go
-import streamlit as st
-import plotly
-
-def plot_portfolio_value(portfolio, prices_df, start_date, end_date):
-    """Genera un gráfico interactivo de área del valor del portafolio en el tiempo usando Plotly."""
-    
-    # Filtrar precios en el rango de fechas seleccionado
-    mask = (prices_df["DATE"].dt.date >= start_date) & (prices_df["DATE"].dt.date <= end_date)
-    filtered_prices = prices_df.loc[mask]
-
-    if filtered_prices.empty:
+# Plotly y Streamlit se importan dentro de cada función para que el núcleo de cálculo
+# (portfolio, optimization, price_store) pueda usarse sin cargar la capa de interfaz.
+#
+# Las series largas se reducen con chart_data.downsample antes de armar la figura, y las
+# figuras ya armadas se guardan por sus datos de entrada: un rerun con los mismos datos
+# no recalcula ni reconstruye la figura.
+import threading
+from collections import OrderedDict
+
+from chart_data import DEFAULT_MAX_POINTS, downsample, series_fingerprint
+from price_store import as_price_store
+from profiling import profiler
+
+FREQUENCY_LABELS = {"D": "diario", "W": "semanal", "M": "mensual"}
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+_MISSING = object()
+MAX_CACHED_FIGURES = 32
+
+
+def _cached_figure(key, build):
+    """Figura guardada para key, o la construye con build() y la guarda (LRU); un None también queda guardado."""
+    with _figures_lock:
+        fig = _figures.get(key, _MISSING)
+        if fig is not _MISSING:
+            _figures.move_to_end(key)
+            profiler.count("plot.figure_cache_hits")
+            return fig
+    fig = build()
+    with _figures_lock:
+        _figures[key] = fig
+        while len(_figures) > MAX_CACHED_FIGURES:
+            _figures.popitem(last=False)
+    return fig
+
+
+def clear_figure_cache():
+    with _figures_lock:
+        _figures.clear()
+
+
+@profiler.timed("plot.portfolio_value")
+def plot_portfolio_value(portfolio, prices_df, start_date, end_date, max_points=DEFAULT_MAX_POINTS, method="lttb",
+                         currency="USD"):
+    """
+    Genera un gráfico interactivo de área del valor del portafolio en el tiempo usando Plotly.
+
+    La serie se reduce a lo más max_points puntos (cierres semanales o mensuales en rangos
+    largos, luego LTTB o min/max según method).
+    """
+    import streamlit as st
+
+    store = as_price_store(prices_df)
+    holdings = (tuple(portfolio.holdings.tickers), portfolio.holdings.view("quantity").tobytes())
+    key = ("portfolio_value", store.version, holdings, str(start_date), str(end_date), max_points, method, currency)
+    fig = _cached_figure(key, lambda: _portfolio_value_figure(portfolio, store, start_date, end_date, max_points,
+                                                              method, currency))
+
+    if fig is None:
         st.warning("⚠️ No hay datos de precios en el rango de fechas seleccionado.")
         return
 
-    # Calcular el valor del portafolio en cada fecha
-    portfolio_values = []
-    dates = []
+    # Mostrar el gráfico en Streamlit
+    with profiler.stage("plot.render"):
+        st.plotly_chart(fig, use_container_width=True)
+
 
-    for date in filtered_prices["DATE"].dt.date.unique():
-        value = portfolio.simulate(prices_df, date)
-        portfolio_values.append(value)
-        dates.append(date)
+def _portfolio_value_figure(portfolio, store, start_date, end_date, max_points, method, currency):
+    import plotly.graph_objects as go
+
+    # Calcular el valor del portafolio en todas las fechas del rango en una sola pasada
+    values = portfolio.value_series(store, start_date, end_date)
+    if values.empty:
+        return None
+
+    with profiler.stage("plot.downsample"):
+        values, frequency = downsample(values, max_points, method)
+    profiler.count("plot.points", len(values))
 
     # Crear gráfico de área con Plotly
     fig = go.Figure()
 
     fig.add_trace(go.Scatter(
-        x=dates, 
-        y=portfolio_values,
+        x=values.index.date,
+        y=values.to_numpy(),
         mode='lines',  # 🔹 Solo líneas, sin puntos
         fill='tozeroy',  # 🔹 Rellena el área bajo la línea
         name='Valor del Portafolio',
@@ -36,14 +91,68 @@ def plot_portfolio_value(portfolio, prices_df, start_date, end_date):
     ))
 
     # Personalizar el diseño del gráfico
+    title = "📈 Evolución del Valor del Portafolio"
+    if frequency != "D":
+        title += f" ({FREQUENCY_LABELS[frequency]})"
     fig.update_layout(
-        title="📈 Evolución del Valor del Portafolio",
+        title=title,
         xaxis_title="Fecha",
-        yaxis_title="Valor en USD",
+        yaxis_title=f"Valor en {currency}",
         template="plotly_white",
         hovermode="x unified",
         showlegend=False
     )
+    return fig
 
-    # Mostrar el gráfico en Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+
+@profiler.timed("plot.efficient_frontier")
+def plot_efficient_frontier(optimizer=None, n_points=50, method="auto", frontier=None):
+    """
+    Genera y grafica la Frontera Eficiente de un PortfolioOptimization.
+
+    Si se entrega `frontier` (resultado de efficient_frontier, por ejemplo desde una caché)
+    se grafica directamente sin recalcularla.
+    """
+    import streamlit as st
+
+    if frontier is None:
+        frontier = optimizer.efficient_frontier(n_points, method)
+
+    if frontier.empty:
+        st.warning("⚠️ No se pudo calcular la frontera eficiente.")
+        return
+
+    fig = efficient_frontier_figure(frontier)
+
+    # Mostrar en Streamlit
+    with profiler.stage("plot.render"):
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def efficient_frontier_figure(frontier):
+    """Figura de la frontera (resultado de efficient_frontier), guardada por sus datos."""
+    key = ("efficient_frontier", series_fingerprint(frontier["risk"].to_numpy(), frontier["return"].to_numpy()))
+    return _cached_figure(key, lambda: _efficient_frontier_figure(frontier))
+
+
+def _efficient_frontier_figure(frontier):
+    import plotly.graph_objects as go
+
+    # Crear gráfico con Plotly
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=frontier["risk"],
+        y=frontier["return"],
+        mode='lines',
+        name='Frontera Eficiente',
+        line=dict(color='green', width=2)
+    ))
+
+    # Personalizar gráfico
+    fig.update_layout(
+        title="📈 Frontera Eficiente de Portafolio",
+        xaxis_title="Riesgo (Volatilidad Anualizada)",
+        yaxis_title="Retorno Esperado",
+        template="plotly_white"
+    )
+    return fig
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Los módulos de la app se importan planos desde src/ (igual que al correr streamlit o main.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture
+def prices_df():
+    """Precios sintéticos en días hábiles: tres tickers completos y uno que empieza tarde."""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2020-01-01", periods=400)
+    returns = rng.normal(0.0004, 0.01, size=(len(dates), 4))
+    prices = 100 * np.cumprod(1 + returns, axis=0)
+    prices[:300, 3] = np.nan
+    df = pd.DataFrame(prices, columns=["AAA", "BBB", "CCC", "LATE"])
+    df.insert(0, "DATE", dates)
+    return df
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import (beta, cvar_historical, drawdown, max_drawdown, rolling_volatility, summary,
+                       var_historical, var_parametric)
+from price_store import PriceStore
+
+
+def _series(values):
+    return pd.Series(values, index=pd.bdate_range("2024-01-01", periods=len(values)), dtype=float)
+
+
+def test_max_drawdown_skips_leading_zeros():
+    values = _series([0, 0, 100, 120, 90, 130])
+    result = max_drawdown(values)
+    assert result["max_drawdown"] == 90 / 120 - 1
+    assert result["peak"] == values.index[3]
+    assert result["trough"] == values.index[4]
+    assert result["recovery"] == values.index[5]
+    assert result["max_duration"] == 1
+    assert drawdown(values).iloc[:2].isna().all()
+
+
+def test_max_drawdown_undefined_without_positive_values():
+    result = max_drawdown(_series([0, 0, 0]))
+    assert result["max_drawdown"] is None and result["trough"] is None
+    # summary lo reporta como null en JSON (NaN no es JSON válido)
+    assert json.dumps(summary(_series([0, 0, 0])), allow_nan=False)
+
+
+def test_max_drawdown_total_loss():
+    assert max_drawdown(_series([100, 50, 0]))["max_drawdown"] == -1.0
+
+
+def _random_walk(n=300, seed=5, scale=0.01):
+    rng = np.random.default_rng(seed)
+    return _series(100 * np.cumprod(1 + rng.normal(0.0003, scale, n)))
+
+
+def test_rolling_volatility_matches_pandas():
+    values = _random_walk()
+    result = rolling_volatility(values, window=21)
+    expected = values.pct_change().iloc[1:].rolling(21).std() * np.sqrt(252)
+    assert result.iloc[:20].isna().all()
+    np.testing.assert_allclose(result.iloc[20:].to_numpy(), expected.iloc[20:].to_numpy(), rtol=1e-9)
+
+
+def test_historical_var_and_cvar():
+    values = _random_walk()
+    returns = values.pct_change().iloc[1:].to_numpy()
+    var = var_historical(values, 0.95)
+    assert var == pytest.approx(-np.quantile(returns, 0.05))
+    assert cvar_historical(values, 0.95) >= var
+    assert var_parametric(values, 0.99) > var_parametric(values, 0.95)
+
+
+def _benchmark_store(values, benchmark):
+    df = pd.DataFrame({"DATE": values.index, "AAA": values.to_numpy(), "MXWD INDEX": benchmark.to_numpy()})
+    return PriceStore.from_frame(df)
+
+
+def test_beta_of_leveraged_benchmark():
+    benchmark = _random_walk(seed=6)
+    values = 100 * (1 + 1.5 * benchmark.pct_change().fillna(0)).cumprod()
+    assert beta(values, _benchmark_store(values, benchmark)) == pytest.approx(1.5)
+
+
+def test_beta_is_none_without_benchmark(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    values = pd.Series(store.frame(["AAA"])["AAA"].to_numpy(), index=pd.DatetimeIndex(store.dates))
+    assert beta(values, store) is None
+    metrics = summary(values, store)
+    assert metrics["beta"] is None
+    assert metrics["annual_volatility"] > 0
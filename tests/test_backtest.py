@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import Backtest, WalkForwardTarget
+from optimization import PortfolioOptimization
+from price_store import PriceStore
+
+
+@pytest.mark.parametrize("rebalance, period", [("ME", "M"), ("QE", "Q"), ("YE", "Y"), ("W", "W")])
+def test_calendar_rows_start_each_period(prices_df, rebalance, period):
+    backtest = Backtest(PriceStore.from_frame(prices_df), ["AAA", "BBB"], rebalance=rebalance)
+    rows = backtest._calendar_rows()
+    periods = backtest.dates.to_period(period)
+    assert rows[0] == 0
+    assert len(rows) == periods.nunique()
+    assert (periods[rows[1:]] != periods[rows[1:] - 1]).all()
+
+
+def test_unknown_rebalance_frequency_is_rejected(prices_df):
+    with pytest.raises(ValueError, match="rebalanceo"):
+        Backtest(PriceStore.from_frame(prices_df), ["AAA"], rebalance="E")
+
+
+def test_fixed_weights_without_costs_track_buy_and_hold_between_rebalances(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    result = Backtest(store, ["AAA"], rebalance="YE").run({"AAA": 1.0})
+    expected = 1000 * prices_df["AAA"] / prices_df["AAA"].iloc[0]
+    pd.testing.assert_series_equal(result.values, expected.set_axis(result.values.index), check_names=False)
+
+
+def test_threshold_rebalances_when_a_weight_drifts_past_it(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    target, threshold = np.array([0.5, 0.5]), 0.02
+    result = Backtest(store, ["AAA", "BBB"], rebalance=None, threshold=threshold).run({"AAA": 0.5, "BBB": 0.5})
+
+    # Referencia fecha a fecha: se rebalancea en la primera fecha cuyo desvío supera el umbral
+    prices = prices_df[["AAA", "BBB"]].to_numpy()
+    quantities, values, rebalances = np.zeros(2), [], []
+    for row, price in enumerate(prices):
+        value = quantities @ price
+        if row == 0 or np.abs(quantities * price / value - target).max() > threshold:
+            value = value if row else 1000.0
+            quantities = target * value / price
+            rebalances.append(prices_df["DATE"].iloc[row])
+        values.append(quantities @ price)
+
+    assert len(rebalances) > 2
+    assert list(result.weights.index) == rebalances
+    np.testing.assert_allclose(result.values.to_numpy(), values)
+
+
+def test_transaction_costs_are_charged_on_each_rebalance(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    weights = {"AAA": 0.5, "BBB": 0.5}
+    free = Backtest(store, ["AAA", "BBB"], rebalance="ME").run(weights)
+    costly = Backtest(store, ["AAA", "BBB"], rebalance="ME", proportional_cost=0.001, fixed_cost=1.0).run(weights)
+
+    # Compra inicial: 10 pb de 1000 más 1 por cada uno de los dos activos
+    assert costly.costs.iloc[0] == pytest.approx(3.0)
+    assert costly.values.iloc[0] == pytest.approx(997.0)
+    assert list(costly.costs.index) == list(costly.weights.index)
+    assert (costly.costs.iloc[1:] > 2.0).all()
+    assert costly.total_cost > 3.0
+    assert costly.values.iloc[-1] < free.values.iloc[-1] - costly.total_cost * 0.9
+
+
+def test_walk_forward_target_uses_assets_covering_the_window(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    tickers, window = ["AAA", "BBB", "CCC", "LATE"], 60
+    backtest = Backtest(store, tickers, rebalance="ME")
+    result = backtest.run(WalkForwardTarget(objective="volatility", window=window))
+
+    rows = backtest.dates.get_indexer(result.weights.index)
+    assert (rows >= window).all()
+    late_start = int(np.flatnonzero(~np.isnan(backtest.returns[:, 3]))[0])
+    covered = rows - window >= late_start
+    assert covered.any() and (~covered).any()
+    assert (result.weights["LATE"][~covered] == 0).all()
+    np.testing.assert_allclose(result.weights.sum(axis=1), 1.0)
+
+    # El último rebalanceo coincide con optimizar sobre la ventana completa de los cuatro activos
+    row = rows[-1]
+    returns = pd.DataFrame(backtest.returns[row - window:row], columns=tickers)
+    expected = PortfolioOptimization.from_stats(returns.mean() * 252, returns.cov() * 252,
+                                                objective="volatility").solve().x
+    np.testing.assert_allclose(result.weights.iloc[-1].to_numpy(), expected, atol=1e-6)
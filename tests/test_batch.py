@@ -0,0 +1,46 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from batch import batch_optimize
+from price_store import PriceStore
+from stats_cache import StatsCache
+
+
+def _run(prices_df, jobs, executor):
+    results = list(batch_optimize(PriceStore.from_frame(prices_df), jobs, executor=executor, stats_cache=StatsCache()))
+    return {result["id"]: result for result in results}
+
+
+def test_batch_reports_each_job(prices_df):
+    jobs = [
+        {"id": "ok", "assets": ["AAA", "BBB", "CCC"], "objective": "volatility"},
+        {"id": "unknown", "assets": ["AAA", "ZZZ"]},
+        {"id": "objective", "assets": ["AAA", "BBB"], "objective": "nope"},
+    ]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = _run(prices_df, jobs, executor)
+
+    assert set(results) == {"ok", "unknown", "objective"}
+    ok = results["ok"]
+    assert ok["success"] and set(ok["weights"]) == {"AAA", "BBB", "CCC"}
+    assert sum(ok["weights"].values()) == pytest.approx(1.0)
+    assert not results["unknown"]["success"] and "ZZZ" in results["unknown"]["message"]
+    assert not results["objective"]["success"] and results["objective"]["message"]
+    assert results["objective"]["weights"] is None
+
+
+class _BrokenExecutor:
+    """Ejecutor cuyos trabajos fallan fuera de _run_job (como un proceso que muere)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(RuntimeError("worker died"))
+        return future
+
+
+def test_batch_reports_executor_failures_per_job(prices_df):
+    jobs = [{"id": i, "assets": ["AAA", "BBB"]} for i in range(2)]
+    results = _run(prices_df, jobs, _BrokenExecutor())
+    assert set(results) == {0, 1}
+    assert all(not r["success"] and "worker died" in r["message"] for r in results.values())
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from benchmark import compare, parse_scale, run_scale, synthetic_prices
+
+
+def test_synthetic_prices_shape_and_missing_density():
+    df = synthetic_prices(500, 20, nan_density=0.1, seed=3)
+    assert df.shape == (500, 21) and df.columns[0] == "DATE"
+    assert df["DATE"].is_monotonic_increasing
+    prices = df.iloc[:, 1:].to_numpy()
+    assert 0.02 < np.isnan(prices).mean() < 0.2
+    assert (prices[~np.isnan(prices)] > 0).all()
+    assert synthetic_prices(50, 3, seed=1).equals(synthetic_prices(50, 3, seed=1))
+
+
+def test_parse_scale():
+    assert parse_scale("1000x10") == (1000, 10)
+    assert parse_scale("250X5") == (250, 5)
+    with pytest.raises(ValueError):
+        parse_scale("1000")
+
+
+def test_compare_flags_regressions():
+    def document(timings):
+        return {"results": [{"n_dates": 100, "n_tickers": 5, "nan_density": 0.0, "case": case, "min": t}
+                            for case, t in timings.items()]}
+
+    rows, regressions = compare(document({"simulate": 1.0, "optimize": 1.0}),
+                                document({"simulate": 1.1, "optimize": 2.0, "new_case": 1.0}), threshold=0.2)
+    assert [row[1] for row in rows] == ["simulate", "optimize"]
+    assert [row[1] for row in regressions] == ["optimize"]
+    assert regressions[0][-1] == pytest.approx(2.0)
+
+
+def test_run_scale_smoke():
+    results = run_scale(300, 6, nan_density=0.02, repeat=1, excel=False, n_optimize=4)
+    cases = {result["case"] for result in results}
+    assert {"simulate", "optimize_sharpe", "efficient_frontier"} <= cases
+    assert all(result["min"] >= 0 for result in results)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chart_data import downsample, lttb, minmax, series_fingerprint
+
+
+def _walk(n=5000, seed=7):
+    rng = np.random.default_rng(seed)
+    return 100 * np.cumprod(1 + rng.normal(0, 0.01, n))
+
+
+@pytest.mark.parametrize("n_out", [1, 2, 3, 10, 500])
+def test_lttb_keeps_endpoints_and_budget(n_out):
+    y = _walk()
+    idx = lttb(np.arange(len(y)), y, n_out)
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert len(idx) == max(n_out, 3)
+    assert (np.diff(idx) > 0).all()
+
+
+@pytest.mark.parametrize("n_out", [1, 3, 4, 11, 500])
+def test_minmax_keeps_endpoints_and_extremes(n_out):
+    y = _walk()
+    idx = minmax(y, n_out)
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert len(idx) <= max(n_out, 4)
+    assert y[idx].min() == y.min() and y[idx].max() == y.max()
+
+
+def test_short_series_is_returned_whole():
+    y = _walk(n=20)
+    np.testing.assert_array_equal(lttb(np.arange(20), y, 50), np.arange(20))
+    np.testing.assert_array_equal(minmax(y, 50), np.arange(20))
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_respects_budget(method):
+    series = pd.Series(_walk(n=3000), index=pd.bdate_range("2000-01-03", periods=3000))
+    reduced, frequency = downsample(series, max_points=200, method=method, resample=False)
+    assert frequency == "D"
+    assert len(reduced) <= 200
+    assert reduced.index[0] == series.index[0] and reduced.index[-1] == series.index[-1]
+    if method == "minmax":
+        assert reduced.min() == series.min() and reduced.max() == series.max()
+
+    resampled, frequency = downsample(series, max_points=200, method=method)
+    assert frequency == "W" and len(resampled) <= 200
+
+
+def test_series_fingerprint_depends_on_shape_and_dtype():
+    values = np.arange(6, dtype=np.float64)
+    assert series_fingerprint(values) == series_fingerprint(values.copy())
+    assert series_fingerprint(values) != series_fingerprint(values.reshape(2, 3))
+    assert series_fingerprint(values) != series_fingerprint(values.astype(np.float32))
+    # Sumar hashes confundía permutaciones de los mismos valores
+    assert series_fingerprint(values) != series_fingerprint(values[::-1])
+    assert series_fingerprint(values[:3], values[3:]) != series_fingerprint(values[3:], values[:3])
+
+
+def test_figure_cache_remembers_empty_results():
+    import visualization
+
+    visualization.clear_figure_cache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return None
+
+    assert visualization._cached_figure(("empty",), build) is None
+    assert visualization._cached_figure(("empty",), build) is None
+    assert len(calls) == 1
+    visualization.clear_figure_cache()
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+cp = pytest.importorskip("cvxpy")
+
+import convex_optimization  # noqa: E402
+from convex_optimization import ConvexProblemCache  # noqa: E402
+from covariance import FactorCovariance  # noqa: E402
+from optimization import PortfolioOptimization  # noqa: E402
+
+TOL = 1e-6
+
+
+def _stats(n=6, seed=2):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.01, size=(500, n)) + rng.normal(0, 0.005, size=(500, 1))
+    returns += np.linspace(0, 0.001, n)  # retornos esperados distintos por activo
+    assets = [f"A{i}" for i in range(n)]
+    mean = pd.Series(returns.mean(axis=0) * 252, index=assets)
+    cov = pd.DataFrame(np.cov(returns, rowvar=False) * 252, index=assets, columns=assets)
+    return mean, cov
+
+
+@pytest.fixture(autouse=True)
+def problem_cache(monkeypatch):
+    cache = ConvexProblemCache()
+    monkeypatch.setattr(convex_optimization, "default_problem_cache", cache)
+    return cache
+
+
+def _solve(objective="sharpe", **constraints):
+    mean, cov = _stats()
+    optimizer = PortfolioOptimization.from_stats(mean, cov, objective=objective, **constraints)
+    result = optimizer.solve()
+    assert result.success, result.message
+    assert result.x.sum() == pytest.approx(1, abs=TOL)
+    return optimizer, result.x
+
+
+def test_group_exposure_respects_its_cap():
+    _, free = _solve(constraint_set=(0, 1), solver="cvxpy")
+    members = ["A3", "A4", "A5"]
+    cap = 0.5 * free[3:].sum()
+    _, weights = _solve(constraint_set=(0, 1), group_bounds={"EQ": (members, 0.0, cap)})
+    assert weights[3:].sum() <= cap + TOL
+    assert (weights >= -TOL).all()
+
+
+def test_volatility_cap():
+    optimizer, min_vol = _solve(objective="volatility", constraint_set=(0, 1))
+    cap = 1.3 * optimizer._portfolio_std(min_vol)
+    optimizer, weights = _solve(objective="return", constraint_set=(0, 1), max_volatility=cap)
+    assert optimizer._portfolio_std(weights) <= cap + TOL
+    assert optimizer._mu @ weights > optimizer._mu @ min_vol
+
+
+def test_turnover_limit():
+    current = {f"A{i}": 1 / 6 for i in range(6)}
+    _, weights = _solve(constraint_set=(0, 1), current_weights=current, max_turnover=0.2)
+    assert np.abs(weights - 1 / 6).sum() <= 0.2 + TOL
+
+
+def test_per_asset_bounds_match_slsqp():
+    bounds = {"A0": (0.1, 0.2), "A5": (0.0, 0.05)}
+    optimizer, weights = _solve(objective="volatility", constraint_set=(0, 0.5), asset_bounds=bounds, solver="cvxpy")
+    assert 0.1 - TOL <= weights[0] <= 0.2 + TOL
+    assert weights[5] <= 0.05 + TOL
+    assert ((weights >= -TOL) & (weights <= 0.5 + TOL)).all()
+
+    mean, cov = _stats()
+    reference = PortfolioOptimization.from_stats(mean, cov, objective="volatility", constraint_set=(0, 0.5),
+                                                 asset_bounds=bounds, solver="slsqp").solve()
+    assert optimizer._portfolio_std(weights) == pytest.approx(reference.fun, rel=1e-4)
+
+
+def test_compiled_problem_is_reused_across_inputs(problem_cache, monkeypatch):
+    built = []
+    original = convex_optimization.ConvexPortfolioProblem.__init__
+
+    def tracking_init(self, *args, **kwargs):
+        built.append(args)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(convex_optimization.ConvexPortfolioProblem, "__init__", tracking_init)
+    mean, cov = _stats()
+    results = []
+    for shift in (0.0, 0.05):
+        optimizer = PortfolioOptimization.from_stats(mean + np.linspace(0, shift, len(mean)), cov,
+                                                     constraint_set=(0, 1), max_volatility=0.5)
+        results.append(optimizer.solve().x)
+
+    assert len(built) == 1 and len(problem_cache._problems) == 1
+    (problem,) = problem_cache._problems.values()
+    # Los datos son parámetros (DPP): cambiar μ no recompila, pero sí cambia la solución
+    assert problem.problem.is_dcp(dpp=True)
+    assert not np.allclose(results[0], results[1])
+
+
+def test_factor_model_risk_uses_loadings_and_specific_variances(problem_cache):
+    rng = np.random.default_rng(5)
+    n, k = 40, 3
+    model = FactorCovariance(rng.normal(0, 0.3, (n, k)), rng.uniform(0.01, 0.05, k), rng.uniform(0.01, 0.04, n))
+    mean = pd.Series(rng.normal(0.08, 0.03, n), index=[f"A{i}" for i in range(n)])
+    groups = {"G": ([f"A{i}" for i in range(10)], 0.0, 0.2)}
+
+    factor_weights = PortfolioOptimization.from_stats(mean, model, objective="volatility", group_bounds=groups).solve().x
+    (problem,) = problem_cache._problems.values()
+    # Nunca se arma una matriz N x N: parámetros k x N y N
+    assert problem.factor.shape == (k, n) and problem.specific.shape == (n,)
+
+    dense = pd.DataFrame(model.to_dense(), index=mean.index, columns=mean.index)
+    dense_weights = PortfolioOptimization.from_stats(mean, dense, objective="volatility", group_bounds=groups).solve().x
+    np.testing.assert_allclose(factor_weights, dense_weights, atol=1e-4)
+    assert factor_weights[:10].sum() <= 0.2 + TOL
+
+
+def test_dense_factor_is_computed_once_per_covariance(monkeypatch):
+    calls = []
+    original = convex_optimization._dense_factor
+    monkeypatch.setattr(convex_optimization, "_dense_factor", lambda matrix: calls.append(1) or original(matrix))
+    monkeypatch.setattr(convex_optimization, "_factors", type(convex_optimization._factors)())
+    for objective in ("volatility", "sharpe"):
+        _solve(objective=objective, constraint_set=(0, 1), max_volatility=0.5)
+    assert len(calls) == 1
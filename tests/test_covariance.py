@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from covariance import FactorCovariance, estimate_covariance
+
+
+def _returns(prices_df):
+    return prices_df.set_index("DATE").pct_change().to_numpy()[1:]
+
+
+@pytest.mark.parametrize("method", ["sample", "ledoit_wolf", "ewma", "factor"])
+def test_late_start_ticker_keeps_its_variance(prices_df, method):
+    # LATE solo cotiza los últimos 100 días: rellenar sus faltantes con cero encogería su varianza
+    returns = _returns(prices_df)
+    common = returns[~np.isnan(returns).any(axis=1)]
+    cov = estimate_covariance(returns, method)
+    variances = cov.diag() if isinstance(cov, FactorCovariance) else np.diag(cov)
+    reference = common.var(axis=0, ddof=1)
+    np.testing.assert_allclose(variances[3], reference[3], rtol=0.25)
+    assert variances[3] / variances[0] == pytest.approx(reference[3] / reference[0], rel=0.25)
+
+
+def test_sample_covariance_is_positive_semidefinite():
+    rng = np.random.default_rng(1)
+    returns = rng.normal(0, 0.01, size=(500, 5))
+    returns[:300, 1] = np.nan
+    returns[100:, 2] = np.nan
+    returns[:50, 3] = np.nan
+    cov = estimate_covariance(returns[:, [0, 1, 3, 4]], "sample")
+    assert np.linalg.eigvalsh(cov).min() >= -1e-12
+
+
+def test_estimators_reject_baskets_without_common_dates():
+    returns = np.full((10, 2), np.nan)
+    returns[:5, 0] = 0.01
+    returns[5:, 1] = 0.02
+    for method in ("sample", "ledoit_wolf", "ewma", "factor"):
+        with pytest.raises(ValueError):
+            estimate_covariance(returns, method)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from currency import CurrencyConverter
+from portfolio import Portfolio
+from price_sources import load_price_sources
+from price_store import PriceStore
+
+
+def _fx_frame(prices_df):
+    rate = 800 + np.arange(len(prices_df), dtype=float)
+    return pd.DataFrame({"DATE": prices_df["DATE"], "USDCLP CURNCY": rate})
+
+
+def test_fx_sources_are_merged_into_the_store(tmp_path, prices_df):
+    prices_path, fx_path = tmp_path / "precios.xlsx", tmp_path / "tipos_cambio.csv"
+    prices_df.to_excel(prices_path, index=False)
+    _fx_frame(prices_df).to_csv(fx_path, index=False)
+
+    store = PriceStore(str(prices_path), fx_sources=str(fx_path))
+    assert "USDCLP CURNCY" in store
+    assert store.tickers[:4] == ["AAA", "BBB", "CCC", "LATE"]
+    # Los deltas siguen junto al archivo de precios
+    assert store.deltas_dir == str(tmp_path / "precios.deltas")
+
+    clp = CurrencyConverter.from_dictionary(store, {}).converted("CLP")
+    assert clp.currency == "CLP" and "USDCLP CURNCY" not in clp
+    np.testing.assert_allclose(clp.column("AAA"), prices_df["AAA"] * (800 + np.arange(len(prices_df))))
+
+
+def test_unknown_ticker_policy_keeps_fx_columns(tmp_path, prices_df):
+    prices_df.to_csv(tmp_path / "precios.csv", index=False)
+    _fx_frame(prices_df).to_csv(tmp_path / "fx.csv", index=False)
+    df = load_price_sources([str(tmp_path / "precios.csv"), str(tmp_path / "fx.csv")], dictionary={"AAA": {}},
+                            unknown="drop", max_workers=1)
+    assert list(df.columns) == ["DATE", "AAA", "USDCLP CURNCY"]
+
+
+def test_holdings_keep_their_purchase_currency(prices_df):
+    df = prices_df.copy()
+    df["USDCLP CURNCY"] = 800 + np.arange(len(df), dtype=float)
+    converter = CurrencyConverter.from_dictionary(PriceStore.from_frame(df), {})
+    clp, usd = converter.converted("CLP"), converter.converted("USD")
+
+    portfolio = Portfolio(initial_capital=1_000_000)
+    start = df["DATE"].iloc[10].date()
+    asset = portfolio.add_asset("AAA", 100, clp, start)
+    assert asset["currency"] == "CLP"
+    assert asset["initial_price"] == pytest.approx(df["AAA"].iloc[10] * 810)
+
+    # Cambiar la moneda de reporte valoriza las mismas unidades, sin tocar la compra registrada
+    value_usd = portfolio.simulate(usd, start)
+    assert value_usd == pytest.approx(1_000_000 / 810)
+    assert portfolio.list_assets()[0]["currency"] == "CLP"
+    assert converter.convert(asset["initial_value"], "CLP", "USD", start) == pytest.approx(value_usd)
+
+    with pytest.raises(ValueError, match="CLP"):
+        portfolio.add_asset("AAA", 10, usd, start)
+    restored = Portfolio.from_dict(portfolio.to_dict())
+    assert restored.list_assets()[0]["currency"] == "CLP"
+
+
+def test_converted_version_depends_on_ticker_currencies(prices_df):
+    df = prices_df.copy()
+    df["USDCLP CURNCY"] = _fx_frame(prices_df)["USDCLP CURNCY"]
+    store = PriceStore.from_frame(df)
+    usd = CurrencyConverter.from_dictionary(store, {"AAA": {"Currency": "USD"}}).converted("CLP")
+    clp = CurrencyConverter.from_dictionary(store, {"AAA": {"Currency": "CLP"}}).converted("CLP")
+    assert usd.version != clp.version
+    again = CurrencyConverter.from_dictionary(store, {"AAA": {"Currency": "USD"}}).converted("CLP")
+    assert again.version == usd.version
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from jobs import CANCELLED, DONE, PENDING, JobCancelled, JobManager, JobQueueFull
+
+
+def _loop(job, started):
+    started.set()
+    i = 0
+    while True:
+        job.report(i)
+        i += 1
+        time.sleep(0.005)
+
+
+def test_cancel_stops_a_running_job():
+    manager, started = JobManager(max_workers=1), threading.Event()
+    job = manager.submit("a", _loop, started)
+    assert started.wait(2)
+    assert job.cancel()
+    with pytest.raises(JobCancelled):
+        job.wait(2)
+    assert job.status == CANCELLED and job.finished and job.partial is None
+
+
+def test_cancelled_pending_job_never_runs_and_is_resubmitted():
+    manager, started, ran = JobManager(max_workers=1), threading.Event(), []
+    blocker = manager.submit("block", _loop, started)
+    assert started.wait(2)
+    pending = manager.submit("b", lambda job: ran.append(1))
+    assert pending.status == PENDING and manager.cancel("b")
+    blocker.cancel()
+    with pytest.raises(JobCancelled):
+        pending.wait(2)
+    assert ran == []
+    assert manager.submit("b", lambda job: 42).wait(2) == 42
+
+
+def test_release_cancels_only_when_no_owner_is_left():
+    manager, started = JobManager(max_workers=1), threading.Event()
+    job = manager.submit("a", _loop, started, owner="s1")
+    assert manager.submit("a", _loop, started, owner="s2") is job
+    assert started.wait(2)
+    manager.release("a", "s1")
+    time.sleep(0.05)
+    assert not job.finished
+    manager.release("a", "s2")
+    with pytest.raises(JobCancelled):
+        job.wait(2)
+
+
+def test_evict_drops_finished_then_ownerless_jobs():
+    manager, started = JobManager(max_workers=1, max_jobs=2), threading.Event()
+    manager.submit("done", lambda job: 1).wait(2)
+    running = manager.submit("running", _loop, started, owner="a")
+    assert started.wait(2)
+    manager.submit("pending", lambda job: 2)
+    assert manager.get("done") is None and len(manager) == 2
+    queued = manager.submit("queued", lambda job: 3, owner="b")
+    assert manager.get("pending") is None and manager.get("queued") is queued
+    running.cancel()
+    assert queued.wait(2) == 3 and queued.status == DONE
+
+
+def test_submit_is_rejected_instead_of_cancelling_owned_jobs():
+    manager, started = JobManager(max_workers=1, max_jobs=2), threading.Event()
+    running = manager.submit("running", _loop, started, owner="a")
+    assert started.wait(2)
+    pending = manager.submit("pending", lambda job: 2, owner="b")
+    with pytest.raises(JobQueueFull):
+        manager.submit("another", lambda job: 3, owner="c")
+    assert manager.get("another") is None and not pending.cancelled
+    running.cancel()
+    assert pending.wait(2) == 2
+
+
+def test_partial_callable_is_built_once_per_report():
+    manager, builds = JobManager(max_workers=1), []
+    release = threading.Event()
+
+    def work(job):
+        job.report(1, 2, lambda: builds.append(1) or "parcial")
+        release.wait(2)
+        return "final"
+
+    job = manager.submit("p", work)
+    for _ in range(200):
+        if job.done == 1:
+            break
+        time.sleep(0.005)
+    assert job.partial == "parcial" and job.partial == "parcial" and builds == [1]
+    release.set()
+    assert job.wait(2) == "final"
+
+
+def test_done_job_is_reused_after_a_late_cancel():
+    manager, release, runs = JobManager(max_workers=1), threading.Event(), []
+
+    def work(job):
+        runs.append(1)
+        release.wait(2)
+        return "final"  # Termina sin volver a llamar a report: la cancelación llega tarde
+
+    job = manager.submit("late", work)
+    for _ in range(200):
+        if runs:
+            break
+        time.sleep(0.005)
+    assert job.cancel()
+    release.set()
+    assert job.wait(2) == "final" and job.status == DONE and job.cancelled
+    assert manager.submit("late", work) is job and runs == [1]
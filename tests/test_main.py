@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import main
+from price_store import PriceStore
+
+
+@pytest.fixture
+def prices_df(prices_df):
+    # analytics.summary calcula la beta contra MXWD INDEX
+    return prices_df.rename(columns={"CCC": "MXWD INDEX"})
+
+
+@pytest.fixture
+def store(prices_df):
+    return PriceStore.from_frame(prices_df)
+
+
+def _write(tmp_path, portfolios):
+    path = tmp_path / "spec.json"
+    path.write_text(json.dumps({"portfolios": portfolios}), encoding="utf-8")
+    return str(path)
+
+
+def test_load_spec_rejects_duplicate_ids(tmp_path):
+    path = _write(tmp_path, [{"id": "a", "assets": {"AAA": 100}}, {"id": "a", "assets": {"BBB": 100}}])
+    with pytest.raises(ValueError, match="repetidos"):
+        main.load_spec(path)
+
+
+def test_run_isolates_malformed_specs(store):
+    portfolios = [
+        {"id": "ok", "assets": {"AAA": 50, "BBB": 50}},
+        {"id": "bad-type", "assets": ["AAA"]},
+        {"id": "bad-ticker", "assets": {"ZZZ": 100}},
+    ]
+    results = {result["id"]: result for result in main.run(store, portfolios, workers=1)}
+    assert results["ok"]["error"] is None
+    assert results["bad-type"]["error"].startswith("AttributeError")
+    assert results["bad-ticker"]["error"]
+    assert [main.failed(results[i]) for i in ("ok", "bad-type", "bad-ticker")] == [False, True, True]
+
+
+def test_optimization_failures_mark_portfolio_failed(store):
+    portfolios = [{"id": "p", "assets": {"AAA": 50, "BBB": 50}, "objectives": ["sharpe", "unknown"]}]
+    result = main.run(store, portfolios, workers=1)[0]
+    assert result["optimal_weights"]["sharpe"] is not None
+    assert "unknown" in result["optimization_errors"]
+    assert main.failed(result)
+
+
+def test_main_exit_codes(tmp_path, prices_df):
+    prices = tmp_path / "precios.xlsx"
+    prices_df.to_excel(prices, index=False)
+    good = _write(tmp_path, [{"id": "p", "assets": {"AAA": 100}, "objectives": ["volatility"]}])
+    assert main.main([good, "--prices", str(prices), "--dictionary", "none.json", "--workers", "1",
+                      "-o", str(tmp_path / "out.json")]) == 0
+
+    bad = _write(tmp_path, [{"id": "p", "assets": {"AAA": 100}, "objectives": ["nope"]}])
+    assert main.main([bad, "--prices", str(prices), "--dictionary", "none.json", "--workers", "1",
+                      "-o", str(tmp_path / "out.json")]) == 1
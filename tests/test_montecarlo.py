@@ -0,0 +1,29 @@
+import numpy as np
+
+from montecarlo import ProjectionResult, project_retirement
+
+
+def test_matches_deterministic_recurrence_without_volatility():
+    result = project_retirement(100, 3, annual_return=6.0, annual_inflation=2.0, annual_volatility=0.0,
+                                inflation_volatility=0.0, n_paths=10, seed=0)
+    monthly = np.expm1(np.log1p(0.06) / 12) - ((1.02) ** (1 / 12) - 1)
+    wealth, expected = 0.0, []
+    for month in range(36):
+        wealth = (wealth + 100) * (1 + monthly)
+        if month % 12 == 11:
+            expected.append(wealth)
+    np.testing.assert_allclose(result.yearly_totals, np.tile(expected, (10, 1)))
+
+
+def test_bootstrap_total_loss_month_stays_finite():
+    history = np.array([-1.0, 0.01, 0.02])
+    result = project_retirement(100, 5, annual_inflation=0.0, inflation_volatility=0.0, n_paths=500,
+                                history=history, seed=1)
+    assert np.isfinite(result.yearly_totals).all()
+    assert (result.yearly_totals >= 0).all()
+
+
+def test_goal_probability_by_year_without_goal():
+    result = ProjectionResult(np.ones((4, 2)), 100)
+    assert result.goal_probability_by_year() is None
+    np.testing.assert_allclose(result.goal_probability_by_year(1.0), [1.0, 1.0])
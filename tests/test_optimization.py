@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from optimization import PortfolioOptimization, _critical_line
+
+
+def _stats(n=5, seed=0, duplicate=False):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.01, size=(500, n)) + rng.normal(0, 0.005, size=(500, 1))
+    if duplicate:
+        # Dos ETFs que replican el mismo índice: covarianza singular
+        returns = np.column_stack([returns, returns[:, 0]])
+    assets = [f"A{i}" for i in range(returns.shape[1])]
+    mean = pd.Series(returns.mean(axis=0) * 252, index=assets)
+    cov = pd.DataFrame(np.cov(returns, rowvar=False) * 252, index=assets, columns=assets)
+    return mean, cov
+
+
+def _min_variance_at(optimizer, target):
+    """Varianza mínima con retorno >= target por SLSQP (referencia)."""
+    weights = optimizer._frontier_slsqp([target], optimizer._min_variance_weights())[0]
+    return weights @ optimizer._cov @ weights
+
+
+def _tied_stats():
+    """Dos activos con el mismo retorno esperado (el primero con mayor varianza)."""
+    rng = np.random.default_rng(3)
+    a = rng.normal(size=(4, 4))
+    assets = ["A0", "A1", "A2", "A3"]
+    mean = pd.Series([0.10, 0.10, 0.05, 0.08], index=assets)
+    cov = pd.DataFrame(a @ a.T / 40 + np.eye(4) * 0.01, index=assets, columns=assets)
+    return mean, cov
+
+
+@pytest.mark.parametrize("case", ["plain", "duplicate", "tied", "rounded"])
+def test_critical_line_matches_slsqp(case):
+    if case == "tied":
+        mean, cov = _tied_stats()
+    else:
+        mean, cov = _stats(n=6 if case == "rounded" else 5, seed=8 if case == "rounded" else 0,
+                           duplicate=case == "duplicate")
+        if case == "rounded":
+            mean = (mean * 4).round(2)  # Retornos redondeados: empates en la esquina inicial
+    optimizer = PortfolioOptimization.from_stats(mean, cov, constraint_set=(0, 0.6))
+    frontier = optimizer.efficient_frontier(9, method="critical_line")
+    assert len(frontier) == 9
+    weights = frontier[optimizer.selected_assets].to_numpy()
+    np.testing.assert_allclose(weights.sum(axis=1), 1, atol=1e-8)
+    assert (weights >= -1e-8).all() and (weights <= 0.6 + 1e-8).all()
+    for target, risk in zip(frontier["return"], frontier["risk"]):
+        assert risk ** 2 <= _min_variance_at(optimizer, target) * (1 + 1e-4) + 1e-10
+    # El extremo de menor riesgo es el portafolio de mínima varianza
+    min_var = optimizer._min_variance_weights()
+    assert frontier["risk"].min() <= np.sqrt(min_var @ optimizer._cov @ min_var) * (1 + 1e-4)
+
+
+def test_critical_line_iteration_guard():
+    mean, cov = _stats()
+    with pytest.raises(RuntimeError):
+        _critical_line(mean.to_numpy(), cov.to_numpy(), np.zeros(len(mean)), np.ones(len(mean)), max_iter=1)
+
+
+def test_critical_line_singular_covariance_does_not_raise():
+    mean, cov = _stats(duplicate=True)
+    corners = _critical_line(mean.to_numpy(), cov.to_numpy(), np.zeros(len(mean)), np.ones(len(mean)))
+    assert len(corners) >= 2
+    np.testing.assert_allclose(corners.sum(axis=1), 1, atol=1e-8)
+
+
+def test_unbounded_frontier_spans_asset_risk_range():
+    mean, cov = _stats()
+    optimizer = PortfolioOptimization.from_stats(mean, cov, constraint_set=None)
+    frontier = optimizer.efficient_frontier(20)
+    max_asset_risk = np.sqrt(np.diag(cov.to_numpy()).max())
+    np.testing.assert_allclose(frontier["risk"].iloc[-1], max_asset_risk, rtol=1e-6)
+    assert frontier["return"].is_monotonic_increasing
+
+
+
+def test_critical_line_reports_partial_frontiers_per_corner():
+    mean, cov = _stats(n=8)
+    optimizer = PortfolioOptimization.from_stats(mean, cov, constraint_set=(0, 0.4))
+    calls = []
+    frontier = optimizer.efficient_frontier(15, method="critical_line",
+                                            progress=lambda done, total, partial: calls.append((done, total, partial)))
+    # Una llamada por esquina (total desconocido) más la frontera final
+    assert len(calls) > 2 and all(total is None for _, total, _ in calls[:-1])
+    partials = [partial() for _, _, partial in calls[:-1]]
+    max_return = frontier["return"].max()
+    for partial in partials:
+        assert partial["return"].max() == pytest.approx(max_return)
+    # Cada esquina extiende la frontera parcial hacia menor riesgo
+    assert partials[-1]["risk"].min() <= partials[0]["risk"].min()
+    pd.testing.assert_frame_equal(calls[-1][2](), frontier)
+
+
+def test_slsqp_progress_builds_partial_frontier_only_on_demand(monkeypatch):
+    mean, cov = _stats()
+    optimizer = PortfolioOptimization.from_stats(mean, cov, constraint_set=(0, 1))
+    built = []
+    frame = optimizer._frontier_frame
+    monkeypatch.setattr(optimizer, "_frontier_frame", lambda weights: built.append(len(weights)) or frame(weights))
+    calls = []
+    optimizer.efficient_frontier(6, method="slsqp", progress=lambda done, total, partial: calls.append(partial))
+    assert len(calls) == 6 and built == [6]
+    assert len(calls[2]()) == 3
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("objective", ["sharpe", "volatility"])
+def test_active_set_matches_slsqp(objective, seed):
+    # solver='auto' resuelve estos casos por conjunto activo en lugar de SLSQP: mismo óptimo
+    mean, cov = _stats(n=8, seed=seed)
+    exact = PortfolioOptimization.from_stats(mean, cov, objective=objective).solve()
+    reference = PortfolioOptimization.from_stats(mean, cov, objective=objective, solver="slsqp").solve()
+    assert exact.success and reference.success
+    assert exact.message.startswith("Solución exacta")
+    assert exact.fun <= reference.fun + 1e-6
+    np.testing.assert_allclose(exact.x, reference.x, atol=1e-2)
+
+
+def test_active_set_with_factor_covariance():
+    from covariance import FactorCovariance
+
+    rng = np.random.default_rng(4)
+    returns = rng.normal(0.0005, 0.01, size=(400, 12)) + rng.normal(0, 0.006, size=(400, 1))
+    assets = [f"A{i}" for i in range(12)]
+    mean = pd.Series(returns.mean(axis=0) * 252, index=assets)
+    model = FactorCovariance.from_returns(returns, n_factors=3).scaled(252)
+    exact = PortfolioOptimization.from_stats(mean, model, objective="volatility").solve()
+    reference = PortfolioOptimization.from_stats(mean, model.to_dense(), objective="volatility", solver="slsqp").solve()
+    assert exact.fun <= reference.fun + 1e-6
+
+
+def test_max_return_exact_matches_slsqp():
+    mean, cov = _stats()
+    exact = PortfolioOptimization.from_stats(mean, cov, objective="return", constraint_set=(0.05, 0.4)).solve()
+    reference = PortfolioOptimization.from_stats(mean, cov, objective="return", constraint_set=(0.05, 0.4),
+                                                 solver="slsqp").solve()
+    np.testing.assert_allclose(exact.fun, reference.fun, atol=1e-6)
@@ -0,0 +1,151 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio import Holdings, Portfolio, PortfolioBook
+from price_store import PriceStore
+
+
+def _gappy_store(prices_df):
+    df = prices_df.copy()
+    # Huecos largos que cruzan el inicio del rango consultado
+    df.loc[150:260, "AAA"] = np.nan
+    df.loc[240:250, "BBB"] = np.nan
+    return PriceStore.from_frame(df)
+
+
+def test_iter_values_ffill_carries_across_range_start(prices_df):
+    store = _gappy_store(prices_df)
+    book = PortfolioBook(store)
+    book.add_portfolio("a", {"AAA": 50, "BBB": 50}, start_date=store.dates[0])
+    book.add_portfolio("b", {"BBB": 30, "LATE": 70})
+
+    full = book.value_series(nan_policy="ffill", chunk_size=64)
+    start = pd.Timestamp(store.dates[245])
+    partial = book.value_series(start_date=start, nan_policy="ffill", chunk_size=16)
+    pd.testing.assert_frame_equal(partial, full.loc[start:])
+    assert (partial["a"] > 0).all()
+
+
+def test_value_series_matches_per_date_valuation(prices_df):
+    df = prices_df.copy()
+    df.loc[320:323, "BBB"] = np.nan
+    portfolio = Portfolio(initial_capital=1000)
+    start = df["DATE"].iloc[0].date()
+    portfolio.add_asset("AAA", 60, df, start)
+    portfolio.add_asset("BBB", 40, df, start)
+    quantities = dict(zip(portfolio.holdings.tickers, portfolio.holdings.view("quantity")))
+
+    skip = portfolio.value_series(df)
+    expected = sum(df[ticker].fillna(0).to_numpy() * quantity for ticker, quantity in quantities.items())
+    np.testing.assert_allclose(skip.to_numpy(), expected)
+    assert list(skip.index) == list(df["DATE"])
+
+    ffill = portfolio.value_series(df, nan_policy="ffill")
+    expected = sum(df[ticker].ffill().to_numpy() * quantity for ticker, quantity in quantities.items())
+    np.testing.assert_allclose(ffill.to_numpy(), expected)
+
+    date = df["DATE"].iloc[350].date()
+    assert portfolio.simulate(df, date) == pytest.approx(skip.iloc[350])
+    returns = portfolio.calculate_returns(df, start, date)
+    assert returns == pytest.approx((skip.iloc[350] / skip.iloc[0] - 1) * 100)
+    with pytest.raises(ValueError):
+        portfolio.value_series(df, nan_policy="zero")
+
+
+def test_current_weights_use_market_values(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    portfolio = Portfolio(initial_capital=1000)
+    start = prices_df["DATE"].iloc[0].date()
+    portfolio.add_asset("AAA", 50, store, start)
+    portfolio.add_asset("BBB", 50, store, start)
+
+    weights = portfolio.current_weights(store)
+    last = prices_df.iloc[-1]
+    values = np.array([500 / prices_df["AAA"].iloc[0] * last["AAA"], 500 / prices_df["BBB"].iloc[0] * last["BBB"]])
+    np.testing.assert_allclose([weights["AAA"], weights["BBB"]], values / values.sum())
+    assert sum(weights.values()) == pytest.approx(1.0)
+    # Los precios se movieron: los pesos actuales ya no son los porcentajes de compra
+    assert abs(weights["AAA"] - 0.5) > 1e-3
+
+
+def test_purchase_and_simulate_reject_dates_past_the_data(prices_df):
+    df = prices_df.copy()
+    df.loc[200:, "BBB"] = np.nan
+    store = PriceStore.from_frame(df)
+    portfolio = Portfolio(initial_capital=1000)
+    with pytest.raises(ValueError, match="BBB"):
+        portfolio.add_asset("BBB", 50, store, df["DATE"].iloc[300].date())
+    portfolio.add_asset("AAA", 50, store, df["DATE"].iloc[0].date())
+    with pytest.raises(ValueError):
+        portfolio.simulate(store, pd.Timestamp(store.dates[-1]) + pd.Timedelta(days=90))
+
+
+def _holdings():
+    holdings = Holdings(capacity=2)
+    holdings.add("AAA", 10.0, 50.0, 500.0, 50.0, "2020-01-02", "USD")
+    holdings.add("BBB", 4.0, 75.0, 300.0, 30.0, "2020-01-03", "USD")
+    holdings.add("CCC", 2.0, 100.0, 200.0, 20.0, "2020-01-06", "USD")
+    return holdings
+
+
+def test_holdings_add_grows_and_accumulates():
+    holdings = _holdings()
+    assert len(holdings) == 3 and "CCC" in holdings
+
+    i = holdings.add("AAA", 5.0, 100.0, 500.0, 10.0, "2019-12-31", "USD")
+    assert i == 0 and len(holdings) == 3
+    record = holdings.record(i)
+    assert record["cantidad"] == 15.0 and record["initial_value"] == 1000.0 and record["percentage"] == 60.0
+    assert record["initial_price"] == pytest.approx(1000.0 / 15.0)
+    assert str(record["start_date"]) == "2019-12-31"
+    with pytest.raises(ValueError, match="AAA"):
+        holdings.add("AAA", 1.0, 1.0, 1.0, 1.0, "2020-01-02", "EUR")
+
+
+def test_holdings_remove_moves_last_row_into_the_gap():
+    holdings = _holdings()
+    holdings.remove("AAA")
+    assert holdings.tickers == ["CCC", "BBB"] and "AAA" not in holdings
+    np.testing.assert_array_equal(holdings.view("quantity"), [2.0, 4.0])
+    assert holdings.record(0)["ticker"] == "CCC" and holdings.record(0)["initial_value"] == 200.0
+    holdings.remove("BBB")
+    assert holdings.tickers == ["CCC"] and len(holdings) == 1
+
+
+def test_holdings_update_writes_the_row():
+    holdings = _holdings()
+    holdings.update("BBB", quantity=8.0, currency="EUR")
+    assert holdings.record(1)["cantidad"] == 8.0 and holdings.record(1)["currency"] == "EUR"
+    with pytest.raises(ValueError):
+        holdings.update("BBB", sector="ZZZ")
+
+
+def test_holdings_dict_and_pickle_round_trip():
+    holdings = _holdings()
+    restored = Holdings.from_dict(holdings.to_dict())
+    assert restored.records() == holdings.records()
+    unpickled = pickle.loads(pickle.dumps(holdings))
+    assert unpickled.records() == holdings.records()
+    # La copia sigue siendo modificable en O(1)
+    unpickled.add("DDD", 1.0, 10.0, 10.0, 5.0, "2020-01-07", "USD")
+    assert len(unpickled) == 4 and len(holdings) == 3
+
+
+def test_list_assets_is_the_compatibility_view(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    portfolio = Portfolio(initial_capital=1000)
+    start = prices_df["DATE"].iloc[0].date()
+    added = portfolio.add_asset("aaa ", 60, store, start)
+    portfolio.add_asset("BBB", 40, store, start)
+    assets = portfolio.list_assets()
+    assert [asset["ticker"] for asset in assets] == ["AAA", "BBB"]
+    assert assets[0] == added and portfolio.assets == assets
+    assert added["cantidad"] == pytest.approx(600 / prices_df["AAA"].iloc[0])
+
+    portfolio.remove_asset("AAA")
+    assert [asset["ticker"] for asset in portfolio.list_assets()] == ["BBB"]
+    restored = Portfolio.from_dict(portfolio.to_dict())
+    assert restored.list_assets() == portfolio.list_assets()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_sources import load_price_sources
+
+
+def _write_sources(tmp_path, prices_df):
+    """Dos fuentes que se solapan en 20 fechas de AAA, con un precio distinto en una de ellas."""
+    a = prices_df.iloc[:220][["DATE", "AAA", "BBB"]]
+    b = prices_df.iloc[200:][["DATE", "AAA", "CCC"]].copy()
+    b.loc[210, "AAA"] = 1.0
+    a.to_csv(tmp_path / "a.csv", index=False)
+    b.to_csv(tmp_path / "b.csv", index=False)
+    return [str(tmp_path / "a.csv"), str(tmp_path / "b.csv")]
+
+
+def test_conflict_error_names_the_sources(tmp_path, prices_df):
+    paths = _write_sources(tmp_path, prices_df)
+    with pytest.raises(ValueError, match="AAA"):
+        load_price_sources(paths, on_conflict="error", max_workers=1)
+
+
+@pytest.mark.parametrize("policy, expected", [("first", None), ("last", 1.0)])
+def test_conflict_first_and_last(tmp_path, prices_df, policy, expected):
+    paths = _write_sources(tmp_path, prices_df)
+    df = load_price_sources(paths, on_conflict=policy, max_workers=1).set_index("DATE")
+    date = prices_df["DATE"].iloc[210]
+    assert df.loc[date, "AAA"] == pytest.approx(prices_df["AAA"].iloc[210] if expected is None else expected)
+    assert list(df.columns) == ["AAA", "BBB", "CCC"] and len(df) == len(prices_df)
+
+
+def test_repeated_dates_within_a_source(tmp_path, prices_df):
+    df = prices_df.iloc[:10][["DATE", "AAA"]]
+    repeated = pd.concat([df, df.iloc[[3]].assign(AAA=5.0)])
+    repeated.to_csv(tmp_path / "r.csv", index=False)
+    path = [str(tmp_path / "r.csv")]
+    with pytest.raises(ValueError, match="repetidas"):
+        load_price_sources(path, max_workers=1)
+    first = load_price_sources(path, on_conflict="first", max_workers=1)
+    last = load_price_sources(path, on_conflict="last", max_workers=1)
+    assert first["AAA"].iloc[3] == pytest.approx(df["AAA"].iloc[3]) and last["AAA"].iloc[3] == 5.0
+
+
+def test_repeated_dates_differing_in_a_middle_row(tmp_path, prices_df):
+    df = prices_df.iloc[:10][["DATE", "AAA"]]
+    row = df.iloc[[3]]
+    # Tres filas para la misma fecha: la primera y la última coinciden, la del medio no
+    repeated = pd.concat([df.iloc[:4], row.assign(AAA=5.0), row, df.iloc[4:]])
+    repeated.to_csv(tmp_path / "r.csv", index=False)
+    path = [str(tmp_path / "r.csv")]
+    with pytest.raises(ValueError, match="repetidas"):
+        load_price_sources(path, max_workers=1)
+
+    consistent = pd.concat([df.iloc[:4], row, row, df.iloc[4:]])
+    consistent.to_csv(tmp_path / "r.csv", index=False)
+    loaded = load_price_sources(path, max_workers=1)
+    assert len(loaded) == 10 and loaded["AAA"].iloc[3] == pytest.approx(df["AAA"].iloc[3])
+
+
+def test_float32_dtype(tmp_path, prices_df):
+    paths = _write_sources(tmp_path, prices_df)
+    df = load_price_sources(paths, on_conflict="first", dtype=np.float32, max_workers=1)
+    assert (df.drop(columns="DATE").dtypes == np.float32).all()
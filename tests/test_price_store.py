@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_store
+import stats_cache
+from ingest import validate_delta
+from price_store import PriceStore, as_price_store, deltas_fingerprint
+from stats_cache import StatsCache, compute_universe_stats
+
+
+def test_as_price_store_converts_each_frame_once(prices_df):
+    store = as_price_store(prices_df)
+    assert as_price_store(prices_df) is store
+    assert as_price_store(store) is store
+
+
+def test_as_price_store_reconverts_when_columns_change(prices_df):
+    store = as_price_store(prices_df)
+    prices_df["NEW"] = 1.0
+    other = as_price_store(prices_df)
+    assert other is not store
+    assert "NEW" in other
+
+
+@pytest.mark.parametrize("edit", [
+    lambda df: df.__setitem__("AAA", df["AAA"] * 900.0),
+    lambda df: df.loc.__setitem__((5, "BBB"), 1.0),
+])
+def test_as_price_store_reconverts_after_in_place_edits(prices_df, edit):
+    store = as_price_store(prices_df)
+    edit(prices_df)
+    other = as_price_store(prices_df)
+    assert other is not store and other.version != store.version
+    np.testing.assert_array_equal(other.column("AAA"), prices_df["AAA"].to_numpy())
+    assert other.price("BBB", prices_df["DATE"].iloc[5]) == prices_df["BBB"].iloc[5]
+
+
+def test_as_price_store_keeps_a_bounded_cache(prices_df):
+    for shift in range(price_store.MAX_FRAME_STORES + 3):
+        as_price_store(prices_df.assign(AAA=prices_df["AAA"] + shift))
+    assert len(price_store._frame_stores) == price_store.MAX_FRAME_STORES
+    # Un DataFrame igual (otra copia) reutiliza el almacén
+    assert as_price_store(prices_df.copy()) is as_price_store(prices_df)
+
+
+def test_from_frame_matches_source(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    assert store.tickers == ["AAA", "BBB", "CCC", "LATE"]
+    assert store.first_valid_date("LATE") == pd.Timestamp(prices_df["DATE"].iloc[300])
+
+
+def _source(tmp_path, prices_df, rows):
+    path = tmp_path / "precios.xlsx"
+    prices_df.iloc[:rows].to_excel(path, index=False)
+    return str(path)
+
+
+def test_append_survives_source_rebuild(tmp_path, prices_df):
+    path = _source(tmp_path, prices_df, 300)
+    store = PriceStore(path)
+    assert store.append(prices_df.iloc[300:320]) == 300
+
+    # El origen cambia (se corrige un precio histórico): la caché se reconstruye con los deltas
+    changed = prices_df.iloc[:300].copy()
+    changed.loc[10, "AAA"] = 1.0
+    changed.to_excel(path, index=False)
+    rebuilt = PriceStore(path)
+    assert len(rebuilt) == 320
+    assert rebuilt.price("AAA", prices_df["DATE"].iloc[10]) == 1.0
+    assert rebuilt.price("BBB", prices_df["DATE"].iloc[319]) == prices_df["BBB"].iloc[319]
+
+
+def test_source_dates_win_over_deltas(tmp_path, prices_df):
+    path = _source(tmp_path, prices_df, 300)
+    PriceStore(path).append(prices_df.iloc[300:320])
+    updated = prices_df.iloc[:310].copy()
+    updated.loc[305, "AAA"] = 2.0
+    updated.to_excel(path, index=False)
+
+    store = PriceStore(path)
+    assert len(store) == 320
+    assert store.price("AAA", prices_df["DATE"].iloc[305]) == 2.0
+
+
+def test_interrupted_append_is_recovered(tmp_path, prices_df):
+    path = _source(tmp_path, prices_df, 300)
+    store = PriceStore(path)
+    delta = prices_df.iloc[300:305]
+    # Se simula una caída después de guardar el delta y escribir solo la matriz de valores
+    dates, tickers, values = PriceStore._normalize_frame(delta)
+    store._save_delta(dates, tickers, values, "0" * 40)
+    price_store._append_npy(store._cache_paths()["values"], values)
+
+    recovered = PriceStore(path)
+    assert len(recovered) == 305
+    assert recovered.validity.bits.shape[0] == 305
+    assert recovered.price("AAA", delta["DATE"].iloc[-1]) == delta["AAA"].iloc[-1]
+
+
+def test_deltas_fingerprint_changes_with_each_append(tmp_path, prices_df):
+    path = _source(tmp_path, prices_df, 300)
+    store = PriceStore(path)
+    before = deltas_fingerprint(path)
+    store.append(prices_df.iloc[300:310])
+    after = deltas_fingerprint(path)
+    assert before == () and after != before
+    store.append(prices_df.iloc[310:320])
+    assert deltas_fingerprint(path) != after
+
+
+def test_snap_past_the_data_is_out_of_range(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    last = pd.Timestamp(store.dates[-1])
+    assert store.snap(last + pd.Timedelta(days=3)) == len(store) - 1
+    assert store.snap(last + pd.Timedelta(days=60)) is None
+    assert store.snap(last + pd.Timedelta(days=60), max_gap=None) == len(store) - 1
+    assert store.snap(pd.Timestamp(store.dates[0]) - pd.Timedelta(days=60), direction="forward") is None
+
+
+def test_asof_flags_stale_prices_of_delisted_tickers(prices_df):
+    df = prices_df.copy()
+    df.loc[200:, "BBB"] = np.nan  # BBB deja de cotizar
+    store = PriceStore.from_frame(df)
+    date = df["DATE"].iloc[250]
+    with pytest.raises(ValueError, match="BBB"):
+        store.asof("BBB", date)
+    quote_date, price = store.asof("BBB", date, max_staleness=None)
+    assert quote_date == df["DATE"].iloc[199] and price == df["BBB"].iloc[199]
+    assert store.asof("BBB", df["DATE"].iloc[202])[0] == df["DATE"].iloc[199]
+
+
+def test_source_options_are_part_of_the_cache(tmp_path, prices_df):
+    folder = tmp_path / "fuentes"
+    folder.mkdir()
+    prices_df.iloc[:220][["DATE", "AAA", "BBB"]].to_csv(folder / "a.csv", index=False)
+    b = prices_df.iloc[200:][["DATE", "AAA", "CCC"]].copy()
+    b.loc[210, "AAA"] = 1.0
+    b.to_csv(folder / "b.csv", index=False)
+    date = prices_df["DATE"].iloc[210]
+
+    first = PriceStore(str(folder), source_options={"on_conflict": "first", "max_workers": 1})
+    assert first.price("AAA", date) == pytest.approx(prices_df["AAA"].iloc[210])
+    # Mismas fuentes, otra política: la caché se reconstruye y cambia la versión
+    last = PriceStore(str(folder), source_options={"on_conflict": "last", "max_workers": 1})
+    assert last.price("AAA", date) == 1.0 and last.version != first.version
+
+    float32 = PriceStore(str(folder), source_options={"on_conflict": "last", "dtype": np.float32, "max_workers": 1})
+    assert float32.values.dtype == np.float32 and float32.version != last.version
+    assert PriceStore(str(folder), source_options={"on_conflict": "last", "dtype": np.float32}).version == float32.version
+
+
+def test_dtype_option_applies_to_a_single_file(tmp_path, prices_df):
+    path = _source(tmp_path, prices_df, 300)
+    default = PriceStore(path)
+    assert default.values.dtype == np.float64
+    store = PriceStore(path, source_options={"dtype": np.float32})
+    assert store.values.dtype == np.float32 and store.version != default.version
+    assert PriceStore(path).values.dtype == np.float64
+
+
+def test_failed_delta_write_leaves_the_store_unchanged(tmp_path, prices_df, monkeypatch):
+    store = PriceStore(_source(tmp_path, prices_df, 300))
+    version, rows = store.version, store.validity.bits.shape[0]
+
+    def fail(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(store, "_save_delta", fail)
+    with pytest.raises(OSError):
+        store.append(prices_df.iloc[300:310])
+    assert store.version == version and len(store) == 300
+    assert store.validity.bits.shape[0] == rows
+
+
+def test_validate_delta_rejects_tickers_without_history(prices_df):
+    store = PriceStore.from_frame(prices_df.drop(columns="LATE"))
+    delta = prices_df.iloc[390:][["DATE", "AAA", "LATE"]]
+    with pytest.raises(ValueError, match="recarga completa"):
+        validate_delta(delta, store, {"AAA": {}, "LATE": {}})
+    with pytest.raises(ValueError, match="no reconocidos"):
+        validate_delta(delta.rename(columns={"LATE": "ZZZ"}), store, {})
+    assert len(validate_delta(delta[["DATE", "AAA"]], store, {})) == 10
+
+
+def test_sync_extends_cached_stats_with_deltas_from_another_process(tmp_path, prices_df, monkeypatch):
+    path = _source(tmp_path, prices_df, 300)
+    app_store, cache = PriceStore(path), StatsCache()
+    universe = cache.universe(app_store)
+    assert app_store.sync(cache) is None
+
+    # Otro proceso (ingest.py) agrega fechas al mismo origen con su propio almacén
+    PriceStore(path).append(prices_df.iloc[300:320])
+    monkeypatch.setattr(stats_cache, "compute_universe_stats",
+                        lambda *args, **kwargs: pytest.fail("no debe recalcular el universo"))
+    assert app_store.sync(cache) == 300
+    assert len(app_store) == 320 and app_store.version == PriceStore(path).version
+
+    extended = cache.universe(app_store)
+    assert extended is not universe and len(extended.returns) == 320 and cache.misses == 1
+    monkeypatch.undo()
+    expected = compute_universe_stats(app_store)
+    np.testing.assert_allclose(extended.moments.sums, expected.moments.sums)
+    np.testing.assert_allclose(extended.subset(["AAA", "LATE"])[1], expected.subset(["AAA", "LATE"])[1])
+
+
+def test_concurrent_appends_write_distinct_deltas(tmp_path, prices_df):
+    path = _source(tmp_path, prices_df, 300)
+    first, second = PriceStore(path), PriceStore(path)
+    # Dos procesos cargaron el mismo origen y agregan fechas sin verse entre sí
+    first.append(prices_df.iloc[300:310])
+    second.append(prices_df.iloc[300:320])
+    assert len(set(first.delta_files())) == 2
+
+    store = PriceStore(path)
+    assert len(store) == 320 and store.delta_files() == store._meta["deltas"]
+    np.testing.assert_allclose(store.column("AAA"), prices_df["AAA"].iloc[:320].to_numpy())
+
+
+def test_matrix_ffill_stops_carrying_a_delisted_ticker(prices_df):
+    df = prices_df.copy()
+    df.loc[200:, "AAA"] = np.nan      # Deja de cotizar
+    df.loc[100:102, "BBB"] = np.nan   # Hueco corto
+    store = PriceStore.from_frame(df)
+    dates = df["DATE"]
+    last_price, last_date = df["AAA"].iloc[199], dates.iloc[199]
+
+    _, values = store.matrix(["AAA", "BBB"], dates.iloc[101], ffill=True)
+    aaa = values[:, 0]
+    fresh = (dates.iloc[101:] - last_date).dt.days.to_numpy() <= price_store.MAX_STALENESS_DAYS
+    np.testing.assert_array_equal(aaa[fresh & (dates.iloc[101:] > last_date).to_numpy()], last_price)
+    assert np.isnan(aaa[~fresh]).all() and (~fresh).sum() > 100
+    # El hueco corto se rellena desde antes del rango, sin leer el prefijo
+    assert values[0, 1] == df["BBB"].iloc[99] and not np.isnan(values[:, 1]).any()
+
+    # Desde una fecha posterior al plazo no queda nada que arrastrar; sin límite se arrastra siempre
+    _, late = store.matrix(["AAA"], dates.iloc[250], ffill=True)
+    assert np.isnan(late).all()
+    _, unlimited = store.matrix(["AAA"], dates.iloc[250], ffill=True, max_staleness=None)
+    assert (unlimited == last_price).all()
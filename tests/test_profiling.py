@@ -0,0 +1,46 @@
+import time
+
+from convex_optimization import asset_classes, group_bounds_from_dictionary
+from currency import ticker_currencies
+from profiling import profiler
+
+DICTIONARY = {
+    "AAA": {"Class": "Renta Variable", "Currency": "USD"},
+    "BBB": {"Class": "Renta Fija", "Currency": "CLP"},
+}
+
+
+def test_disabled_profiler_records_nothing():
+    profiler.enable(False)
+    asset_classes(DICTIONARY, ["AAA"])
+    assert profiler.snapshot() == {"stages": {}, "counters": {}}
+
+
+def test_app_mapping_stages_are_measured():
+    profiler.enable(True)
+    try:
+        classes = asset_classes(DICTIONARY, ["AAA", "BBB", "CCC"])
+        group_bounds_from_dictionary(DICTIONARY, ["AAA", "BBB"], {"Renta Fija": (0.0, 0.5)})
+        ticker_currencies(DICTIONARY, ["AAA", "BBB"])
+        stages = profiler.snapshot()["stages"]
+    finally:
+        profiler.enable(False)
+    assert classes == ["Renta Fija", "Renta Variable"]
+    assert {"map.classes", "map.groups", "map.currencies"} <= set(stages)
+    assert all(stages[name]["calls"] == 1 for name in ("map.classes", "map.groups", "map.currencies"))
+
+
+def test_background_job_durations_reach_the_shared_registry():
+    from jobs import JobManager
+
+    profiler.reset_jobs()
+    manager = JobManager(max_workers=1)
+    profiler.enable(True)
+    try:
+        manager.submit("k", lambda job: time.sleep(0.01), description="frontera").wait(5)
+        assert profiler.snapshot()["stages"] == {}
+    finally:
+        profiler.enable(False)
+    jobs = profiler.jobs()
+    assert jobs["frontera"]["calls"] == 1
+    assert jobs["frontera"]["last"] >= 0.01
@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_store import PriceStore
+from stats_cache import CommonMoments, StatsCache, UniverseStats, compute_universe_stats
+
+
+def test_subset_uses_common_sample(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    mean, cov = compute_universe_stats(store).subset(["AAA", "LATE"])
+
+    returns = prices_df.set_index("DATE")[["AAA", "LATE"]].pct_change().dropna()
+    np.testing.assert_allclose(mean.to_numpy(), returns.mean().to_numpy() * 252)
+    np.testing.assert_allclose(cov.to_numpy(), returns.cov().to_numpy() * 252)
+
+
+def test_subset_covariance_is_positive_semidefinite():
+    # Tickers que cotizan en ventanas distintas: la covarianza por pares puede ser indefinida
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range("2010-01-01", periods=600)
+    prices = 100 * np.cumprod(1 + rng.normal(0, 0.01, size=(len(dates), 6)), axis=0)
+    for col, (lo, hi) in enumerate([(0, 600), (0, 250), (200, 600), (350, 600), (100, 400), (0, 600)]):
+        prices[:lo, col] = np.nan
+        prices[hi:, col] = np.nan
+    df = pd.DataFrame(prices, columns=[f"T{i}" for i in range(6)])
+    df.insert(0, "DATE", dates)
+
+    universe = compute_universe_stats(PriceStore.from_frame(df))
+    for assets in (["T0", "T2", "T3", "T5"], ["T0", "T4", "T5"], ["T2", "T4"]):
+        _, cov = universe.subset(assets)
+        assert np.linalg.eigvalsh(cov.to_numpy()).min() >= -1e-12
+
+
+def test_on_append_extends_universe(prices_df):
+    head, tail = prices_df.iloc[:350], prices_df.iloc[350:]
+    store = PriceStore.from_frame(head)
+    cache = StatsCache()
+    cache.get(store, ["AAA", "LATE"])
+    previous = store.version
+    first_row = store.append(tail)
+    cache.on_append(store, previous, first_row)
+
+    mean, cov = cache.get(store, ["AAA", "LATE"])
+    expected_mean, expected_cov = compute_universe_stats(PriceStore.from_frame(prices_df)).subset(["AAA", "LATE"])
+    np.testing.assert_allclose(mean.to_numpy(), expected_mean.to_numpy())
+    np.testing.assert_allclose(cov.to_numpy(), expected_cov.to_numpy())
+
+
+def _staggered_frame(n_rows=500, seed=4):
+    # Tickers que empiezan en fechas distintas y uno con un hueco en medio de su historia
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2015-01-01", periods=n_rows)
+    prices = 100 * np.cumprod(1 + rng.normal(0.0005, 0.01, size=(n_rows, 5)), axis=0)
+    for col, start in enumerate([0, 0, 120, 300, 450]):
+        prices[:start, col] = np.nan
+    df = pd.DataFrame(prices, columns=["A", "B", "C", "D", "E"])
+    df.insert(0, "DATE", dates)
+    return df
+
+
+def _expected(df, assets):
+    returns = df.set_index("DATE")[assets].ffill().pct_change(fill_method=None).dropna()
+    return returns.mean().to_numpy() * 252, returns.cov().to_numpy() * 252
+
+
+def test_subset_is_sliced_from_universe_moments(monkeypatch):
+    df = _staggered_frame()
+    universe = compute_universe_stats(PriceStore.from_frame(df))
+    assert universe.moments is not None
+    # Las canastas se recortan de los momentos, sin volver a recorrer los retornos
+    monkeypatch.setattr(type(universe), "common_returns", lambda self, assets: pytest.fail("recalculó la canasta"))
+    for assets in (["A", "B"], ["A", "C"], ["B", "C", "D"], ["D", "E"], ["E"]):
+        mean, cov = universe.subset(assets)
+        expected_mean, expected_cov = _expected(df, assets)
+        np.testing.assert_allclose(mean.to_numpy(), expected_mean, rtol=1e-9)
+        np.testing.assert_allclose(cov.to_numpy(), expected_cov, rtol=1e-8)
+
+
+def test_subset_falls_back_for_tickers_with_gaps():
+    universe = compute_universe_stats(PriceStore.from_frame(_staggered_frame()))
+    returns = universe.returns.copy()
+    returns[200:210, 1] = np.nan
+    universe = UniverseStats(universe.tickers, returns, periods=252, moments=CommonMoments.from_returns(returns))
+
+    mean, cov = universe.subset(["A", "B"])
+    common = returns[~np.isnan(returns[:, :2]).any(axis=1)][:, :2]
+    np.testing.assert_allclose(mean.to_numpy(), common.mean(axis=0) * 252)
+    np.testing.assert_allclose(cov.to_numpy(), np.cov(common, rowvar=False) * 252)
+    # Los activos sin huecos se siguen recortando de los momentos
+    assert universe.moments.subset([0, 2]) is not None
+
+
+def test_extend_returns_new_stats_with_late_starters():
+    df = _staggered_frame()
+    head, tail = df.iloc[:400], df.iloc[400:]
+    universe = compute_universe_stats(PriceStore.from_frame(head))
+    before = universe.subset(["A", "D"])
+
+    store = PriceStore.from_frame(head)
+    first_row = store.append(tail)
+    extended = universe.extend(np.asarray(store.values[first_row:], dtype=np.float64))
+
+    # El objeto cacheado no cambia; el nuevo incluye el ticker que empezó en las filas agregadas
+    assert extended is not universe
+    pd.testing.assert_frame_equal(universe.subset(["A", "D"])[1], before[1])
+    with pytest.raises(ValueError):
+        universe.subset(["E"])
+    for assets in (["A", "D"], ["C", "E"], ["A", "B", "C", "D", "E"]):
+        mean, cov = extended.subset(assets)
+        expected_mean, expected_cov = _expected(df, assets)
+        np.testing.assert_allclose(mean.to_numpy(), expected_mean, rtol=1e-9)
+        np.testing.assert_allclose(cov.to_numpy(), expected_cov, rtol=1e-8)
+
+
+@pytest.mark.parametrize("covariance", ["ledoit_wolf", "ewma", "factor"])
+def test_estimated_stats_skip_universe_moments(prices_df, covariance, monkeypatch):
+    store = PriceStore.from_frame(prices_df)
+    cache = StatsCache()
+    monkeypatch.setattr(cache, "universe", lambda *args, **kwargs: pytest.fail("no debe armar el universo"))
+    mean, _ = cache.get(store, ["AAA", "LATE"], covariance=covariance, covariance_options={} if covariance != "factor"
+                        else {"n_factors": 1})
+
+    returns = prices_df.set_index("DATE")[["AAA", "LATE"]].pct_change().dropna()
+    np.testing.assert_allclose(mean.to_numpy(), returns.mean().to_numpy() * 252)
+
+
+def test_repeated_requests_are_served_from_the_cache(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    cache = StatsCache()
+    mean, cov = cache.get(store, ["AAA", "BBB"])
+    again = cache.get(store, ["AAA", "BBB"])
+    assert again[0] is mean and again[1] is cov
+    # Otra canasta se recorta del mismo universo: solo falla la búsqueda del subconjunto
+    cache.get(store, ["BBB", "CCC"])
+    assert cache.misses == 3 and cache.hits == 2
+    # Otra versión de los datos no reutiliza nada
+    changed = prices_df.copy()
+    changed.loc[10, "AAA"] *= 1.1
+    other = cache.get(PriceStore.from_frame(changed), ["AAA", "BBB"])
+    assert not np.allclose(other[1], cov)
+
+
+def test_cache_evicts_least_recently_used_entries_by_count_and_bytes(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    cache = StatsCache(max_entries=3)
+    cache.get(store, ["AAA", "BBB"])
+    cache.get(store, ["AAA", "CCC"])
+    cache.get(store, ["AAA", "BBB"])  # Se vuelve a usar: pasa al final
+    cache.get(store, ["BBB", "CCC"])
+    keys = [key[:3] for key in cache._entries]
+    assert len(cache) == 3 and ("subset", store.version, ("AAA", "CCC")) not in keys
+    assert ("subset", store.version, ("AAA", "BBB")) in keys
+
+    small = StatsCache(max_bytes=1)
+    small.get(store, ["AAA", "BBB"])
+    small.get(store, ["AAA", "CCC"])
+    # Siempre queda la última entrada aunque supere el límite de memoria
+    assert len(small) == 1 and small.nbytes == next(iter(small._entries.values()))[1]
+
+
+def test_cache_is_shared_safely_between_threads(prices_df):
+    store = PriceStore.from_frame(prices_df)
+    cache = StatsCache()
+    baskets = [["AAA", "BBB"], ["BBB", "CCC"], ["AAA", "LATE"], ["AAA", "BBB", "CCC"]] * 8
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda assets: cache.get(store, assets), baskets))
+
+    for assets, (mean, cov) in zip(baskets, results):
+        expected_mean, expected_cov = compute_universe_stats(store).subset(assets)
+        np.testing.assert_allclose(mean, expected_mean)
+        np.testing.assert_allclose(cov, expected_cov)
+    # Un universo y un subconjunto por canasta distinta, sin entradas duplicadas
+    assert len(cache) == 5 and cache.hits > 0
+    assert cache.nbytes == sum(nbytes for _, nbytes in cache._entries.values())